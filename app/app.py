@@ -7,7 +7,7 @@ import os
 import re
 import time
 import glob
-from datetime import datetime
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from werkzeug.exceptions import HTTPException
 
@@ -17,6 +17,11 @@ from werkzeug.exceptions import HTTPException
 import logging
 from pymongo import MongoClient
 import db
+import ingest_queue
+import response_cache
+import sample_encoding
+import downsample
+import json_provider
 import json
 from flask_caching import Cache
 import file_logger as file_logs
@@ -24,6 +29,8 @@ import file_logger as file_logs
 
 app = Flask(__name__, static_url_path='/static', static_folder='static', template_folder='templates')
 app.secret_key = 'super-secret'
+app.json = json_provider.OrjsonProvider(app)
+app.config["COMPRESS_MIMETYPES"] = ["text/html", "text/css", "text/xml", "application/json", "application/javascript", sample_encoding.MIMETYPE]
 Compress(app)
 
 # Credentials for accessing the config page
@@ -119,16 +126,7 @@ def redirect_request_to_dev(sender_id, data):
 
 @app.route("/")
 def list_stations():
-    stations_data = []
-    for station in db.get_stations():
-        station_name = station["name"]
-        stations_data.append({
-            'station': station,
-            'prefsData': db.get_most_recent_prefs(station_name),
-            'statusData': db.get_last_status(station_name),
-            'windData': db.get_last_wind(station_name),
-            'tempData': db.get_last_temp(station_name),
-        })
+    stations_data = db.get_station_list_data(db.get_stations())
 
     return render_template("station_list.html", data=stations_data)
 
@@ -142,15 +140,21 @@ def _cardinal_from_deg(deg):
     return cardinals[int((deg + 22.5) // 45) % 8]
 
 
-def _station_mock_view(station, idx):
+def _station_mock_view(station, idx, last_wind=None):
     station_name = station.get("name", f"station_{idx}")
     full_name = station.get("full_name", station_name)
 
-    seed = sum(ord(ch) for ch in station_name) + (idx + 1) * 17
-
-    avg = round(1.8 + (seed % 70) / 10.0, 1)
-    max_speed = round(avg + 0.8 + ((seed // 7) % 50) / 10.0, 1)
-    direction_deg = (seed * 13) % 360
+    # the latest wind of the station, or generated values for all of them when it has none
+    live = last_wind is not None and all(last_wind.get(k) is not None for k in ("avg", "max", "dir"))
+    if live:
+        avg = round(last_wind["avg"], 1)
+        max_speed = round(last_wind["max"], 1)
+        direction_deg = int(last_wind["dir"]) * 45 # dir is the sector 0..7
+    else:
+        seed = sum(ord(ch) for ch in station_name) + (idx + 1) * 17
+        avg = round(1.8 + (seed % 70) / 10.0, 1)
+        max_speed = round(avg + 0.8 + ((seed // 7) % 50) / 10.0, 1)
+        direction_deg = (seed * 13) % 360
 
     map_x = None
     map_y = None
@@ -173,10 +177,11 @@ def _station_mock_view(station, idx):
     return {
         "name": station_name,
         "full_name": full_name,
-        "mock_avg": avg,
-        "mock_max": max_speed,
-        "mock_direction_deg": direction_deg,
-        "mock_direction_cardinal": _cardinal_from_deg(direction_deg),
+        "live": live,
+        "avg": avg,
+        "max": max_speed,
+        "direction_deg": direction_deg,
+        "direction_cardinal": _cardinal_from_deg(direction_deg),
         "map_x": map_x,
         "map_y": map_y,
     }
@@ -186,7 +191,8 @@ def _station_mock_view(station, idx):
 def landing_mock():
     stations = db.get_stations()
     active_stations = [s for s in stations if s.get("active", True)]
-    station_views = [_station_mock_view(s, idx) for idx, s in enumerate(active_stations)]
+    last_winds = db.get_last_winds_for([s["name"] for s in active_stations])
+    station_views = [_station_mock_view(s, idx, last_winds.get(s["name"])) for idx, s in enumerate(active_stations)]
     return render_template("landing_mock2.html", stations=station_views)
 
 def get_prefs_for_response(station_name):
@@ -227,12 +233,14 @@ def save_data_sender_id(sender_id):
     response = f"saved: {len(data)}\n"
 
     station = db.get_or_create_station(sender_id)
-    logging.info(f"#{station['name']}: Got station: '{station}'")
+    logging.debug(f"#{station['name']}: Got station: '{station}'")
 
     file_logs.save_query_to_log(f"data_{station['name']}_{sender_id}", data)
 
+    received_at = datetime.now(ZoneInfo("Europe/Berlin"))
     try:
-        db.save_received_data(data, station, datetime.now(ZoneInfo("Europe/Berlin")))
+        if ingest_queue.INGEST_MODE != "queue" or not ingest_queue.enqueue(data, station, received_at):
+            db.save_received_data(data, station, received_at)
     except Exception as e:
         #logging.error(f"[ERROR] Failed to save received data: {e}", e)
         logging.exception(f"#{station['name']}: Failed to save received data")
@@ -247,62 +255,261 @@ def save_data_sender_id(sender_id):
 
 
 
+def _etag_matches(etag):
+    # Flask-Compress appends ":<encoding>" to the ETag of the compressed responses
+    return any(tag.split(":")[0] == etag for tag in request.if_none_match.as_set(include_weak=True))
+
+
+def cached_response(default_duration=None, step_seconds=60, variant=None):
+    """
+    Caches the response of a /<station_name>/data/ route until new data of the station is
+    saved (see response_cache). With default_duration the response also depends on the time
+    range ?duration=, it is recomputed when the start of the range moves into the next step.
+
+    The responses carry an ETag and Last-Modified made from the same version, the polling
+    dashboards get a 304 without the response being read or computed.
+
+    variant() names the representation picked from the Accept header, for routes that have more than one.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(station_name, **kwargs):
+            if not response_cache.CACHE_DIR or db.get_station_with_name(station_name) is None:
+                return fn(station_name, **kwargs)
+
+            representation = variant() if variant is not None else None
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), representation)
+            generation, ingested_at = response_cache.get_version(station_name)
+            duration_hours = None
+            window = 0
+            if default_duration is not None:
+                duration_hours = float(request.args.get("duration", default_duration))
+                window = response_cache.time_window(duration_hours, step_seconds)
+
+            etag = f"{generation}-{int(ingested_at or 0)}-{window}"
+            if representation is not None:
+                etag += f"-{representation}"
+            last_modified = None
+            if ingested_at is not None:
+                changed_at = ingested_at
+                if duration_hours is not None:
+                    changed_at = max(changed_at, response_cache.window_changed_at(window, duration_hours, step_seconds))
+                last_modified = datetime.fromtimestamp(int(changed_at), ZoneInfo("UTC"))
+
+            if request.if_none_match:
+                not_modified = _etag_matches(etag)
+            else:
+                not_modified = last_modified is not None and request.if_modified_since is not None and request.if_modified_since >= last_modified
+
+            if not_modified:
+                response = Response(status=304)
+            else:
+                cached = response_cache.get(station_name, key, generation, window)
+                if cached is not None:
+                    body, mimetype = cached
+                    response = Response(body, mimetype=mimetype)
+                else:
+                    response = app.make_response(fn(station_name, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    response_cache.set(station_name, key, generation, window, response.get_data(), response.mimetype)
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True # always revalidate with the ETag
+            if variant is not None:
+                response.vary.add("Accept")
+            return response
+        return wrapper
+    return decorator
+
+
 @app.route("/<station_name>/data/error_codes.json", methods=["GET"])
-#@cache.cached(query_string=True)
+@cached_response()
 def get_error_codes(station_name):
     return db.get_most_recent_error_codes(station_name)
 
 @app.route("/<station_name>/data/errors.json", methods=["GET"])
-#@cache.cached(query_string=True)
+@cached_response(default_duration="24")
 def get_error_values(station_name):
     duration_hours = float(request.args.get("duration", "24"))
     return db.get_errors(station_name, duration_hours=duration_hours)
 
 
+def _error_counts_args():
+    unit = request.args.get("group", "hour")
+    if unit not in db.ERROR_COUNT_UNITS:
+        abort(400, description=f"group must be one of {', '.join(db.ERROR_COUNT_UNITS)}, got '{unit}'.")
+    try:
+        codes = [int(code) for code in request.args.get("code", "").split(",") if code]
+    except ValueError:
+        abort(400, description="code must be a comma separated list of error codes.")
+    return {"duration_hours": float(request.args.get("duration", "168")), "unit": unit, "codes": codes}
+
+@app.route("/<station_name>/data/error_counts.json", methods=["GET"])
+@cached_response(default_duration="168")
+def error_counts(station_name):
+    """ Error counts of the station per code and ?group=hour|day, ?code=2,9 for only some codes """
+    return db.get_error_counts(station_name, **_error_counts_args())
+
+@app.route("/data/error_counts.json", methods=["GET"])
+def error_counts_all():
+    """ error_counts.json of all the stations together """
+    return db.get_error_counts(None, **_error_counts_args())
+
+def _max_points():
+    """ ?max_points= of the long time series, None when the whole series is wanted """
+    max_points = request.args.get("max_points")
+    if max_points is None:
+        return None
+    try:
+        max_points = int(max_points)
+    except ValueError:
+        abort(400, description=f"max_points must be a number, got '{max_points}'.")
+    if max_points < 3:
+        abort(400, description="max_points must be at least 3.")
+    return max_points
+
 @app.route("/<station_name>/data/status/<data_key>.json", methods=["GET"])
-#@cache.cached(query_string=True)
+@cached_response(default_duration="6")
 def get_status_values(station_name, data_key):
     duration_hours = float(request.args.get("duration", "6"))
-    return db.get_status_values(station_name, data_key, duration_hours=duration_hours)
+    values = db.get_status_values(station_name, data_key, duration_hours=duration_hours, max_points=_max_points())
+    if values is None:
+        abort(404, description=f"Status data with key: '{data_key}' doesnt exist.")
+    return values
 
 @app.route("/<station_name>/data/status.json", methods=["GET"])
+@cached_response()
 def status_shift(station_name):
+    """ The newest status, ?before=<cursor of a status> the one before it """
     shift = int(request.args.get("shift", "0"))
-    statuses = db.get_last_statuses(station_name, shift=shift)
+    statuses = db.get_last_statuses(station_name, shift=shift, before=_status_cursor_arg())
     return statuses[0] if len(statuses) > 0 else {}
 
 @app.route("/<station_name>/data/status_multi.json", methods=["GET"])
+@cached_response()
 def status_return_multi(station_name):
+    """ The ?n= newest statuses, the next page with ?before=<cursor of the last one> """
     shift = int(request.args.get("shift", "0"))
     n = int(request.args.get("n", "1"))
-    statuses = db.get_last_statuses(station_name, n=n, shift=shift)
+    statuses = db.get_last_statuses(station_name, n=n, shift=shift, before=_status_cursor_arg())
     return statuses if len(statuses) > 0 else []
+
+def _status_cursor_arg():
+    """ ?before= cursor of a status (its "cursor" key), None when not given """
+    value = request.args.get("before")
+    if value is None:
+        return None
+    try:
+        db.decode_status_cursor(value)
+    except ValueError:
+        abort(400, description=f"before must be the cursor of a status, got '{value}'.")
+    return value
  
+def _time_arg(name):
+    """ ISO date/time query parameter, without a timezone in Europe/Berlin. None when not given """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"{name} must be an ISO date or date and time, got '{value}'.")
+    return timestamp if timestamp.tzinfo is not None else timestamp.replace(tzinfo=ZoneInfo("Europe/Berlin"))
+
+@app.route("/<station_name>/data/status_export.ndjson", methods=["GET"])
+def status_export(station_name):
+    """
+    Streams the statuses between ?from= and ?to= as newline delimited JSON, oldest first.
+    ?fields=vbatIde,temp limits the keys of every line. Not cached or compressed, the lines
+    are sent while the cursor is read.
+    """
+    if db.get_station_with_name(station_name) is None:
+        abort(404, description=f"Cant find station with name '{station_name}'.")
+
+    start_time, end_time = _time_arg("from"), _time_arg("to")
+    fields = [f for f in request.args.get("fields", "").split(",") if f]
+    for field in fields:
+        if not db.STATUS_FIELD_NAME.match(field):
+            abort(400, description=f"Invalid field name '{field}'.")
+
+    def generate(batch_lines=500):
+        lines = []
+        for doc in db.iter_status_export(station_name, start_time, end_time, fields, batch_size=batch_lines):
+            lines.append(app.json.dumps(doc))
+            if len(lines) >= batch_lines:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    response = Response(generate(), mimetype="application/x-ndjson")
+    response.headers["Content-Disposition"] = f"attachment; filename={station_name}_statuses.ndjson"
+    return response
+
 @app.route("/<station_name>/data/wind.json", methods=["GET"])
-#@cache.cached(query_string=True)
+@cached_response(default_duration="6", step_seconds=15*60)
 def wind_data(station_name):
     duration_hours = float(request.args.get("duration", "6"))
-    return db.get_wind_data(station_name, duration_hours=duration_hours)
+    max_points = _max_points()
+    if request.args.get("format") == "columnar":
+        return db.get_wind_data_columnar(station_name, duration_hours=duration_hours, max_points=max_points)
+    return db.get_wind_data(station_name, duration_hours=duration_hours, max_points=max_points)
 
 @app.route("/<station_name>/data/temp.json", methods=["GET"])
-#@cache.cached(query_string=True)
+@cached_response(default_duration="6")
 def temperature_data(station_name):
     duration_hours = float(request.args.get("duration", "6"))    
-    return db.get_temp(station_name, duration_hours=duration_hours)
+    max_points = _max_points()
+    if request.args.get("format") == "columnar":
+        return db.get_temp_columnar(station_name, duration_hours=duration_hours, max_points=max_points)
+    return db.get_temp(station_name, duration_hours=duration_hours, max_points=max_points)
+
+def _wind_all_representation():
+    """ "bin" for ?fmt=bin or when the Accept header prefers the binary samples, "json" otherwise """
+    fmt = request.args.get("fmt")
+    if fmt is not None:
+        return "bin" if fmt == "bin" else "json"
+
+    best = request.accept_mimetypes.best_match(["application/json", sample_encoding.MIMETYPE])
+    return "bin" if best == sample_encoding.MIMETYPE else "json"
 
 @app.route("/<station_name>/data/wind_all.json", methods=["GET"])
-#@cache.cached(query_string=True)
+@cached_response(default_duration="2", variant=_wind_all_representation)
 def wind_data_all(station_name):
     duration_hours = float(request.args.get("duration", "2"))
+    # max_points applies to the winds and to the dirs separately
+    max_points = _max_points()
+    if _wind_all_representation() == "bin":
+        end_time = datetime.now(ZoneInfo("Europe/Berlin"))
+        start_time = end_time - timedelta(hours=duration_hours)
+        wind_ts, winds = db.find_raw_arrays("winds", station_name, start_time, end_time)
+        dir_ts, dirs = db.find_raw_arrays("dirs", station_name, start_time, end_time)
+        if max_points is not None:
+            keep = downsample.min_max_indices(winds, max_points)
+            wind_ts, winds = wind_ts[keep], winds[keep]
+            keep = downsample.stride_indices(len(dirs), max_points)
+            dir_ts, dirs = dir_ts[keep], dirs[keep]
+        speeds = winds * db.get_station_speed_to_rpm(station_name)
+        return Response(sample_encoding.encode_wind_samples(wind_ts, speeds, dir_ts, dirs), mimetype=sample_encoding.MIMETYPE)
+
+    if request.args.get("format") == "columnar":
+        return {
+            "winds": db.get_wind_all_columnar(station_name, duration_hours=duration_hours, max_points=max_points),
+            "dirs": db.get_directions_all_columnar(station_name, duration_hours=duration_hours, max_points=max_points),
+        }
+
     data = {
-        "winds": db.get_wind_all(station_name, duration_hours=duration_hours),
-        "dirs": db.get_directions_all(station_name, duration_hours=duration_hours),
+        "winds": db.get_wind_all(station_name, duration_hours=duration_hours, max_points=max_points),
+        "dirs": db.get_directions_all(station_name, duration_hours=duration_hours, max_points=max_points),
     }
 
     return data
 
 @app.route("/<station_name>/data/prefs.json", methods=["GET"])
-#@cache.cached(query_string=True)
+@cached_response()
 def device_preferences(station_name):
     count = int(request.args.get("count", "10"))
     return db.get_most_recent_n_prefs(station_name, count=count)
@@ -372,6 +579,24 @@ def set_prefs(station_name):
 
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """ Ingest queue metrics in the Prometheus text format """
+    stats = ingest_queue.get_stats()
+    lines = [
+        "# HELP ingest_queue_jobs Number of uploads in the ingest queue by status",
+        "# TYPE ingest_queue_jobs gauge",
+    ]
+    for status in ("pending", "processing", "failed"):
+        lines.append(f'ingest_queue_jobs{{status="{status}"}} {stats[status]}')
+    lines += [
+        "# HELP ingest_queue_lag_seconds Age of the oldest pending upload",
+        "# TYPE ingest_queue_lag_seconds gauge",
+        f"ingest_queue_lag_seconds {stats['lag_seconds']:.3f}",
+    ]
+    return Response("\n".join(lines) + "\n", mimetype="text/plain")
+
+
 @app.route("/log", methods=["GET"])
 def get_log_list():
     """
@@ -0,0 +1,426 @@
+"""
+Bucket aggregation of the wind and direction samples.
+
+bucket_aggregate is the reference implementation working on point dicts,
+bucket_aggregate_np does the same on NumPy arrays for all buckets at once.
+
+For the incremental 15 minute aggregation every bucket keeps a small running
+state next to its aggregated values, so new samples can be folded into it
+without re-reading the raw samples of the whole bucket (or lookback window).
+
+wind state: {"n": count, "sum": sum of values, "top": largest values, descending}
+dir state:  {"n": count, "hist": count per sector, "first": oldest sample ms per sector}
+
+The hourly rollup tier merges the states of its 15 minute buckets and the daily one the
+states of its hours (merge_wind_states, merge_dir_states). The hours keep the top values
+of all their 15 minute buckets, so avg and the direction mode are exact and max_10 is
+exact as long as no 15 minute bucket has more than MAX_10_TOP_SIZE samples in the top
+10% of the hour or day. The old buckets saved without a state (their raw
+samples are archived) are rolled up from their values instead (merge_bucket_values).
+"""
+import logging
+from datetime import datetime, time, timedelta
+from math import floor, nan, ceil
+from typing import List, Dict, Any, Iterable, Tuple, Callable
+from zoneinfo import ZoneInfo
+import numpy as np
+
+TZ = ZoneInfo("Europe/Berlin")
+
+BUCKET_MINUTES = 15
+DIR_SECTORS = 8
+
+# max_10 needs the top 10% of the bucket values. Keeping 64 of them is exact for
+# buckets of up to 640 samples (the stations log one sample every ~5 s, ~180 per bucket)
+MAX_10_TOP_SIZE = 64
+
+# rollup tiers built from the 15 minute buckets: (name, bucket minutes), finest first
+ROLLUP_TIERS = [("1h", 60), ("1d", 24 * 60)]
+DAY_MINUTES = 24 * 60
+
+
+def bucket_key_ms(x_ms: int, minutes: int = BUCKET_MINUTES) -> int:
+    """
+    Key of the bucket the sample at x_ms falls into. Buckets are centered on the key,
+    the same as the keys produced by bucket_aggregate.
+    """
+    W = minutes * 60_000
+    return (x_ms + W // 2) // W * W
+
+
+def bucket_range_ms(key_ms: int, minutes: int = BUCKET_MINUTES) -> Tuple[int, int]:
+    """ [start, end) of the samples belonging to the bucket with key_ms """
+    W = minutes * 60_000
+    return key_ms - W // 2, key_ms + W - W // 2
+
+
+def tier_key_ms(key_ms: int, minutes: int) -> int:
+    """
+    Key of the rollup bucket the 15 minute bucket with key_ms belongs to. Hours are centered on
+    the key like the 15 minute buckets, days are the local calendar days keyed by their noon.
+    """
+    if minutes < DAY_MINUTES:
+        return bucket_key_ms(key_ms, minutes)
+
+    day = datetime.fromtimestamp(key_ms / 1000, TZ).date()
+    return int(datetime.combine(day, time(12), tzinfo=TZ).timestamp() * 1000)
+
+
+def tier_range_ms(key_ms: int, minutes: int) -> Tuple[int, int]:
+    """ [start, end) of the keys of the 15 minute buckets that belong to the rollup bucket key_ms """
+    if minutes < DAY_MINUTES:
+        return bucket_range_ms(key_ms, minutes)
+
+    day = datetime.fromtimestamp(key_ms / 1000, TZ).date()
+    start = datetime.combine(day, time(0), tzinfo=TZ)
+    end = datetime.combine(day + timedelta(days=1), time(0), tzinfo=TZ)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def dir_sector(value) -> int:
+    return int((value + 22.5) // 45 % DIR_SECTORS)
+
+
+def group_by_bucket(points: Iterable[Tuple[int, Any]], minutes: int = BUCKET_MINUTES) -> Dict[int, List[Tuple[int, Any]]]:
+    """ Groups (x_ms, y) points by their bucket key """
+    groups: Dict[int, List[Tuple[int, Any]]] = {}
+    for x, y in points:
+        groups.setdefault(bucket_key_ms(x, minutes), []).append((x, y))
+    return groups
+
+
+def group_by_bucket_np(xs: np.ndarray, ys: np.ndarray, minutes: int = BUCKET_MINUTES) -> Dict[int, List[Tuple[int, Any]]]:
+    """ group_by_bucket for x_ms / y arrays, the points keep their order inside a bucket """
+    if len(xs) == 0:
+        return {}
+
+    W = minutes * 60 * 1000
+    keys = (xs + W // 2) // W * W
+    order = np.argsort(keys, kind="stable")
+    keys, xs, ys = keys[order].tolist(), xs[order].tolist(), ys[order].tolist()
+
+    groups: Dict[int, List[Tuple[int, Any]]] = {}
+    for key, x, y in zip(keys, xs, ys):
+        groups.setdefault(key, []).append((x, y))
+    return groups
+
+
+def new_wind_state() -> Dict[str, Any]:
+    return {"n": 0, "sum": 0, "top": []}
+
+
+def new_dir_state() -> Dict[str, Any]:
+    return {"n": 0, "hist": [0] * DIR_SECTORS, "first": [None] * DIR_SECTORS}
+
+
+def fold_wind_state(state: Dict[str, Any], values: Iterable[float]) -> Dict[str, Any]:
+    values = list(values)
+    state["n"] += len(values)
+    state["sum"] += sum(values)
+    state["top"] = sorted(state["top"] + values, reverse=True)[:MAX_10_TOP_SIZE]
+    return state
+
+
+def fold_dir_state(state: Dict[str, Any], points: Iterable[Tuple[int, int]]) -> Dict[str, Any]:
+    """ Folds (x_ms, sector) points into the direction histogram """
+    hist = state["hist"]
+    first = state["first"]
+    for x, sector in points:
+        state["n"] += 1
+        hist[sector] += 1
+        if first[sector] is None or x < first[sector]:
+            first[sector] = x
+    return state
+
+
+def merge_wind_states(states: Iterable[Dict[str, Any]], keep_all_top: bool = False) -> Dict[str, Any]:
+    """
+    State of the samples of all the states, keeps as many top values as max_10 of the merged
+    state needs, or with keep_all_top the top values of all the states (for the states that
+    are merged again)
+    """
+    merged = new_wind_state()
+    for state in states:
+        merged["n"] += state["n"]
+        merged["sum"] += state["sum"]
+        merged["top"].extend(state["top"])
+
+    merged["top"] = sorted(merged["top"], reverse=True)
+    if not keep_all_top:
+        merged["top"] = merged["top"][:max(MAX_10_TOP_SIZE, int(ceil(merged["n"] * 0.10)))]
+    return merged
+
+
+def merge_dir_states(states: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = new_dir_state()
+    for state in states:
+        merged["n"] += state["n"]
+        for sector in range(DIR_SECTORS):
+            merged["hist"][sector] += state["hist"][sector]
+            first = state["first"][sector]
+            if first is not None and (merged["first"][sector] is None or first < merged["first"][sector]):
+                merged["first"][sector] = first
+    return merged
+
+
+def merge_bucket_values(buckets: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, float], int]:
+    """
+    avg / max and the direction of a rollup bucket from the values of its 15 minute buckets, for
+    the buckets saved without a state whose raw samples are already archived: {"weight", "avg",
+    "max", "dir"} each, any of them can be None. avg is the mean weighted by the sample count,
+    max the highest max and the direction the sector with the largest weight (the newest on a tie).
+    Returns (wind or None, dir or None).
+    """
+    buckets = list(buckets)
+    winds = [b for b in buckets if b["avg"] is not None]
+    wind = None
+    if winds:
+        weight = sum(b["weight"] for b in winds)
+        maxes = [b["max"] for b in winds if b["max"] is not None]
+        wind = {
+            "avg": round(sum(b["avg"] * b["weight"] for b in winds) / weight, 2),
+            "max": round(max(maxes), 2) if maxes else round(max(b["avg"] for b in winds), 2),
+        }
+
+    weights = {}
+    newest = {}
+    for i, b in enumerate(buckets):
+        if b["dir"] is not None:
+            weights[b["dir"]] = weights.get(b["dir"], 0) + b["weight"]
+            newest[b["dir"]] = i
+    direction = max(weights, key=lambda d: (weights[d], newest[d])) if weights else None
+    return wind, direction
+
+
+def wind_state_values(state: Dict[str, Any]) -> Dict[str, float]:
+    """ avg and max (mean of the top 10%) of the bucket, rounded like bucket_aggregate """
+    n = state["n"]
+    take = max(1, int(ceil(n * 0.10)))
+    top = state["top"][:take]
+    return {
+        "avg": round(state["sum"] / n, 2),
+        "max": round(sum(top) / len(top), 2),
+    }
+
+
+def dir_state_mode(state: Dict[str, Any]) -> int:
+    """
+    Most common sector of the bucket. bucket_aggregate walks the samples newest first and
+    the first sector to reach the highest count wins, on a tie that is the sector whose
+    oldest sample is the newest one.
+    """
+    best = None
+    for sector in range(DIR_SECTORS):
+        count = state["hist"][sector]
+        if count == 0:
+            continue
+        if best is None or (count, state["first"][sector]) > (state["hist"][best], state["first"][best]):
+            best = sector
+    return best
+
+
+def bucket_aggregate(points: List[Dict[str, Any]], minutes: int = 15, modes: List[str] = []) -> List[Dict[str, float]]:
+    """
+    Bucket time-series points into fixed windows and aggregate their y-values.
+    """
+    if not points:
+        return None, None
+
+    W = minutes * 60_000  # window size in ms
+
+    def start_of_day_ms(t_ms: int) -> int:
+        # local time (to mirror JavaScript Date behavior)
+        dt = datetime.fromtimestamp(t_ms / 1000.0).replace(hour=0, minute=0, second=0, microsecond=0)
+        # shift to the middle of the bucket
+        shift = timedelta(minutes=minutes / 2.0)
+        return int((dt + shift).timestamp() * 1000)
+
+    day0 = start_of_day_ms(points[0]["x"])
+    buckets: Dict[int, Dict[str, Any]] = {}
+
+    bucket_index = 0
+    for p in points:
+        x = p["x"]; y = p["y"]
+        k = day0 + floor((x - day0) / W) * W + W // 2
+        if bucket_index != k:
+            bucket_index = k
+
+        b = buckets.get(k)
+        if b is None:
+            # store whole point for first/last/min/max semantics
+            b = {"ys": [], "xs": [], "min": p, "max": p}
+            buckets[k] = b
+        b["ys"].append(y)
+        b["xs"].append(x)
+        if y < b["min"]["y"]:   b["min"]   = p
+        if y > b["max"]["y"]:   b["max"]   = p
+
+    def median(arr: List[float]) -> float:
+        n = len(arr)
+        if n == 0: return nan
+        s = sorted(arr)
+        m = n // 2
+        return s[m] if n % 2 else (s[m - 1] + s[m]) / 2.0
+
+    def mode_value(arr: List[float]) -> float:
+        # match JS behavior: first value to reach the highest count wins
+        if not arr: return nan
+        counts: Dict[float, int] = {}
+        best_val = arr[0]
+        best_cnt = 0
+        for v in arr:
+            counts[v] = counts.get(v, 0) + 1
+            c = counts[v]
+            if c > best_cnt:
+                best_cnt = c
+                best_val = v
+        return best_val
+
+    def max_10_mean(arr: List[float]) -> float:
+        """
+        Average of the maximum 10% values in arr.
+        Uses at least 1 value to avoid empty slices.
+        """
+        n = len(arr)
+        if n == 0:
+            return nan
+        take = max(1, int(ceil(n * 0.10)))
+        top = sorted(arr, reverse=True)[:take]
+        return sum(top) / len(top)
+
+    out: List[Dict[str, float]] = []
+
+    last_bucket_filed_x = 0
+    for k in sorted(buckets.keys()):
+        b = buckets[k]
+        ys = b["ys"]
+        last_bucket_filed_x = min(b["xs"])
+
+        timestamp = datetime.fromtimestamp(float(k) / 1000, tz=TZ)
+        out_data = {"timestamp": timestamp}
+
+        for mode in modes:
+            out_value = -123
+            if mode == "min":
+                out_value = b["min"]["y"]
+
+            elif mode == "max":
+                out_value = max_10_mean(ys) #b["max"]["y"]
+
+            elif mode == "median":
+                out_value = median(ys)
+
+            elif mode == "mode":
+                out_value = mode_value(ys)
+
+            elif mode == "max_10":
+                out_value = max_10_mean(ys)
+
+            elif mode == "mean" or mode == "avg":
+                out_value = sum(ys) / len(ys)
+
+            else:
+                logging.critical(f"Non existing mode: {mode} for modes:{modes}")
+
+            out_data[mode] = round(out_value, 2)
+
+        out.append(out_data)
+
+    # last_bucket_filed_x is the most largest key that was in a bucket that wasnt fully filled
+    return out, last_bucket_filed_x
+
+
+def _group_buckets(xs: np.ndarray, ys: np.ndarray, minutes: int) -> Dict[str, np.ndarray]:
+    """
+    Sorts the samples by bucket and value. lexsort is stable, so equal values in a
+    bucket keep their input order.
+    """
+    W = minutes * 60_000
+    keys = (xs + W // 2) // W * W
+    order = np.lexsort((ys, keys))
+    bucket_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    return {
+        "keys": bucket_keys,
+        "starts": starts,
+        "counts": counts,
+        "bucket": np.repeat(np.arange(len(bucket_keys)), counts),
+        "values": ys[order],
+        "positions": order,
+        "xs": xs[order],
+    }
+
+def _reduce_avg(g):
+    return np.bincount(g["bucket"], weights=g["values"]) / g["counts"]
+
+def _reduce_min(g):
+    return g["values"][g["starts"]]
+
+def _reduce_max_10(g):
+    take = np.maximum(1, np.ceil(g["counts"] * 0.10).astype(np.int64))
+    ends = g["starts"] + g["counts"]
+    csum = np.concatenate(([0.0], np.cumsum(g["values"], dtype=np.float64)))
+    return (csum[ends] - csum[ends - take]) / take
+
+def _reduce_median(g):
+    lo = g["values"][g["starts"] + (g["counts"] - 1) // 2]
+    hi = g["values"][g["starts"] + g["counts"] // 2]
+    return np.where(g["counts"] % 2 == 1, hi, (lo + hi) / 2.0)
+
+def _reduce_mode(g):
+    values, bucket = g["values"], g["bucket"]
+
+    # runs of the same value inside a bucket
+    run_start = np.flatnonzero(np.r_[True, (np.diff(values) != 0) | (np.diff(bucket) != 0)])
+    run_count = np.diff(np.r_[run_start, len(values)])
+    run_last = np.maximum.reduceat(g["positions"], run_start)
+    run_bucket = bucket[run_start]
+
+    # first value to reach the highest count wins: the most samples, then the earliest last sample
+    best = np.lexsort((run_last, -run_count, run_bucket))
+    first_in_bucket = np.r_[True, np.diff(run_bucket[best]) != 0]
+    return values[run_start[best[first_in_bucket]]]
+
+# mode name -> reducer returning one value per bucket
+REDUCERS: Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]] = {
+    "min": _reduce_min,
+    "max": _reduce_max_10,
+    "max_10": _reduce_max_10,
+    "median": _reduce_median,
+    "mode": _reduce_mode,
+    "mean": _reduce_avg,
+    "avg": _reduce_avg,
+}
+
+def bucket_aggregate_np(xs, ys, minutes: int = 15, modes: List[str] = []):
+    """
+    Vectorized bucket_aggregate. xs are epoch ms and ys the values of the points, in the
+    same order as they would be passed to bucket_aggregate. Returns the same buckets and
+    last_bucket_filed_x.
+    """
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys)
+    if len(xs) == 0:
+        return None, None
+
+    g = _group_buckets(xs, ys, minutes)
+
+    columns = {}
+    for mode in modes:
+        reducer = REDUCERS.get(mode)
+        if reducer is None:
+            logging.critical(f"Non existing mode: {mode} for modes:{modes}")
+            columns[mode] = [-123] * len(g["keys"])
+        else:
+            columns[mode] = reducer(g).tolist()
+
+    out: List[Dict[str, float]] = []
+    for i, k in enumerate(g["keys"].tolist()):
+        out_data = {"timestamp": datetime.fromtimestamp(float(k) / 1000, tz=TZ)}
+        for mode in modes:
+            out_data[mode] = round(columns[mode][i], 2)
+        out.append(out_data)
+
+    # earliest sample of the newest bucket, same as bucket_aggregate
+    last_bucket_filed_x = int(g["xs"][g["starts"][-1]:].min())
+    return out, last_bucket_filed_x
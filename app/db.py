@@ -1,6 +1,7 @@
 import re
 from datetime import datetime, time, timedelta
 import json
+import base64
 from pymongo import MongoClient, ReturnDocument
 import os
 import sys
@@ -10,7 +11,18 @@ import pprint
 from math import floor, nan, ceil
 from typing import List, Dict, Any
 import numpy as np
-from pymongo import UpdateOne
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from bson import ObjectId
+from bson.errors import InvalidId
+import bucketing
+from station_registry import StationRegistry
+import payload_parser
+import status_schema
+import vbat_rate
+import downsample
+import response_cache
+from bucketing import bucket_aggregate
 
 TZ = ZoneInfo("Europe/Berlin")
 UTC = ZoneInfo("UTC")
@@ -28,6 +40,36 @@ if DB_CLIENT_NAME is None:
 
 logging.info(f"Using MongoDB URI: {DB_URL}")
 
+# How the raw wind / direction samples are saved:
+#   "documents": one document per sample in winds and dirs
+#   "columnar":  one document per upload in wind_uploads, with the samples packed in arrays
+RAW_STORAGE = os.environ.get("RAW_STORAGE", "documents")
+
+# "timeseries" creates the append only measurement collections as MongoDB time-series collections,
+# existing plain collections are converted with: python migrate.py timeseries --apply
+# (with flask-app and flask-app-worker stopped, see migrate_to_timeseries)
+COLLECTION_BACKEND = os.environ.get("COLLECTION_BACKEND", "plain")
+
+# collection -> time-series granularity. wind_bucketed stays a plain collection, the buckets
+# are upserted and need the unique (station_name, timestamp) index
+TIMESERIES_COLLECTIONS = {
+    "winds": "seconds",
+    "dirs": "seconds",
+    "wind_uploads": "minutes",
+    "statuses": "minutes",
+}
+
+# wind_bucketed and the rollup tiers built from it: (collection, bucket minutes), finest first
+WIND_TIERS = [("wind_bucketed", bucketing.BUCKET_MINUTES)] + [(f"wind_bucketed_{name}", minutes) for name, minutes in bucketing.ROLLUP_TIERS]
+
+# get_wind_data reads the coarsest tier that still has this many buckets in the requested duration
+WIND_TIER_MIN_POINTS = int(os.environ.get("WIND_TIER_MIN_POINTS", "48"))
+
+# upload_ids of the last uploads folded into a 15 minute bucket, see update_average_values
+BUCKET_UPLOAD_IDS = 16
+# times update_average_values merges a bucket again when another upload changed it meanwhile
+BUCKET_WRITE_ATTEMPTS = 5
+
 client = MongoClient(DB_URL)
 #logging.info(f"MongoDB version: {client.server_info()['version']}")
 
@@ -36,27 +78,86 @@ logging.info("connected to MongoDB")
 db = client[DB_CLIENT_NAME]
 
 
+def is_timeseries_collection(name):
+    info = next(db.list_collections(filter={"name": name}), None)
+    return info is not None and info.get("type") == "timeseries"
+
+def create_timeseries_collection(name):
+    db.create_collection(name, timeseries={
+        "timeField": "timestamp",
+        "metaField": "station_name",
+        "granularity": TIMESERIES_COLLECTIONS[name],
+    })
+
+def create_timeseries_collections():
+    existing = set(db.list_collection_names())
+    for name in TIMESERIES_COLLECTIONS:
+        if name not in existing:
+            logging.info(f"Creating time-series collection: {name}")
+            create_timeseries_collection(name)
+
 # Create indexes for all the collections 
 def ensure_indexes():
+    if COLLECTION_BACKEND == "timeseries":
+        create_timeseries_collections()
+
     db.dirs.create_index([("station_name", 1),("timestamp", -1)])
     db.winds.create_index([("station_name", 1),("timestamp", -1)])
+    # the raw documents of an upload saved from the ingest queue, see insert_upload_docs
+    for name in ("winds", "dirs", "wind_uploads"):
+        db[name].create_index([("upload_id", 1)], sparse=True)
+    db.wind_uploads.create_index([("station_name", 1),("timestamp_last", -1)])
 
     db.dir_bucketed.create_index([("station_name", 1),("timestamp", -1)])
-    db.wind_bucketed.create_index([("station_name", 1),("timestamp", -1)])
+
+    # buckets are upserted by (station_name, timestamp), see write_buckets
+    try:
+        db.wind_bucketed.create_index([("station_name", 1),("timestamp", -1)], unique=True)
+    except OperationFailure:
+        logging.error("Unable to create the unique wind_bucketed index. Run: python migrate.py dedup-buckets --apply")
+    for name, _ in WIND_TIERS[1:]:
+        db[name].create_index([("station_name", 1),("timestamp", -1)], unique=True)
 
     db.statuses.create_index([("station_name", 1),("timestamp", -1)])
+    # the keyset of the status pages, see get_last_statuses
+    try:
+        db.statuses.create_index([("station_name", 1),("timestamp", -1),("_id", -1)])
+    except OperationFailure as e:
+        logging.warning(f"Unable to create the statuses (timestamp, _id) index: {e}")
 
     db.prefs.create_index([("station_name", 1),("timestamp", -1)])
     db.errors.create_index([("station_name", 1),("timestamp", -1)])
 
+    # one document per error code of an upload, see save_error_events
+    db.error_events.create_index([("station_name", 1),("timestamp", -1),("code", 1)], unique=True)
+    db.error_events.create_index([("code", 1),("timestamp", -1)])
+
+    # see ingest_queue.claim
+    db.ingest_queue.create_index([("partition", 1),("status", 1),("received_at", 1)])
+    db.ingest_queue.create_index([("status", 1),("received_at", 1)])
+
 ensure_indexes()
 
 
+# stations are cached in every worker, edits made outside the app are picked up after the TTL
+stations_registry = StationRegistry(
+    lambda: db.stations.find({}, {"_id": 0}),
+    ttl_seconds=float(os.environ.get("STATION_REGISTRY_TTL", "60")),
+)
+
+def invalidate_stations():
+    stations_registry.invalidate()
+
+
 def get_or_create_station(sender_id_imsi):
     if not sender_id_imsi:
         logging.warning("No IMSI to save")
         return None
 
+    station = stations_registry.get_by_imsi(sender_id_imsi)
+    if station is not None:
+        return station
+
     station_defaults = {
         "imsi": sender_id_imsi,
         "name": f"unnamed_{sender_id_imsi}", 
@@ -71,23 +172,32 @@ def get_or_create_station(sender_id_imsi):
         return_document=ReturnDocument.AFTER,
         projection={"_id": 0},
     )
+    stations_registry.put(station)
 
-    return station
+    return dict(station)
 
 def get_stations():
-    return list(db.stations.find({},{"_id": 0}))
+    return stations_registry.all()
 
 def get_station_with_imsi(imsi: str):
     if not imsi:
         return None
 
-    return db.stations.find_one({"imsi": imsi}, {"_id": 0})
+    return stations_registry.get_by_imsi(imsi)
 
 def get_station_with_name(station_name: str):
     if not station_name:
         return None
 
-    return db.stations.find_one({"name": station_name}, {"_id": 0})
+    station = stations_registry.get_by_name(station_name)
+    if station is None:
+        # might be added by another worker since the registry was loaded
+        station = db.stations.find_one({"name": station_name}, {"_id": 0})
+        if station is not None:
+            stations_registry.put(station)
+            station = dict(station)
+
+    return station
 
 def add_station(station: dict):
     if "imsi" not in station:
@@ -96,11 +206,15 @@ def add_station(station: dict):
     if "name" not in station:
         raise ValueError("Device must contain name")
 
-    return db.stations.update_one(
+    result = db.stations.update_one(
         {"name": station["name"]},   # match existing device
         {"$set": station},           # update all fields
         upsert=True                 # insert if not found
     )
+    invalidate_stations()
+    response_cache.bump_generation(station["name"]) # rpm_to_ms / dir_adjustment change the responses
+
+    return result
 
 def get_station_speed_to_rpm(station_name):
     station = get_station_with_name(station_name)
@@ -191,6 +305,7 @@ def save_error_codes(station_name, data, timestamp):
         "error_codes_raw": data,
         "error_codes": error_codes,
     })
+    response_cache.bump_generation(station_name)
 
 
 def get_most_recent_error_codes(station_name, count=1):
@@ -205,9 +320,6 @@ def get_most_recent_n_error_codes(station_name, count=1):
         "timestamp", -1
     ).limit(count))
 
-    for e in error_codes:
-        e['timestamp'] = e['timestamp'].astimezone(TZ).isoformat()
-
     return error_codes
 
 def parse_raw_prefs_data(station_name, data):
@@ -224,6 +336,9 @@ def save_prefs(station_name, data, timestamp):
         "prefs": prefs,
     })
 
+    set_station_latest(station_name, "prefs", {"station_name": station_name, "timestamp": timestamp, "prefs": prefs})
+    response_cache.bump_generation(station_name)
+
 
 def get_most_recent_prefs(station_name):
     most_recent_prefs = get_most_recent_n_prefs(station_name, count=1)
@@ -239,10 +354,11 @@ def get_most_recent_n_prefs(station_name, count=10):
         "timestamp", -1
     ).limit(count))
 
-    for p in prefs:
-        p['timestamp'] = p['timestamp'].astimezone(TZ).isoformat()
-        del p['prefs_raw']
+    return [_prefs_result(p) for p in prefs]
 
+def _prefs_result(prefs):
+    prefs = dict(prefs)
+    prefs.pop('prefs_raw', None)
     return prefs
 
 def get_prefs_to_send(station_name):
@@ -304,100 +420,217 @@ def get_latest_error_codes(station_name):
 
 
 def get_errors(station_name, duration_hours=12):
+    """ The uploads with errors, oldest first: {"timestamp", "dur_minutes" since the previous upload, "parsed_errors"} """
     start_time = datetime.now(TZ) - timedelta(hours=duration_hours)
-    stats = list(db.statuses.find(
-        {
-            "timestamp": {"$gte": start_time},
-            "station_name": {"$eq": station_name},
-        }, 
-        { "_id":0, "timestamp":1, "errors":1 }
-        ).sort("timestamp", 1))
-    
-    errors = []
-    prev_timestamps = None
-    for stat in stats:
-        if prev_timestamps is not None:
-            dur_minutes = (stat["timestamp"]-prev_timestamps).total_seconds() / 60
+    query = {"timestamp": {"$gte": start_time}, "station_name": {"$eq": station_name}}
+    cursor = db.error_events.find(
+        query,
+        {"_id": 0, "timestamp": 1, "code": 1, "count": 1, "gap_minutes": 1}
+    ).sort([("timestamp", 1), ("_id", 1)])
 
-            if "errors" in stat and stat["errors"] != "":
-                errors.append({
-                    "dur_minutes": round(dur_minutes, 2),
-                    "parsed_errors": parse_errors_str(stat["errors"]),
-                    "timestamp": stat["timestamp"],
-                })
+    # the first upload of the window has no previous upload in it and isn't listed, as before the error_events
+    first = db.statuses.find_one(query, {"_id": 0, "timestamp": 1}, sort=[("timestamp", 1)])
 
-        prev_timestamps = stat["timestamp"]
+    errors = []
+    for event in cursor:
+        if first is not None and event["timestamp"] == first["timestamp"]:
+            continue
+        if not errors or errors[-1]["timestamp"] != event["timestamp"]:
+            errors.append({
+                "dur_minutes": event.get("gap_minutes"),
+                "parsed_errors": [],
+                "timestamp": event["timestamp"],
+            })
+        # the names of parse_errors_str, error_events names the codes of the v2 firmware with its own map
+        errors[-1]["parsed_errors"].append({"code": event["code"], "count": event["count"], "name": ERROR_CODE_MAP_V4.get(event["code"], "UNKNOWN")})
 
     return errors
 
-base_timestamp = None
+ERROR_COUNT_UNITS = ("hour", "day")
 
-def save_wind_data(station_name, winds_data):
-    if not winds_data:
-        logging.info(f"#{station_name}: No wind data to save")
-        return
+def get_error_counts(station_name=None, duration_hours=7 * 24, unit="hour", codes=None):
+    """
+    Sum of the error counts per code and hour or day (Europe/Berlin), of one station or of all
+    of them when station_name is None. Every item also has how many uploads and stations reported the code.
+    """
+    match = {"timestamp": {"$gte": datetime.now(TZ) - timedelta(hours=duration_hours)}}
+    if station_name is not None:
+        match["station_name"] = {"$eq": station_name}
+    if codes:
+        match["code"] = {"$in": list(codes)}
+
+    return list(db.error_events.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "code": "$code",
+                "timestamp": {"$dateTrunc": {"date": "$timestamp", "unit": unit, "timezone": "Europe/Berlin"}},
+            },
+            "name": {"$first": "$name"},
+            "count": {"$sum": "$count"},
+            "uploads": {"$sum": 1},
+            "stations": {"$addToSet": "$station_name"},
+        }},
+        {"$sort": {"_id.timestamp": 1, "_id.code": 1}},
+        {"$project": {
+            "_id": 0,
+            "timestamp": "$_id.timestamp",
+            "code": "$_id.code",
+            "name": 1,
+            "count": 1,
+            "uploads": 1,
+            "stations": {"$size": "$stations"},
+        }},
+    ]))
+
+def error_event_docs(station_name, status, previous_timestamp):
+    """ The error_events documents of one status, previous_timestamp is the time of the upload before it (or None) """
+    errors = parse_errors_str(status.get("errors") or "")
+    if not errors:
+        return []
 
-    if len(winds_data["winds"]) > 0:
-        db.winds.insert_many(winds_data["winds"])
-        create_average_wind_values(station_name)
+    gap_minutes = None
+    if previous_timestamp is not None:
+        gap_minutes = round((_timestamp_ms(status["timestamp"]) - _timestamp_ms(previous_timestamp)) / 60000, 2)
 
-    if len(winds_data["dirs"]) > 0:
-        db.dirs.insert_many(winds_data["dirs"]) 
-        create_average_dir_values(station_name)
+    # one event per code, a code listed twice in the errors string is counted once with both counts
+    counts = {}
+    for error in errors:
+        counts[error["code"]] = counts.get(error["code"], 0) + error["count"]
 
+    names = ERROR_CODE_MAP_V2 if str(status.get("ver", "")).startswith("v2") else ERROR_CODE_MAP_V4
+    return [
+        {
+            "station_name": station_name,
+            "timestamp": status["timestamp"],
+            "code": code,
+            "name": names.get(code, "UNKNOWN"),
+            "count": count,
+            "gap_minutes": gap_minutes,
+        }
+        for code, count in counts.items()
+    ]
 
+def write_error_events(events):
+    """ Upserted by (station_name, timestamp, code), an upload saved twice (ingest retries, backfill) isn't counted twice """
+    if events:
+        db.error_events.bulk_write([
+            UpdateOne(
+                {"station_name": e["station_name"], "timestamp": e["timestamp"], "code": e["code"]},
+                {"$set": e},
+                upsert=True,
+            )
+            for e in events
+        ], ordered=False)
 
-def get_array_from_status_data(data, key):
-    value = data.pop(key, None) # remove the key 
-    if value is None:
-        return []
+def save_error_events(station_name, status):
+    """ Saves the error codes of a new status as error_events, with the minutes since the previous upload """
+    if not status.get("errors"):
+        return
 
-    # if already converted to float, convert to int and return it, only in single value case
-    if isinstance(value, float):
-        return [int(value)]
+    previous = db.statuses.find_one(
+        {"station_name": {"$eq": station_name}, "timestamp": {"$lt": status["timestamp"]}},
+        {"_id": 0, "timestamp": 1},
+        sort=[("timestamp", -1)],
+    )
+    write_error_events(error_event_docs(station_name, status, previous["timestamp"] if previous else None))
 
-    # parse comma-separated values
-    array = [
-        int(x.strip())
-        for x in value.split(",")
-        if x.strip().lstrip("-+").isdigit()
+def backfill_error_events(batch_size=1000, test_run=True):
+    """
+    One-off migration: saves the error_events of the statuses saved before them, station by
+    station in timestamp order. The last written timestamp of every station is saved in
+    db.migrations, so an interrupted backfill continues where it stopped.
+    """
+    if test_run:
+        count = db.statuses.count_documents({"errors": {"$exists": True, "$nin": ["", None]}})
+        logging.info(f"statuses with errors to save as error_events: {count}")
+        return count
+
+    total = 0
+    for station in get_stations():
+        name = station["name"]
+        progress_id = "error_events_" + name
+        progress = db.migrations.find_one({"_id": progress_id}) or {}
+
+        query = {"station_name": {"$eq": name}}
+        if progress.get("last_timestamp") is not None:
+            # the last done status again, as the previous upload of the next one
+            query["timestamp"] = {"$gte": progress["last_timestamp"]}
+
+        cursor = db.statuses.find(query, {"_id": 0, "timestamp": 1, "errors": 1, "ver": 1}).sort("timestamp", 1).batch_size(batch_size)
+        previous = None
+        events = []
+        saved = 0
+        for status in cursor:
+            if previous is not None or progress.get("last_timestamp") is None:
+                events.extend(error_event_docs(name, status, previous))
+            previous = status["timestamp"]
+
+            if len(events) >= batch_size:
+                write_error_events(events)
+                saved += len(events)
+                events = []
+                db.migrations.update_one({"_id": progress_id}, {"$set": {"last_timestamp": previous}}, upsert=True)
+
+        write_error_events(events)
+        saved += len(events)
+        total += saved
+        if previous is not None:
+            db.migrations.update_one({"_id": progress_id}, {"$set": {"last_timestamp": previous}}, upsert=True)
+        logging.info(f"#{name}: error_events saved: {saved}")
+
+    logging.info(f"error_events saved: {total}")
+    return total
+
+def sample_documents(station_name, t_ms, values, values_raw=None):
+    """ One {"value", "timestamp", "station_name"} document per valid sample, for the winds / dirs collections """
+    valid = ~np.ma.getmaskarray(values)
+    timestamps = t_ms[valid].astype("datetime64[ms]").tolist()  # naive UTC, like pymongo returns them
+    docs = [
+        {"value": v, "timestamp": t, "station_name": station_name}
+        for v, t in zip(values.data[valid].tolist(), timestamps)
     ]
+    if values_raw is not None:
+        for doc, v in zip(docs, values_raw.data[valid].tolist()):
+            doc["value_raw"] = v
+    return docs
 
-    # replace negative values with None
-    array = [x if x >= 0 else None for x in array]
-
-    return array
 
-
-def generate_times(base_ts, start_s: int, end_s: int, count: int):
+def insert_upload_docs(collection, docs, upload_id=None):
     """
-    Generate `count` equally spaced datetimes between start_s and end_s (seconds since midnight),
-    inclusive. Keeps the date (and tzinfo) from base_ts. Assumes both times are within the same day
-    and 0 <= start_s <= end_s <= 86400.
+    insert_many of the raw documents of one upload. With the upload_id (the ingest queue job)
+    the documents are tagged with it and the ones saved by a failed attempt of the same
+    upload are deleted first, so a retried upload isn't saved twice.
     """
-    if isinstance(base_ts, str):
-        base_ts = datetime.fromisoformat(base_ts)
+    if not docs:
+        return
 
-    if count < 1:
-        return []
-    
-    # Basic validation to avoid crossing days (no wrapping)
-    if not (0 <= start_s <= end_s <= 24 * 60 * 60):
-        raise ValueError("start_s and end_s must satisfy 0 <= start_s <= end_s <= 86400.")
+    if upload_id is not None:
+        for doc in docs:
+            doc["upload_id"] = upload_id
+        if collection.find_one({"upload_id": upload_id}, {"_id": 1}) is not None:
+            result = collection.delete_many({"upload_id": upload_id})
+            logging.warning(f"Upload {upload_id} saved again, deleted {result.deleted_count} documents of {collection.name} of the failed attempt")
+
+    collection.insert_many(docs)
+
+def save_wind_data(station_name, winds_data, upload_id=None):
+    if not winds_data:
+        logging.info(f"#{station_name}: No wind data to save")
+        return
 
-    # Build the sequence of second offsets (inclusive endpoints)
-    if count == 1:
-        secs = [start_s]
+    if RAW_STORAGE == "columnar":
+        if winds_data.get("upload") is not None:
+            insert_upload_docs(db.wind_uploads, [winds_data["upload"]], upload_id)
     else:
-        step = (end_s - start_s) / (count - 1)
-        secs = [round(start_s + i * step) for i in range(count)]
+        winds = sample_documents(station_name, winds_data["t_ms"], winds_data["winds"])
+        insert_upload_docs(db.winds, winds, upload_id)
+
+        dirs = sample_documents(station_name, winds_data["t_ms"], winds_data["dirs_adjusted"], winds_data["dirs"])
+        insert_upload_docs(db.dirs, dirs, upload_id)
 
-    # Combine same date + generated time-of-day; preserve tzinfo
-    base_date = base_ts.date()
-    tz = base_ts.tzinfo
-    day_start = datetime.combine(base_date, time(0, 0, 0, tzinfo=tz))
+    update_average_values(station_name, winds_data["t_ms"], winds_data["winds"], winds_data["dirs_adjusted"], upload_id=upload_id)
 
-    return [day_start + timedelta(seconds=s) for s in secs]
 
 
 ERROR_CODE_MAP_V2 = {
@@ -474,31 +707,16 @@ def parse_error_values(data):
 
 
 def parse_status_update(line, station, base_ts):
+    payload = payload_parser.parse_payload(line)
+
     data = {}
     data["timestamp"] = base_ts # add timestamp to the data
-    
-    logging.info(f"#{station['name']}: Saving data for station: {station}")
-    for part in line.split(";"):
-        if len(part) == 0:
-            continue
-
-        if "=" not in part:
-            logging.warning(f"#{station['name']}: Malformed part missing '=' in the line: '{line}'. part: '{part}'")
-            continue
-
-        parts = part.split("=")
-        if len(parts) != 2:
-            logging.warning(f"#{station['name']}: Malformed part doesnt have 2 parts in the line: '{line}'. part: '{part}'")
-            continue
-
-        key, val  = parts
+    data.update(payload.raw)
 
-        if len(val.strip()) == 0:
-            logging.warning(f"#{station['name']}: Malformed part has empty value in the line: '{line}'. part: '{part}'")
-            continue
-        
-        data[key.strip()] = val
-            
+    malformed = payload_parser.malformed_summary(payload)
+    if malformed:
+        logging.warning(f"#{station['name']}: Malformed parts in the line: {malformed}")
+    logging.debug(f"#{station['name']}: Parsing line: '{line}'")
 
     # some stations send seperate temp_out and temp_in, write temp_out as the "real" temperature
     if "temp_out" in data:
@@ -507,48 +725,61 @@ def parse_status_update(line, station, base_ts):
     if "hum_out" in data:
         data["hum"] = data["hum_out"]
 
+    data, bad_keys = status_schema.coerce(data)
+    if bad_keys:
+        logging.warning(f"#{station['name']}: Status values that are not numbers, saved as sent: {bad_keys}")
+
     #parse_error_values(data)
     try:
-        pass #calc_vbat_change_rate(data, station_name)
+        calc_vbat_change_rate(data, station["name"])
     except Exception as e:
         logging.error(f"#{station['name']}: Error calculating vbat change rate", exc_info=True)
 
-    requiredFields = ["logFirst", "logLast", "len", "avg", "dir"]
+    requiredFields = ["logFirst", "logLast", "len"]
 
-    missing = [f for f in requiredFields if f not in data]
+    missing = [f for f in requiredFields if not isinstance(payload.fields.get(f), int)]
+    missing += [f for f in payload_parser.ARRAY_FIELDS if f not in payload.arrays]
     if missing:
-        logging.warning(f"#{station['name']}: Required fields to parse wind data are missing: {missing}. Data: {data}")
+        logging.warning(f"#{station['name']}: Required fields to parse wind data are missing: {missing}. Keys: {list(payload.raw.keys())}")
         return data, None
 
-    # get arrays and remove the keys 
-    # extract the avg,max and dir arrays from the data and convert them to array 
-    winds = get_array_from_status_data(data, "avg") 
-    dirs = get_array_from_status_data(data, "dir")
+    log_first = payload.fields["logFirst"]
+    log_last = payload.fields["logLast"]
+    length = payload.fields["len"]
+    for key in requiredFields:
+        data.pop(key)
 
-    logging.info(f"#{station['name']}: Winds: {winds} dirs: {dirs}")
+    # sample times as epoch ms, datetimes are only created for the documents that are saved
+    t_ms = payload_parser.sample_times_ms(base_ts, log_first, log_last, length)
+    winds = payload.arrays["avg"]
+    dirs = payload.arrays["dir"]
 
-    timestamps = generate_times(base_ts, int(data["logFirst"]), int(data["logLast"]), int(data["len"]))
-    data.pop("logFirst", None)
-    data.pop("logLast", None)
-    data.pop("len", None)
+    for key, array in (("avg", winds), ("dir", dirs)):
+        if len(array) != length:
+            logging.warning(f"#{station['name']}: Length of '{key}' doesnt match len: {len(array)} != {length}")
 
-    #pprint.pprint(timestamps)
-    
     winds_data = {
-        "winds": set_timestamps_to_data(winds, timestamps),
-        "dirs": set_timestamps_to_data(dirs, timestamps),
+        "t_ms": t_ms,
+        "winds": winds if len(winds) == length else np.ma.masked_all(length, dtype=np.int64),
+        "dirs": dirs if len(dirs) == length else np.ma.masked_all(length, dtype=np.int64),
+        "upload": None,
     }
 
     # adjust the measurements based on the calibration
-    dir_adjustment = station.get("dir_adjustment", 0)
-    winds_data["dirs"] = [
-        {
-            "value": (d["value"] + dir_adjustment) % 360,
-            "value_raw": d["value"],
-            "timestamp": d["timestamp"]
+    winds_data["dirs_adjusted"] = (winds_data["dirs"] + station.get("dir_adjustment", 0)) % 360
+
+    # the same samples packed in one document, saved instead of winds / dirs when RAW_STORAGE is "columnar"
+    if length > 0:
+        winds_data["upload"] = {
+            "timestamp": _ms_to_datetime(int(t_ms[0])),
+            "timestamp_last": _ms_to_datetime(int(t_ms[-1])),
+            "logFirst": log_first,
+            "logLast": log_last,
+            "len": length,
+            "step_ms": round((t_ms[-1] - t_ms[0]) / (length - 1)) if length > 1 else 0,
+            "avg": payload.array_list("avg"),
+            "dir": payload.array_list("dir"),
         }
-        for d in winds_data["dirs"]
-    ]
 
     return data, winds_data
 
@@ -572,30 +803,11 @@ def merge_timestamps(base_ts, pseudo_ticks):
 
     return merged
 
-def set_timestamps_to_data(data, timestamps):
-    if len(data) != len(timestamps):
-        print("Lengths of data and timestamp doesnt match!")
-        print(f"Lengths: data={len(data)}, timestamps={len(timestamps)}")
-        return []
-
-    if len(data) == 0:
-        print("Lenght is 0")
-        return []
-    
-    data_with_timestamps = []
-    for i in range(len(data)):
-        if data[i] is None:
-            continue # do not save the None / invalid values
-
-        data_with_timestamps.append({
-            "value": data[i],
-            "timestamp": timestamps[i]
-        })
-
-    return data_with_timestamps
-
-
-def save_received_data(line, station, timestamp):
+def save_received_data(line, station, timestamp, upload_id=None):
+    """
+    Parses and saves one upload. upload_id identifies an upload saved from the ingest queue,
+    saving it again (a retry after a failure) doesn't duplicate what the failed attempt saved.
+    """
     if not line or not timestamp:
         logging.warning(f"#{station['name']}: No line or timestamp to save")
         return
@@ -607,83 +819,70 @@ def save_received_data(line, station, timestamp):
         logging.warning(f"#{station['name']}: No data found in line: {line}")
         return
 
-    logging.info(f"#{station['name']}: Saving status update at {timestamp} with data: {data} and winds data len: {len(winds_data)}")
+    logging.info(f"#{station['name']}: Saving status update at {timestamp}, samples: {len(winds_data['t_ms']) if winds_data else 0}")
 
     # save station status    
     if data is not None:
         data["station_name"] = station_name
-        index = db.statuses.insert_one(data)
+        # a retried upload has the same receive time, its status may already be saved
+        if upload_id is None or db.statuses.find_one({"station_name": {"$eq": station_name}, "timestamp": data["timestamp"]}, {"_id": 1}) is None:
+            db.statuses.insert_one(data)
+        set_station_latest(station_name, "status", {k: v for k, v in data.items() if k != "_id"})
+        update_status_fields(station_name, data.keys(), data["timestamp"])
+        save_error_events(station_name, data)
 
     if winds_data is not None:
-        # add station_name and to every dict in the lists
-        for item in winds_data.get("winds", []):
-            item["station_name"] = station_name
+        if winds_data.get("upload") is not None:
+            winds_data["upload"]["station_name"] = station_name
 
-        for item in winds_data.get("dirs", []):
-            item["station_name"] = station_name
+        save_wind_data(station_name, winds_data, upload_id)
 
-        save_wind_data(station_name, winds_data)
+    response_cache.bump_generation(station_name)
 
 def _ensure_tz(dt):
     return dt if dt.tzinfo else dt.replace(tzinfo=TZ)
 
-WINDOW_MINUTES = 90
+WINDOW_MINUTES = vbat_rate.WINDOW_MINUTES
 WINDOW = timedelta(minutes=WINDOW_MINUTES)
 
-def calc_vbat_change_rate(data, station_name):
-    # we change all the last 2 * WINDOW size of values each time we get a new vbat value
-    # why 3*window? we need to grab enough values so that the last value slope is calculated correctly  
-    start_time = data["timestamp"] - timedelta(minutes=WINDOW_MINUTES)
-    end_time = data["timestamp"]
-    statuses = list(db.statuses.find(
-        {"timestamp": {"$gte": start_time, "$lt": end_time}, "station_name": {"$eq": station_name}},
-        {}
-        ).sort("timestamp", 1))
-    
-    timestamps = [_ensure_tz(x["timestamp"]) for x in statuses]
-    values = [float(x["vbatIde"]) for x in statuses]
-
-    # add the newes vbatIde value from the latest data value
-    timestamps.append(data["timestamp"])
-    values.append(float(data["vbatIde"]))
-
-    pprint.pprint(values)
-    pprint.pprint(timestamps)
-    slope = caluculate_change_rate(values, timestamps)
-    #slope2 = caluculate_change_rate(slope1, timestamps)
-
-    data["vbat_rate"] = round(slope[-1]*1000, 2) if len(slope) > 0 else None
-    #data["vbat_rate2"] = round(slope2[-1]*1000, 2) if len(slope2) > 0 else None
-
-def caluculate_change_rate(values, timestamps):
-    slopes = []
-
-    for i in range(len(values)):
-        t_now = _ensure_tz(timestamps[i])
-
-        # collect points in [t_now - WINDOW, t_now]
-        t_win = []
-        v_win = []
-        j = i
-        while j >= 0 and (t_now - timestamps[j]) <= WINDOW:
-            t_win.append(timestamps[j])
-            v_win.append(values[j])  # use smoothed values for regression
-            j -= 1
+# RunningSlope of the vbatIde values of every station, see calc_vbat_change_rate
+_vbat_windows = {}
 
-        if len(t_win) < 2:
-            #slopes.append(None)
-            continue
+def _vbat_window_from_db(station_name, before):
+    """ RunningSlope of the statuses saved in the WINDOW before the timestamp `before` """
+    window = vbat_rate.RunningSlope()
+    statuses = db.statuses.find(
+        {"timestamp": {"$gte": before - WINDOW, "$lt": before}, "station_name": {"$eq": station_name}},
+        {"_id": 0, "timestamp": 1, "vbatIde": 1}
+    ).sort("timestamp", 1)
+    for status in statuses:
+        window.add(_timestamp_ms(status["timestamp"]), status_schema.number_or_none(status.get("vbatIde")))
+    return window
 
-        # convert times to minutes relative to first point in window
-        t0 = t_win[-1]
-        t_rel = np.array([(t - t0).total_seconds() / 60.0 for t in t_win])
-        v_arr = np.array(v_win)
+def calc_vbat_change_rate(data, station_name):
+    """
+    Sets data["vbat_rate"], the vbatIde trend of the last WINDOW in mV/h, from the running
+    window of the station. The window is read from the statuses again only when it can't be
+    continued: after a restart, for an upload older than the last one, or when the newest
+    saved status isn't the last one it has seen (saved by another worker).
+    """
+    t_ms = _timestamp_ms(data["timestamp"])
+    window = _vbat_windows.get(station_name)
+    if window is not None and window.last_ms is not None and window.last_ms < t_ms:
+        newest = get_station_latest(station_name).get("status")
+        # 1 ms apart: Mongo keeps the milliseconds of the timestamps only
+        if newest is None or abs(_timestamp_ms(newest["timestamp"]) - window.last_ms) > 1:
+            window = None
+    else:
+        window = None
 
-        # linear regression: v = a * t + b  -> a = slope [V/min]
-        a, b = np.polyfit(t_rel, v_arr, 1)
-        slopes.append(float(a*60))
+    if window is None:
+        window = _vbat_window_from_db(station_name, data["timestamp"])
+        _vbat_windows[station_name] = window
 
-    return slopes
+    rate = window.add(t_ms, status_schema.number_or_none(data.get("vbatIde")))
+    if "vbatIde" in data:
+        data["vbat_rate"] = round(rate, 2) if rate is not None else None
 
 def parse_wind_speed_chunk(wind_chunk):
     winds = {}
@@ -706,16 +905,20 @@ def parse_wind_speed_chunk(wind_chunk):
 
     return winds
 
-def get_status_values(station_name, data_key_name, duration_hours=6):
-    logging.info("Fetching vbat data from database")
-    logging.info(f"n docs {db.statuses.count_documents({})}")
+def get_status_values(station_name, data_key_name, duration_hours=6, max_points=None):
+    """ Values of one status key in the last duration_hours, newest first. None when the station never sent the key """
+    logging.info(f"#{station_name}: Fetching '{data_key_name}' status values from the last {duration_hours} hours")
     start_time = datetime.now(TZ) - timedelta(hours=duration_hours)
 
-    exists = db.statuses.find_one({ data_key_name: { "$exists": True } })
-    if not exists:
-        return {
-            "error", "Status data with key: '" + data_key_name + "' doesnt exist."
-        }
+    fields = get_status_fields(station_name)
+    if fields is None:
+        # the catalog of the station isn't built yet, see build_status_fields
+        if db.statuses.find_one({"station_name": {"$eq": station_name}, data_key_name: {"$exists": True}}, {"_id": 1}) is None:
+            return None
+    elif data_key_name not in fields:
+        return None
+    elif fields[data_key_name]["last"].astimezone(TZ) < start_time:
+        return []
 
     cursor = db.statuses.find(
         {
@@ -730,8 +933,13 @@ def get_status_values(station_name, data_key_name, duration_hours=6):
         }
     ).sort("timestamp", -1)
 
+    docs = list(cursor)
+    if max_points is not None:
+        indices = downsample.lttb_indices(_timestamps_ms([doc["timestamp"] for doc in docs]), [doc[data_key_name] for doc in docs], max_points)
+        docs = downsample.pick(docs, indices)
+
     status_values = []
-    for doc in cursor:
+    for doc in docs:
         status_values.append({
             "value": doc[data_key_name],
             "timestamp": doc["timestamp"]
@@ -739,39 +947,163 @@ def get_status_values(station_name, data_key_name, duration_hours=6):
 
     return status_values
 
+STATUS_FIELDS_IGNORED = ("_id", "station_name", "timestamp")
+STATUS_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def get_status_fields(station_name):
+    """ {key: {"first": datetime, "last": datetime}} of the status keys the station has sent, None when not cataloged yet """
+    doc = db.status_fields.find_one({"_id": station_name})
+    return doc.get("fields", {}) if doc is not None else None
+
+def update_status_fields(station_name, keys, timestamp):
+    """ Adds the keys of a saved status to the catalog of the station, with the first and last time they were seen """
+    keys = [k for k in keys if k not in STATUS_FIELDS_IGNORED and STATUS_FIELD_NAME.match(k)]
+    if not keys:
+        return
+
+    db.status_fields.update_one(
+        {"_id": station_name},
+        {
+            "$min": {f"fields.{k}.first": timestamp for k in keys},
+            "$max": {f"fields.{k}.last": timestamp for k in keys},
+        },
+        upsert=True,
+    )
+
+def build_status_fields(test_run=True):
+    """ One-off migration: builds the status_fields catalog of every station from all of its statuses """
+    cursor = db.statuses.aggregate([
+        {"$project": {"station_name": 1, "timestamp": 1, "kv": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$kv"},
+        {"$match": {"kv.k": {"$nin": list(STATUS_FIELDS_IGNORED)}}},
+        {"$group": {
+            "_id": {"station_name": "$station_name", "key": "$kv.k"},
+            "first": {"$min": "$timestamp"},
+            "last": {"$max": "$timestamp"},
+        }},
+    ], allowDiskUse=True)
+
+    catalogs = {}
+    for group in cursor:
+        key = group["_id"]["key"]
+        if STATUS_FIELD_NAME.match(key):
+            catalogs.setdefault(group["_id"]["station_name"], {})[key] = {"first": group["first"], "last": group["last"]}
+
+    logging.info(f"Building the status_fields catalog of {len(catalogs)} stations")
+    if test_run or not catalogs:
+        return len(catalogs)
+
+    db.status_fields.bulk_write(
+        [ReplaceOne({"_id": name}, {"fields": fields}, upsert=True) for name, fields in catalogs.items()],
+        ordered=False,
+    )
+    return len(catalogs)
+
+def drop_status_key_indexes(test_run=True):
+    """
+    One-off migration: drops the partial statuses indexes of single keys (status_vbatIde, ...).
+    get_status_values reads one station and time range, the (station_name, timestamp) index
+    bounds that to the statuses of the range and the key is checked on them.
+    """
+    names = [
+        index["name"] for index in db.statuses.list_indexes()
+        if index["name"].startswith("status_") and "partialFilterExpression" in index
+    ]
+    logging.info(f"Dropping {len(names)} partial statuses indexes: {names}")
+    if not test_run:
+        for name in names:
+            db.statuses.drop_index(name)
+    return len(names)
+
 def get_last_status(station_name):
-    cursor = db.statuses.find(
-        {"station_name": {"$eq": station_name}},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(1)
+    latest_status = get_station_latest(station_name).get("status")
+    if latest_status is None:
+        cursor = db.statuses.find(
+            {"station_name": {"$eq": station_name}},
+            {"_id": 0}
+        ).sort("timestamp", -1).limit(1)
 
-    latest_status = next(cursor, None)
+        latest_status = next(cursor, None)
 
     if latest_status:
-        latest_status['timestamp'] = latest_status['timestamp'].astimezone(TZ).isoformat()
-        return latest_status
+        return _last_status_result(latest_status)
     else:
         logging.warning("Unable to get last status from the DB.")
         return None
 
+def _last_status_result(latest_status):
+    return dict(latest_status)
 
-def get_last_statuses(station_name, n=1, shift=0):
-    logging.info(f"Getting last status for:{station_name} n:{n} shift:{shift}")
-    cursor = (
-        db.statuses.find(
-            {"station_name": {"$eq": station_name}},
-            {"_id": 0})
-        .sort("timestamp", -1)
-        .skip(shift)
-        .limit(n)
-    )
 
-    results = list(cursor)
+STATUS_CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+def encode_status_cursor(status):
+    """ Opaque ?before= token of a status, its (timestamp, _id) so statuses of the same time aren't skipped """
+    timestamp = status["timestamp"]
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=UTC)  # pymongo returns UTC without tzinfo
+    ms = (timestamp - STATUS_CURSOR_EPOCH) // timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode(f"{ms}:{status['_id']}".encode()).decode().rstrip("=")
+
 
-    for item in results:
-        item["timestamp"] = item["timestamp"].astimezone(TZ).isoformat()
+def decode_status_cursor(token):
+    """ (timestamp, _id) of an encode_status_cursor token, ValueError when it isn't one """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        ms, oid = raw.split(":")
+        return STATUS_CURSOR_EPOCH + timedelta(milliseconds=int(ms)), ObjectId(oid)
+    except (ValueError, InvalidId) as e:
+        raise ValueError(f"Invalid status cursor '{token}'") from e
+
+
+def get_last_statuses(station_name, n=1, shift=0, before=None):
+    """
+    The n newest statuses of the station, newest first, every one with its "cursor". With
+    before (the cursor of a status) only the statuses after it in that order, so the next
+    page starts at the cursor of the last status of the previous one. Ordered by (timestamp,
+    _id), statuses with the same timestamp are neither skipped nor repeated. Unlike shift
+    (skips that many statuses) every page reads only its n index entries.
+    """
+    logging.info(f"Getting last status for:{station_name} n:{n} shift:{shift} before:{before}")
+    query = {"station_name": {"$eq": station_name}}
+    if before is not None:
+        timestamp, oid = decode_status_cursor(before)
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": oid}},
+        ]
 
-    return results
+    cursor = db.statuses.find(query).sort([("timestamp", -1), ("_id", -1)])
+    if shift:
+        cursor = cursor.skip(shift)
+
+    statuses = list(cursor.limit(n))
+    for status in statuses:
+        status["cursor"] = encode_status_cursor(status)
+        del status["_id"]
+    return statuses
+
+def iter_status_export(station_name, start_time=None, end_time=None, fields=None, batch_size=500):
+    """
+    Statuses of the station between start_time and end_time, oldest first, one document at a
+    time from a batched cursor so an export of any range only holds one batch in memory.
+    fields limits the keys of the documents, the timestamp is always there.
+    """
+    query = {"station_name": {"$eq": station_name}}
+    time_range = {}
+    if start_time is not None:
+        time_range["$gte"] = start_time
+    if end_time is not None:
+        time_range["$lt"] = end_time
+    if time_range:
+        query["timestamp"] = time_range
+
+    projection = {"_id": 0, "station_name": 0}
+    if fields:
+        projection = {"_id": 0, "timestamp": 1, **{field: 1 for field in fields}}
+
+    yield from db.statuses.find(query, projection).sort("timestamp", 1).batch_size(batch_size)
 
 def get_status_updates(duration_hours=None, fromToday=False):
     logging.info("Fetching status updates from database")
@@ -797,55 +1129,176 @@ def get_status_updates(duration_hours=None, fromToday=False):
         logging.info("Fetching all status updates")
         cursor = db.statuses.find({}, {"_id": 0}).sort("timestamp", -1)
 
-    data = []
+    return list(cursor)
+
+def expand_upload(doc, field):
+    """ (timestamp, value) of the samples packed in a wind_uploads document, without the missing values """
+    start = doc["timestamp"].astimezone(TZ)
+    if "t_ms" in doc:
+        # converted from the per sample documents, the times are saved explicitly
+        offsets_ms = doc["t_ms"]
+    else:
+        offsets_ms = payload_parser.sample_offsets_ms(doc["logFirst"], doc["logLast"], doc["len"]).tolist()
+    timestamps = [start + timedelta(milliseconds=t) for t in offsets_ms]
+
+    values = doc.get(field, [])
+    if len(values) != len(timestamps):
+        return []
+
+    return [(t, v) for t, v in zip(timestamps, values) if v is not None]
+
+
+RAW_UPLOAD_FIELDS = {"winds": "avg", "dirs": "dir"}
+
+def find_raw_samples(collection_name, station_name, start_time, end_time=None, storage=None):
+    """
+    Raw samples of "winds" or "dirs" in [start_time, end_time), newest first, as
+    {"timestamp", "value"} dicts (dirs also have "value_raw"). Reads the per sample
+    documents or expands the packed uploads, depending on RAW_STORAGE.
+    """
+    storage = storage or RAW_STORAGE
+    if storage != "columnar":
+        time_query = {"$gte": start_time}
+        if end_time is not None:
+            time_query["$lt"] = end_time
+
+        return db[collection_name].find(
+            {"timestamp": time_query, "station_name": {"$eq": station_name}},
+            {"_id": 0, "timestamp": 1, "value": 1, "value_raw": 1}
+        ).sort("timestamp", -1)
+
+    field = RAW_UPLOAD_FIELDS[collection_name]
+    query = {"station_name": {"$eq": station_name}, "timestamp_last": {"$gte": start_time}}
+    if end_time is not None:
+        query["timestamp"] = {"$lt": end_time}
+
+    cursor = db.wind_uploads.find(
+        query,
+        {"_id": 0, "timestamp": 1, "logFirst": 1, "logLast": 1, "len": 1, "t_ms": 1, field: 1}
+    ).sort("timestamp_last", -1)
+
+    dir_adjustment = get_station_dir_adjustment(station_name) if collection_name == "dirs" else 0
+    samples = []
     for doc in cursor:
-        doc['timestamp'] = doc['timestamp'].astimezone(TZ).isoformat()
-        data.append(doc)
+        for timestamp, value in reversed(expand_upload(doc, field)):
+            if timestamp < start_time or (end_time is not None and timestamp >= end_time):
+                continue
 
-    return data
+            sample = {"timestamp": timestamp, "value": value}
+            if collection_name == "dirs":
+                sample["value"] = (value + dir_adjustment) % 360
+                sample["value_raw"] = value
+            samples.append(sample)
 
-def get_wind_all(station_name, duration_hours: int = 6):
+    return samples
+
+
+def find_raw_arrays(collection_name, station_name, start_time, end_time=None, storage=None):
+    """
+    find_raw_samples as (epoch ms int64, value) arrays, newest first, without a dict per
+    sample. Directions are adjusted with the current dir_adjustment of the station.
+    """
+    storage = storage or RAW_STORAGE
+    dir_adjustment = get_station_dir_adjustment(station_name) if collection_name == "dirs" else 0
+
+    if storage != "columnar":
+        timestamps = []
+        values = []
+        for doc in find_raw_samples(collection_name, station_name, start_time, end_time, storage=storage):
+            timestamps.append(doc["timestamp"])
+            values.append((doc["value_raw"] + dir_adjustment) % 360 if "value_raw" in doc else doc["value"])
+        return np.array(timestamps, dtype="datetime64[ms]").astype(np.int64), np.array(values)
+
+    field = RAW_UPLOAD_FIELDS[collection_name]
+    query = {"station_name": {"$eq": station_name}, "timestamp_last": {"$gte": start_time}}
+    if end_time is not None:
+        query["timestamp"] = {"$lt": end_time}
+
+    cursor = db.wind_uploads.find(
+        query,
+        {"_id": 0, "timestamp": 1, "logFirst": 1, "logLast": 1, "len": 1, "t_ms": 1, field: 1}
+    ).sort("timestamp_last", -1)
+
+    start_ms = _timestamp_ms(start_time)
+    end_ms = _timestamp_ms(end_time) if end_time is not None else None
+    ts_chunks = []
+    value_chunks = []
+    for doc in cursor:
+        if "t_ms" in doc:
+            offsets = np.array(doc["t_ms"], dtype=np.int64)
+        else:
+            offsets = payload_parser.sample_offsets_ms(doc["logFirst"], doc["logLast"], doc["len"])
+        values = np.array([-1 if v is None else v for v in doc.get(field, [])], dtype=np.int64)
+        if len(values) != len(offsets):
+            continue
+
+        ts = _timestamp_ms(doc["timestamp"]) + offsets
+        keep = (values >= 0) & (ts >= start_ms)
+        if end_ms is not None:
+            keep &= ts < end_ms
+        ts_chunks.append(ts[keep][::-1])
+        value_chunks.append(values[keep][::-1])
+
+    if not ts_chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    values = np.concatenate(value_chunks)
+    if collection_name == "dirs":
+        values = (values + dir_adjustment) % 360
+    return np.concatenate(ts_chunks), values
+
+
+def get_wind_all(station_name, duration_hours: int = 6, max_points=None):
     duration_shift = 0
     end_time = datetime.now(TZ) - timedelta(hours=duration_shift)
     start_time = end_time - timedelta(hours=duration_hours)
 
-    cursor = db.winds.find(
-        {
-         "timestamp": {"$gte": start_time, "$lte": end_time},
-         "station_name": {"$eq": station_name}
-        },
-        {"_id": 0, "timestamp": 1, "value": 1}
-    ).sort("timestamp", -1)
+    cursor = find_raw_samples("winds", station_name, start_time, end_time)
+    if max_points is not None:
+        cursor = _downsample_winds(list(cursor), max_points)
 
     data = []
     speed_rpm_to_ms = get_station_speed_to_rpm(station_name)
     for doc in cursor:
-        doc['timestamp'] = doc['timestamp'].astimezone(TZ).isoformat()
         doc["value"] = round(doc["value"] * speed_rpm_to_ms, 2)
         data.append(doc)
 
     return data
 
 
-def get_directions_all(station_name, duration_hours=6):
+def get_wind_all_columnar(station_name, duration_hours=6, max_points=None):
+    """ get_wind_all as columns, newest first like the rows """
+    end_time = datetime.now(TZ)
+    speed_rpm_to_ms = get_station_speed_to_rpm(station_name)
+
+    cursor = find_raw_samples("winds", station_name, end_time - timedelta(hours=duration_hours), end_time)
+    if max_points is not None:
+        cursor = _downsample_winds(list(cursor), max_points)
+
+    timestamps = []
+    values = []
+    for doc in cursor:
+        timestamps.append(doc["timestamp"])
+        values.append(round(doc["value"] * speed_rpm_to_ms, 2))
+
+    return to_columnar(timestamps, {"value": values})
+
+
+def get_directions_all(station_name, duration_hours=6, max_points=None):
     duration_shift = 0
     end_time = datetime.now(TZ) - timedelta(hours=duration_shift)
     start_time = end_time - timedelta(hours=duration_hours)
 
-    cursor = db.dirs.find(
-        {
-         "timestamp": {"$gte": start_time, "$lte": end_time},
-         "station_name": {"$eq": station_name}
-        },
-        {"_id": 0, "timestamp": 1, "value": 1, "value_raw": 1}
-    ).sort("timestamp", -1)
+    cursor = find_raw_samples("dirs", station_name, start_time, end_time)
+    if max_points is not None:
+        # directions can't be compared, keep evenly spaced samples
+        cursor = list(cursor)
+        cursor = downsample.pick(cursor, downsample.stride_indices(len(cursor), max_points))
 
 
     dir_adjustment = get_station_dir_adjustment(station_name)
     data = []
     for doc in cursor:
-        doc['timestamp'] = doc['timestamp'].astimezone(TZ).isoformat()
-
         # use the raw value if avaliable, so that we can adjust the dir based on the calibration live 
         if "value_raw" in doc:
             doc["value"] = (doc["value_raw"] + dir_adjustment) % 360
@@ -855,111 +1308,224 @@ def get_directions_all(station_name, duration_hours=6):
 
     return data
 
-def get_temp(station_name, duration_hours=6):
+def find_temp(station_name, duration_hours=6):
     logging.info(f"Fetching temperature and humidity data from the last {duration_hours} hours")
     start_time = datetime.now(TZ) - timedelta(hours=duration_hours)
     
-    temp_hum_data = list(db.statuses.find(
+    return db.statuses.find(
         {"timestamp": {"$gte": start_time}, "station_name": {"$eq": station_name}},
         {"_id": 0, "temp": 1, "hum": 1, "temp_in": 1, "hum_in": 1, "timestamp": 1}
-    ).sort("timestamp", 1))
+    ).sort("timestamp", 1)
+
+def _temp_values(d):
+    # the values are numbers since the typed status schema, older statuses are strings until backfilled
+    data = {
+        "temp": status_schema.number_or_none(d.get("temp")),
+        "hum": status_schema.number_or_none(d.get("hum"), int),
+    }
+
+    if "temp_in" in d:
+        data["temp_in"] = status_schema.number_or_none(d["temp_in"])
+
+    if "hum_in" in d:
+        data["hum_in"] = status_schema.number_or_none(d["hum_in"], int)
+
+    return data
+
+def get_temp(station_name, duration_hours=6, max_points=None):
+    temp_hum_data = _downsample_temp(list(find_temp(station_name, duration_hours)), max_points)
 
     if len(temp_hum_data) == 0:
         return []
     
     filtered_data = []
     for d in temp_hum_data:
-        temp = d.get("temp", "nan")
-        temp = float(temp) if temp != "nan" else None
+        data = {"timestamp": d["timestamp"]}
+        data.update(_temp_values(d))
+        filtered_data.append(data)
+    
+    return filtered_data
 
-        hum = d.get("hum", "nan")
-        hum = int(hum) if hum != "nan" else None
+def get_temp_columnar(station_name, duration_hours=6, max_points=None):
+    """ get_temp as columns, temp_in / hum_in are only there when a status has them """
+    timestamps = []
+    columns = {"temp": [], "hum": [], "temp_in": [], "hum_in": []}
+    for d in _downsample_temp(list(find_temp(station_name, duration_hours)), max_points):
+        timestamps.append(d["timestamp"])
+        values = _temp_values(d)
+        for key, column in columns.items():
+            column.append(values.get(key))
 
-        data = {
-            "timestamp": d["timestamp"].astimezone(TZ).isoformat(),
-            "temp": temp,
-            "hum": hum,
-        }
-        
-        if "temp_in" in d:
-            temp_in = d.get("temp_in", "nan")
-            data["temp_in"] = float(temp_in) if temp_in != "nan" else None
+    for key in ("temp_in", "hum_in"):
+        if all(v is None for v in columns[key]):
+            del columns[key]
 
-        if "hum_in" in d:
-            hum_in = d.get("hum_in", "nan")
-            data["hum_in"] = int(hum_in) if hum_in != "nan" else None
+    return to_columnar(timestamps, columns)
 
-        filtered_data.append(data)
-    
-    return filtered_data
 
+def get_directions_all_columnar(station_name, duration_hours=6, max_points=None):
+    """ get_directions_all as columns, newest first like the rows """
+    end_time = datetime.now(TZ)
+    dir_adjustment = get_station_dir_adjustment(station_name)
+
+    cursor = find_raw_samples("dirs", station_name, end_time - timedelta(hours=duration_hours), end_time)
+    if max_points is not None:
+        cursor = list(cursor)
+        cursor = downsample.pick(cursor, downsample.stride_indices(len(cursor), max_points))
+
+    timestamps = []
+    values = []
+    for doc in cursor:
+        timestamps.append(doc["timestamp"])
+        values.append((doc["value_raw"] + dir_adjustment) % 360 if "value_raw" in doc else doc["value"])
+
+    return to_columnar(timestamps, {"value": values})
+
+def _downsample_temp(docs, max_points):
+    """ LTTB on the temperature, the humidity is read at the same statuses """
+    if max_points is None:
+        return docs
+    indices = downsample.lttb_indices(_timestamps_ms([d["timestamp"] for d in docs]), [d.get("temp") for d in docs], max_points)
+    return downsample.pick(docs, indices)
 
-def get_wind_data(station_name, duration_hours=6):
+def _downsample_winds(docs, max_points):
+    """ The slowest and the fastest sample of every bucket, so the gusts stay in the graph """
+    return downsample.pick(docs, downsample.min_max_indices([doc["value"] for doc in docs], max_points))
+
+def _timestamps_ms(timestamps):
+    """ Epoch ms of naive UTC (as pymongo returns them) or timezone aware datetimes """
+    if timestamps and timestamps[0].tzinfo is not None:
+        return np.array([round(t.timestamp() * 1000) for t in timestamps], dtype=np.int64)
+    return np.array(timestamps, dtype="datetime64[ms]").astype(np.int64)
+
+def to_columnar(timestamps, columns):
+    """
+    Compact form of a time series for ?format=columnar: t0 (epoch ms of the first point) and
+    step_ms when the points are evenly spaced, otherwise ts_ms with the offset of every point
+    from t0, plus one list per column.
+    """
+    ts = _timestamps_ms(timestamps)
+
+    result = {"t0": int(ts[0]) if len(ts) else None}
+    steps = np.diff(ts)
+    if len(steps) > 0 and (steps == steps[0]).all():
+        result["step_ms"] = int(steps[0])
+    else:
+        result["ts_ms"] = (ts - ts[0]).tolist() if len(ts) else []
+
+    result.update(columns)
+    return result
+
+
+def get_wind_data(station_name, duration_hours=6, max_points=None):
     logging.info(f"Fetching bucketed data from the last {duration_hours} hours. For:{station_name}")
     start_time = datetime.now(TZ) - timedelta(hours=duration_hours)
 
     # --- fetch data ---
-    winds = list(db.wind_bucketed.find(
-        {"timestamp": {"$gte": start_time}, "station_name": {"$eq": station_name}},
-        {"_id": 0}
-    ).sort("timestamp", -1))
-
-    dirs = list(db.dir_bucketed.find(
-        {"timestamp": {"$gte": start_time}, "station_name": {"$eq": station_name}},
-        {"_id": 0}
-    ).sort("timestamp", -1))
+    speed_rpm_to_ms = get_station_speed_to_rpm(station_name)
+    winds = _downsample_buckets(find_wind_tier_buckets(station_name, start_time, duration_hours), max_points, speed_rpm_to_ms)
 
-    # --- index direction data by timestamp ---
-    dirs_map = {d["timestamp"]: d for d in dirs}
+    #logging.info(f"Got speed_rpm_to_ms: {speed_rpm_to_ms}")
+    return [_wind_data_result(w, speed_rpm_to_ms) for w in winds]
 
-    # --- merge datasets ---
+def get_wind_data_columnar(station_name, duration_hours=6, max_points=None):
+    """ get_wind_data as columns, newest first like the rows """
+    start_time = datetime.now(TZ) - timedelta(hours=duration_hours)
     speed_rpm_to_ms = get_station_speed_to_rpm(station_name)
-    #logging.info(f"Got speed_rpm_to_ms: {speed_rpm_to_ms}")
-    merged = []
-    for w in winds:
-        ts = w["timestamp"]
-        d = dirs_map.get(ts)
-        direction =  d.get("mode") if d is not None else None 
-
-        if "avg_rpm" in w:
-            w["avg"] = w["avg_rpm"] * speed_rpm_to_ms
-        
-        if "max_rpm" in w:
-            w["max"] = w["max_rpm"] * speed_rpm_to_ms
-
-        merged.append({
-            "timestamp": ts.astimezone(TZ).isoformat(),
-            "avg": w.get("avg"),
-            "max": w.get("max"),
-            "dir": direction
-        })
+
+    timestamps = []
+    columns = {"avg": [], "max": [], "dir": []}
+    for w in _downsample_buckets(find_wind_tier_buckets(station_name, start_time, duration_hours), max_points, speed_rpm_to_ms):
+        timestamps.append(w["timestamp"])
+        columns["avg"].append(w["avg_rpm"] * speed_rpm_to_ms if "avg_rpm" in w else w.get("avg"))
+        columns["max"].append(w["max_rpm"] * speed_rpm_to_ms if "max_rpm" in w else w.get("max"))
+        columns["dir"].append(w.get("dir"))
+
+    return to_columnar(timestamps, columns)
+
+def _downsample_buckets(winds, max_points, speed_rpm_to_ms):
+    """ Keeps the buckets with the lowest and the highest gust """
+    if max_points is None:
+        return winds
+    gusts = [w["max_rpm"] * speed_rpm_to_ms if "max_rpm" in w else w.get("max") for w in winds]
+    return downsample.pick(winds, downsample.min_max_indices(gusts, max_points))
+
+def wind_tier(duration_hours):
+    """ Collection of the coarsest tier with at least WIND_TIER_MIN_POINTS buckets in duration_hours """
+    collection_name = WIND_TIERS[0][0]
+    for name, minutes in WIND_TIERS:
+        if duration_hours * 60 / minutes >= WIND_TIER_MIN_POINTS:
+            collection_name = name
+    return collection_name
+
+def find_wind_tier_buckets(station_name, start_time, duration_hours):
+    """
+    find_wind_buckets of the tier picked by wind_tier, newest first. The tier is only used from
+    its oldest bucket on, the time before it (rollups not built yet) comes from the 15 minute buckets.
+    """
+    collection_name = wind_tier(duration_hours)
+    if collection_name == WIND_TIERS[0][0]:
+        return list(find_wind_buckets(station_name, start_time))
+
+    minutes = dict(WIND_TIERS)[collection_name]
+    oldest = db[collection_name].find_one({"station_name": {"$eq": station_name}}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", 1)])
+    if oldest is None:
+        return list(find_wind_buckets(station_name, start_time))
+
+    tier_start = _ms_to_datetime(bucketing.tier_range_ms(_timestamp_ms(oldest["timestamp"]), minutes)[0])
+    winds = list(find_wind_buckets(station_name, start_time, collection_name))
+    if tier_start > start_time:
+        winds += list(find_wind_buckets(station_name, start_time, end_time=tier_start))
+    return winds
+
+def find_wind_buckets(station_name, start_time, collection_name="wind_bucketed", end_time=None):
+    time_range = {"$gte": start_time}
+    if end_time is not None:
+        time_range["$lt"] = end_time
+    return db[collection_name].find(
+        {"timestamp": time_range, "station_name": {"$eq": station_name}},
+        {"_id": 0, "timestamp": 1, "avg": 1, "max": 1, "avg_rpm": 1, "max_rpm": 1, "dir": 1}
+    ).sort("timestamp", -1)
+
+def _wind_data_result(w, speed_rpm_to_ms):
+    ts = w["timestamp"]
+
+    if "avg_rpm" in w:
+        w["avg"] = w["avg_rpm"] * speed_rpm_to_ms
     
-    return merged
+    if "max_rpm" in w:
+        w["max"] = w["max_rpm"] * speed_rpm_to_ms
+
+    return {
+        "timestamp": ts,
+        "avg": w.get("avg"),
+        "max": w.get("max"),
+        "dir": w.get("dir")
+    }
 
+LATEST_WIND_FIELDS = ("station_name", "timestamp", "avg", "max", "avg_rpm", "max_rpm", "dir")
 
 def get_last_wind(station_name=None):
-    query = {}
-    if station_name is not None:
-        query["station_name"] = {"$eq": station_name}
+    latest_wind = get_station_latest(station_name).get("wind") if station_name is not None else None
 
-    latest_wind = db.wind_bucketed.find_one(
-        query,
-        {"_id": 0, "station_name": 1, "timestamp": 1, "avg": 1, "max": 1, "avg_rpm": 1, "max_rpm": 1},
-        sort=[("timestamp", -1)]
-    )
+    if latest_wind is None:
+        query = {}
+        if station_name is not None:
+            query["station_name"] = {"$eq": station_name}
+
+        latest_wind = db.wind_bucketed.find_one(
+            query,
+            {"_id": 0, **{f: 1 for f in LATEST_WIND_FIELDS}},
+            sort=[("timestamp", -1)]
+        )
 
     if latest_wind is None:
         logging.warning("Unable to get last wind from the DB.")
         return None
 
-    direction_doc = db.dir_bucketed.find_one(
-        {
-            "station_name": {"$eq": latest_wind["station_name"]},
-            "timestamp": {"$eq": latest_wind["timestamp"]},
-        },
-        {"_id": 0, "mode": 1}
-    )
+    return _last_wind_result(latest_wind)
 
+def _last_wind_result(latest_wind):
     speed_rpm_to_ms = get_station_speed_to_rpm(latest_wind["station_name"])
     avg = latest_wind.get("avg")
     if avg is None and "avg_rpm" in latest_wind:
@@ -971,43 +1537,133 @@ def get_last_wind(station_name=None):
 
     return {
         "station_name": latest_wind["station_name"],
-        "timestamp": latest_wind["timestamp"].astimezone(TZ).isoformat(),
+        "timestamp": latest_wind["timestamp"],
         "avg": avg,
         "max": max_speed,
-        "dir": direction_doc.get("mode") if direction_doc is not None else None,
+        "dir": latest_wind.get("dir"),
     }
 
 
 def get_last_temp(station_name=None):
-    query = {}
-    if station_name is not None:
-        query["station_name"] = {"$eq": station_name}
+    latest_status = get_station_latest(station_name).get("status") if station_name is not None else None
 
-    latest_status = db.statuses.find_one(
-        query,
-        {"_id": 0, "station_name": 1, "timestamp": 1, "temp": 1, "hum": 1, "temp_in": 1, "hum_in": 1},
-        sort=[("timestamp", -1)]
-    )
+    if latest_status is None:
+        query = {}
+        if station_name is not None:
+            query["station_name"] = {"$eq": station_name}
+
+        latest_status = db.statuses.find_one(
+            query,
+            {"_id": 0, "station_name": 1, "timestamp": 1, "temp": 1, "hum": 1, "temp_in": 1, "hum_in": 1},
+            sort=[("timestamp", -1)]
+        )
 
     if latest_status is None:
         logging.warning("Unable to get last temp from the DB.")
         return None
 
+    return _last_temp_result(latest_status)
+
+def _last_temp_result(latest_status):
     result = {
         "station_name": latest_status["station_name"],
-        "timestamp": latest_status["timestamp"].astimezone(TZ).isoformat(),
-        "temp": float(latest_status["temp"]) if latest_status.get("temp") != "nan" and "temp" in latest_status else None,
-        "hum": int(latest_status["hum"]) if latest_status.get("hum") != "nan" and "hum" in latest_status else None,
+        "timestamp": latest_status["timestamp"],
     }
+    result.update(_temp_values(latest_status))
+    return result
 
-    if "temp_in" in latest_status:
-        result["temp_in"] = float(latest_status["temp_in"]) if latest_status["temp_in"] != "nan" else None
 
-    if "hum_in" in latest_status:
-        result["hum_in"] = int(latest_status["hum_in"]) if latest_status["hum_in"] != "nan" else None
 
-    return result
+def _newest_per_station(collection, station_names, fields=None, exclude=()):
+    """ {station_name: newest document} of all the stations in one aggregation """
+    pipeline = [
+        {"$match": {"station_name": {"$in": list(station_names)}}},
+        # $sort on the (station_name, timestamp) index with $first lets Mongo jump straight
+        # to the newest document of every station instead of scanning their history
+        {"$sort": {"station_name": 1, "timestamp": -1}},
+        {"$group": {"_id": "$station_name", "doc": {"$first": "$$ROOT"}}},
+    ]
+
+    newest = {}
+    for group in collection.aggregate(pipeline):
+        doc = group["doc"]
+        newest[group["_id"]] = {k: v for k, v in doc.items() if k != "_id" and k not in exclude and (fields is None or k in fields)}
+    return newest
+
+def get_last_winds_for(station_names):
+    """ get_last_wind of all the stations in one query, None for the stations without buckets """
+    newest = _newest_per_station(db.wind_bucketed, station_names, fields=LATEST_WIND_FIELDS)
+    return {name: _last_wind_result(newest[name]) if name in newest else None for name in station_names}
+
+
+def get_station_latest(station_name):
+    """ The station_latest snapshot of the station: its newest "status", "wind" and "prefs" """
+    return db.station_latest.find_one({"_id": station_name}) or {}
+
+def set_station_latest(station_name, field, value):
+    """
+    Saves value (a dict with a timestamp) as the newest `field` of the station, unless a newer
+    one is already saved. Uploads saved late (ingest queue retries) don't overwrite newer values.
+    """
+    try:
+        db.station_latest.update_one(
+            {"_id": station_name, "$or": [{f"{field}.timestamp": {"$lte": value["timestamp"]}}, {field: {"$exists": False}}]},
+            {"$set": {field: value}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        pass # the saved value is newer
+
+def refresh_station_latest(station_name):
+    """ Rebuilds the station_latest snapshot of the station from the statuses, buckets and prefs """
+    return refresh_station_latest_for([station_name])[station_name]
+
+def refresh_station_latest_for(station_names):
+    """ refresh_station_latest of many stations, with one query per collection """
+    sources = {
+        "status": _newest_per_station(db.statuses, station_names),
+        "wind": _newest_per_station(db.wind_bucketed, station_names, fields=LATEST_WIND_FIELDS),
+        "prefs": _newest_per_station(db.prefs, station_names, exclude=("prefs_raw",)),
+    }
+
+    snapshots = {}
+    for name in station_names:
+        snapshots[name] = {field: newest[name] for field, newest in sources.items() if name in newest}
 
+    if snapshots:
+        db.station_latest.bulk_write(
+            [ReplaceOne({"_id": name}, snapshot, upsert=True) for name, snapshot in snapshots.items()],
+            ordered=False,
+        )
+    return snapshots
+
+def get_station_list_data(stations):
+    """
+    Newest prefs, status, wind and temperature of every station for the station list, read from
+    station_latest in one query. Stations without a snapshot get it rebuilt.
+    """
+    snapshots = {
+        doc["_id"]: doc
+        for doc in db.station_latest.find({"_id": {"$in": [s["name"] for s in stations]}})
+    }
+
+    missing = [s["name"] for s in stations if s["name"] not in snapshots]
+    if missing:
+        snapshots.update(refresh_station_latest_for(missing))
+
+    stations_data = []
+    for station in stations:
+        snapshot = snapshots[station["name"]]
+
+        stations_data.append({
+            'station': station,
+            'prefsData': _prefs_result(snapshot["prefs"]) if "prefs" in snapshot else {},
+            'statusData': _last_status_result(snapshot["status"]) if "status" in snapshot else None,
+            'windData': _last_wind_result(snapshot["wind"]) if "wind" in snapshot else None,
+            'tempData': _last_temp_result(snapshot["status"]) if "status" in snapshot else None,
+        })
+
+    return stations_data
 
 """
 Not used:
@@ -1054,6 +1710,7 @@ def get_n_data():
         "statuses": db.statuses.count_documents({}),
         "winds": db.winds.count_documents({}),
         "directions": db.dirs.count_documents({}),
+        "wind_uploads": db.wind_uploads.count_documents({}),
     }
 
 
@@ -1088,78 +1745,718 @@ def get_last_bucket_filled(station_name, type_name):
     return last_time.astimezone(TZ)
 
 
-def create_average_wind_values(station_name):
+def get_raw_arrays(collection_name, station_name, start_time):
+    """ Raw samples since start_time as (epoch ms, value) arrays, newest first """
+    cursor = find_raw_samples(collection_name, station_name, start_time)
+
+    xs = []
+    ys = []
+    for doc in cursor:
+        xs.append(_timestamp_ms(doc["timestamp"]))
+        ys.append(doc["value"])
+
+    return np.array(xs, dtype=np.int64), np.array(ys)
+
+
+def to_bucket_doc(station_name, key_ms, wind=None, dir_mode=None, speed_rpm_to_ms=None):
+    """ Combined wind + direction bucket document as saved in wind_bucketed """
+    doc = {
+        "timestamp": _ms_to_datetime(key_ms),
+        "station_name": station_name,
+    }
+
+    if wind is not None:
+        doc["avg_rpm"] = wind["avg"] # save the original rpm values before converting to m/s, so we can change it back anytime if the conversion constant changes
+        doc["max_rpm"] = wind["max"]
+        doc["avg"] = round(wind["avg"] * speed_rpm_to_ms, 2)
+        doc["max"] = round(wind["max"] * speed_rpm_to_ms, 2)
+
+    if dir_mode is not None:
+        doc["dir"] = dir_mode
+
+    return doc
+
+
+def create_average_values(station_name):
+    """
+    Rebuilds the wind_bucketed buckets from the raw winds and dirs since last_bucket_filed_wind.
+    Used after a calibration change or a backfill, the uploads are folded in by update_average_values.
+    """
     first_data_to_average = get_last_bucket_filled(station_name, "wind")
     logging.info(f"#{station_name}: first_data_to_average: '{first_data_to_average}'")
 
-    start_time = datetime.now(TZ) - timedelta(hours=0.2)
-    cursor = db.winds.find(
-        {"timestamp": {"$gte": first_data_to_average}, "station_name": station_name},
-        {"_id": 0, "timestamp": 1, "value": 1}
-    ).sort("timestamp", -1)
+    wind_xs, wind_ys = get_raw_arrays("winds", station_name, first_data_to_average)
+    dir_xs, dir_values = get_raw_arrays("dirs", station_name, first_data_to_average)
+    dir_ys = ((dir_values + 22.5) // 45 % 8).astype(np.int64)
+    logging.info(f"#{station_name}: bucket values len winds: {len(wind_xs)} dirs: {len(dir_xs)}")
 
-    wind_data = []
-    speed_rpm_to_ms = get_station_speed_to_rpm(station_name)
-    for doc in cursor:
-        timestamp = int(doc['timestamp'].astimezone(TZ).timestamp() * 1000)
-        doc["x"] = timestamp
-        doc["y"] = doc["value"]
-        wind_data.append(doc)
-    
-    #pprint.pprint(len(wind_data))
-    wind_bucketed, last_bucket_filed_ms  = bucket_aggregate(wind_data, modes=["avg", "max"])
-    if wind_bucketed is None:
+    wind_bucketed, last_bucket_filed_ms = bucketing.bucket_aggregate_np(wind_xs, wind_ys, modes=["avg", "max"])
+    dirs_bucketed, _ = bucketing.bucket_aggregate_np(dir_xs, dir_ys, modes=["mode"])
+    if wind_bucketed is None and dirs_bucketed is None:
         print("No data returned to be saved")
         return
-    
-    for data_wind in wind_bucketed:
-        data_wind["station_name"] = station_name
-        data_wind["avg_rpm"] = data_wind["avg"]  # save the original rpm values before converting to m/s, so we can change it back anytime if the conversion constant changes
-        data_wind["max_rpm"] = data_wind["max"]
-        data_wind["avg"] = round(data_wind["avg"] * speed_rpm_to_ms, 2)
-        data_wind["max"] = round(data_wind["max"] * speed_rpm_to_ms, 2)
 
-    set_last_bucket_filled(station_name, last_bucket_filed_ms, "wind")
+    winds_map = {_timestamp_ms(w["timestamp"]): w for w in wind_bucketed or []}
+    dirs_map = {_timestamp_ms(d["timestamp"]): d["mode"] for d in dirs_bucketed or []}
 
-    #pprint.pprint(wind_bucketed)
-    
-    timestamps = [item["timestamp"] for item in wind_bucketed]
-    db.wind_bucketed.delete_many({"timestamp": {"$in": timestamps}, "station_name": station_name})
-    db.wind_bucketed.insert_many(wind_bucketed)
+    speed_rpm_to_ms = get_station_speed_to_rpm(station_name)
+    bucketed = [
+        to_bucket_doc(station_name, key_ms, winds_map.get(key_ms), dirs_map.get(key_ms), speed_rpm_to_ms)
+        for key_ms in sorted(winds_map.keys() | dirs_map.keys())
+    ]
 
+    if last_bucket_filed_ms is not None:
+        set_last_bucket_filled(station_name, last_bucket_filed_ms, "wind")
 
-def create_average_dir_values(station_name):
-    first_data_to_average = get_last_bucket_filled(station_name, "dir")
-    print("first_data_to_average", first_data_to_average)
+    # the states are rebuilt from the raw samples the next time the bucket is updated
+    write_buckets(db.wind_bucketed, station_name, bucketed, unset_fields=("wind_state", "dir_state"))
+    update_rollups(station_name, [_timestamp_ms(doc["timestamp"]) for doc in bucketed])
+    refresh_station_latest(station_name)
 
-    cursor = db.dirs.find(
-        {"timestamp": {"$gte": first_data_to_average}, "station_name": station_name},
-        {"_id": 0, "timestamp": 1, "value": 1}
-    ).sort("timestamp", -1)
 
-    dirs_data = []
-    for doc in cursor:
-        timestamp = int(doc['timestamp'].astimezone(TZ).timestamp() * 1000)
-        doc["x"] = timestamp
-        doc["y"] = int((doc["value"] + 22.5) // 45 % 8)
-        dirs_data.append(doc)
-    
-    logging.info(f"#{station_name}: bucket dir values len: {len(dirs_data)}")
-    #pprint.pprint(len(dirs_data))
-    dirs_bucketed, last_bucket_filed_ms  = bucket_aggregate(dirs_data, modes=["mode"])
-    if dirs_bucketed is None:
-        print("No data returned to be saved")
+def _timestamp_ms(timestamp):
+    return int(timestamp.astimezone(TZ).timestamp() * 1000)
+
+def _ms_to_datetime(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=TZ)
+
+def get_bucket_docs(collection, station_name, keys_ms):
+    """ Returns {bucket_key_ms: doc} for the buckets that are already saved """
+    cursor = collection.find(
+        {"timestamp": {"$in": [_ms_to_datetime(k) for k in keys_ms]}, "station_name": station_name},
+        {"_id": 0}
+    )
+    return {_timestamp_ms(doc["timestamp"]): doc for doc in cursor}
+
+def get_raw_bucket_points(collection_name, station_name, key_ms):
+    start_ms, end_ms = bucketing.bucket_range_ms(key_ms)
+    cursor = find_raw_samples(collection_name, station_name, _ms_to_datetime(start_ms), _ms_to_datetime(end_ms))
+    return [(_timestamp_ms(doc["timestamp"]), doc["value"]) for doc in cursor]
+
+def write_buckets(collection, station_name, bucketed, unset_fields=(), expected_revs=None):
+    """
+    Upserts the bucket documents keyed by (station_name, timestamp) in one round-trip.
+    Returns how many buckets were inserted, modified and left unchanged, the counts are
+    also added to the station bucket_props to track the write amplification.
+
+    With expected_revs (the rev of every bucket when it was read, None when it wasn't saved)
+    a bucket is only written if nobody changed it since. The write of a changed bucket
+    doesn't match and its upsert fails on the unique (station_name, timestamp) index, the
+    timestamps of those buckets are returned in "conflicts".
+    """
+    if not bucketed:
+        return {"inserted": 0, "modified": 0, "unchanged": 0, "conflicts": []}
+
+    update = {}
+    if unset_fields:
+        update["$unset"] = {field: "" for field in unset_fields}
+
+    revs = expected_revs if expected_revs is not None else [None] * len(bucketed)
+    ops = [
+        UpdateOne(
+            {"station_name": station_name, "timestamp": item["timestamp"], **({"rev": rev} if expected_revs is not None else {})},
+            {"$set": item, **update},
+            upsert=True,
+        )
+        for item, rev in zip(bucketed, revs)
+    ]
+    conflicts = []
+    try:
+        result = collection.bulk_write(ops, ordered=False)
+        upserted, matched, modified = result.upserted_count, result.matched_count, result.modified_count
+    except BulkWriteError as e:
+        if expected_revs is None or any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        conflicts = [bucketed[error["index"]]["timestamp"] for error in e.details["writeErrors"]]
+        upserted, matched, modified = e.details["nUpserted"], e.details["nMatched"], e.details["nModified"]
+
+    counts = {
+        "inserted": upserted,
+        "modified": modified,
+        "unchanged": matched - modified,
+    }
+    logging.info(f"#{station_name}: {collection.name} buckets inserted: {counts['inserted']} modified: {counts['modified']} unchanged: {counts['unchanged']} conflicts: {len(conflicts)}")
+
+    db.bucket_props.update_one(
+        {"_id": station_name},
+        {"$inc": {f"bucket_writes.{key}": value for key, value in counts.items()}},
+        upsert=True
+    )
+
+    return {**counts, "conflicts": conflicts}
+
+
+def _fold_bucket_state(doc, state_name, points, raw_collection_name, station_name, key_ms, new_state, fold_state):
+    """
+    Folds points into the state saved in the bucket doc. Buckets saved without the state
+    (by create_average_values) are rebuilt from the raw samples, which already contain the points.
+    """
+    if doc is None:
+        state = new_state()
+    elif doc.get(state_name) is None:
+        state = new_state()
+        points = get_raw_bucket_points(raw_collection_name, station_name, key_ms)
+    else:
+        state = doc[state_name]
+
+    return fold_state(state, points)
+
+
+def update_average_values(station_name, t_ms, winds, dirs, upload_id=None):
+    """
+    Single pass rollup of one upload. Folds the freshly saved wind and direction samples
+    (masked arrays, sampled at the epoch ms in t_ms) into the 15 minute buckets they fall into
+    and saves every touched bucket as one document with both the wind and the direction values.
+    Only the touched buckets are read and rewritten, the raw samples are only read for buckets
+    saved without the running state.
+
+    Every bucket has a rev that is incremented on each write. A bucket is only saved if its
+    rev is still the one it was read with, the buckets another upload of the station changed
+    in between are read and merged again, so concurrent uploads don't drop each other's samples.
+
+    The buckets keep the upload_ids of the last uploads folded into them, the buckets a failed
+    attempt of the upload already saved are skipped when it is retried.
+    """
+    wind_valid = ~np.ma.getmaskarray(winds)
+    dir_valid = ~np.ma.getmaskarray(dirs)
+    wind_groups = bucketing.group_by_bucket_np(t_ms[wind_valid], winds.data[wind_valid])
+    dir_groups = bucketing.group_by_bucket_np(t_ms[dir_valid], dirs.data[dir_valid])
+    keys = sorted(wind_groups.keys() | dir_groups.keys())
+    if not keys:
         return
-    
-    for data in dirs_bucketed:
-        data["station_name"] = station_name
-        
-    set_last_bucket_filled(station_name, last_bucket_filed_ms, "dir")
 
-    logging.info(f"#{station_name}: dir bucketed values: {pprint.pformat(dirs_bucketed)}")
-    timestamps = [item["timestamp"] for item in dirs_bucketed]
-    db.dir_bucketed.delete_many({"timestamp": {"$in": timestamps}, "station_name": station_name})
-    db.dir_bucketed.insert_many(dirs_bucketed)
+    speed_rpm_to_ms = get_station_speed_to_rpm(station_name)
+
+    written = []
+    result = {"inserted": 0, "modified": 0, "unchanged": 0}
+    pending = keys
+    for attempt in range(BUCKET_WRITE_ATTEMPTS):
+        docs = get_bucket_docs(db.wind_bucketed, station_name, pending)
+
+        bucketed = []
+        revs = []
+        for key_ms in pending:
+            doc = docs.get(key_ms)
+            if upload_id is not None and doc is not None and upload_id in doc.get("upload_ids", []):
+                logging.warning(f"#{station_name}: upload {upload_id} is already in the bucket {_ms_to_datetime(key_ms)}")
+                continue
+
+            new_doc = dict(doc) if doc is not None else {}
+            revs.append(new_doc.get("rev"))
+            new_doc["rev"] = (new_doc.get("rev") or 0) + 1
+            if upload_id is not None:
+                new_doc["upload_ids"] = (new_doc.get("upload_ids", []) + [upload_id])[-BUCKET_UPLOAD_IDS:]
+
+            if key_ms in wind_groups:
+                state = _fold_bucket_state(
+                    doc, "wind_state", wind_groups[key_ms], "winds", station_name, key_ms,
+                    bucketing.new_wind_state,
+                    lambda state, points: bucketing.fold_wind_state(state, (y for _, y in points)),
+                )
+                new_doc.update(to_bucket_doc(station_name, key_ms, wind=bucketing.wind_state_values(state), speed_rpm_to_ms=speed_rpm_to_ms))
+                new_doc["wind_state"] = state
+
+            if key_ms in dir_groups:
+                state = _fold_bucket_state(
+                    doc, "dir_state", dir_groups[key_ms], "dirs", station_name, key_ms,
+                    bucketing.new_dir_state,
+                    lambda state, points: bucketing.fold_dir_state(state, ((x, bucketing.dir_sector(y)) for x, y in points)),
+                )
+                new_doc.update(to_bucket_doc(station_name, key_ms, dir_mode=bucketing.dir_state_mode(state)))
+                new_doc["dir_state"] = state
+
+            bucketed.append(new_doc)
+
+        logging.info(f"#{station_name}: updating {len(bucketed)} buckets")
+        counts = write_buckets(db.wind_bucketed, station_name, bucketed, expected_revs=revs)
+        result = {key: result[key] + counts[key] for key in result}
+        written += [doc for doc in bucketed if doc["timestamp"] not in counts["conflicts"]]
+        if not counts["conflicts"]:
+            break
+
+        pending = [_timestamp_ms(timestamp) for timestamp in counts["conflicts"]]
+        logging.info(f"#{station_name}: {len(pending)} buckets were changed by another upload, merging them again")
+    else:
+        raise RuntimeError(f"#{station_name}: buckets {pending} still changed by other uploads after {BUCKET_WRITE_ATTEMPTS} attempts")
+
+    if written:
+        newest = max(written, key=lambda doc: doc["timestamp"])
+        set_station_latest(station_name, "wind", {f: newest[f] for f in LATEST_WIND_FIELDS if f in newest})
+
+    update_rollups(station_name, keys)
+    return result
+
+
+def _fill_missing_states(station_name, buckets):
+    """
+    Rebuilds the running states of the 15 minute buckets saved without them (by
+    create_average_values) from the raw samples, with one read for all of them.
+    The states are set in the buckets, save_missing_states saves them.
+    """
+    missing = [b for b in buckets if "wind_state" not in b and "dir_state" not in b]
+    if not missing:
+        return
+
+    keys = [_timestamp_ms(b["timestamp"]) for b in missing]
+    start_ms = bucketing.bucket_range_ms(min(keys))[0]
+    end_ms = bucketing.bucket_range_ms(max(keys))[1]
+    logging.info(f"#{station_name}: rebuilding the state of {len(missing)} buckets from the raw samples")
+
+    for state_name, collection_name, new_state, fold_state in (
+        ("wind_state", "winds", bucketing.new_wind_state,
+            lambda state, points: bucketing.fold_wind_state(state, (y for _, y in points))),
+        ("dir_state", "dirs", bucketing.new_dir_state,
+            lambda state, points: bucketing.fold_dir_state(state, ((x, bucketing.dir_sector(y)) for x, y in points))),
+    ):
+        points = [
+            (_timestamp_ms(doc["timestamp"]), doc["value"])
+            for doc in find_raw_samples(collection_name, station_name, _ms_to_datetime(start_ms), _ms_to_datetime(end_ms))
+        ]
+        groups = bucketing.group_by_bucket(points)
+        for bucket, key_ms in zip(missing, keys):
+            if key_ms in groups:
+                bucket[state_name] = fold_state(new_state(), groups[key_ms])
+
+
+def _rollup_from_values(group, speed_rpm_to_ms):
+    """
+    (wind in rpm, dir) of a rollup bucket whose 15 minute buckets aren't all saved with a state,
+    from their saved values. The buckets without a state weigh as much as the average one with it.
+    """
+    counts = [c["wind_state"]["n"] for c in group if c.get("wind_state")]
+    default_weight = sum(counts) / len(counts) if counts else 1
+
+    def rpm(child, field):
+        if child.get(f"{field}_rpm") is not None:
+            return child[f"{field}_rpm"]
+        return child[field] / speed_rpm_to_ms if child.get(field) is not None else None
+
+    values = [
+        {
+            "weight": c["wind_state"]["n"] if c.get("wind_state") else default_weight,
+            "avg": rpm(c, "avg"),
+            "max": rpm(c, "max"),
+            "dir": c.get("dir"),
+        }
+        for c in sorted(group, key=lambda c: c["timestamp"])
+    ]
+    return bucketing.merge_bucket_values(values)
+
+ROLLUP_FIELDS = {"_id": 0, "timestamp": 1, "wind_state": 1, "dir_state": 1, "avg": 1, "max": 1, "avg_rpm": 1, "max_rpm": 1, "dir": 1}
+
+def _has_state(bucket):
+    return "wind_state" in bucket or "dir_state" in bucket
+
+def _rollup_sources(station_name, tier, tier_keys):
+    """
+    {key: the buckets it is merged from} of the buckets tier_keys of WIND_TIERS[tier]. An hour
+    is merged from its 15 minute buckets. A day from its hours, and from the 15 minute buckets
+    at its ends that the hours around midnight share with the day before or after it. A day with
+    an hour saved without a state is made from all its 15 minute buckets.
+    """
+    _, minutes = WIND_TIERS[tier]
+    ranges = {key: bucketing.tier_range_ms(key, minutes) for key in tier_keys}
+    sources = {key: [] for key in tier_keys}
+    child_ranges = list(ranges.values())
+
+    if tier > 1:
+        lower_name, lower_minutes = WIND_TIERS[tier - 1]
+        child_ranges = []
+        for key, (start_ms, end_ms) in ranges.items():
+            lower_keys = [
+                k for k in range(bucketing.tier_key_ms(start_ms, lower_minutes), end_ms, lower_minutes * 60_000)
+                if bucketing.tier_range_ms(k, lower_minutes)[0] >= start_ms and bucketing.tier_range_ms(k, lower_minutes)[1] <= end_ms
+            ]
+            lower = []
+            if lower_keys:
+                inner_start_ms = bucketing.tier_range_ms(lower_keys[0], lower_minutes)[0]
+                inner_end_ms = bucketing.tier_range_ms(lower_keys[-1], lower_minutes)[1]
+                lower = list(db[lower_name].find(
+                    {"station_name": station_name, "timestamp": {"$gte": _ms_to_datetime(lower_keys[0]), "$lte": _ms_to_datetime(lower_keys[-1])}},
+                    ROLLUP_FIELDS
+                ))
+
+            if lower_keys and all(_has_state(b) for b in lower):
+                sources[key] = lower
+                child_ranges += [(start_ms, inner_start_ms), (inner_end_ms, end_ms)]
+            else:
+                child_ranges.append((start_ms, end_ms))
+
+    child_ranges = [(start_ms, end_ms) for start_ms, end_ms in child_ranges if start_ms < end_ms]
+    if child_ranges:
+        children = db.wind_bucketed.find(
+            {"station_name": station_name, "$or": [
+                {"timestamp": {"$gte": _ms_to_datetime(start_ms), "$lt": _ms_to_datetime(end_ms)}}
+                for start_ms, end_ms in child_ranges
+            ]},
+            ROLLUP_FIELDS
+        )
+        for child in children:
+            key = bucketing.tier_key_ms(_timestamp_ms(child["timestamp"]), minutes)
+            if key in sources:
+                sources[key].append(child)
+    return sources
+
+def update_rollups(station_name, keys_ms):
+    """
+    Updates the hourly and the daily buckets containing the 15 minute buckets keys_ms. Only
+    the touched hours read their 15 minute buckets, a day is merged from its (at most 25)
+    hours, see _rollup_sources. Every rollup bucket merges the saved states (not just the
+    new samples), so a bucket updated by several uploads is never counted twice.
+
+    Rollup buckets with old 15 minute buckets saved without a state are made from their saved
+    avg / max / dir. The uploads don't read raw samples, rebuild_rollups saves the states of
+    the old buckets whose raw samples are still there once.
+    """
+    if not keys_ms:
+        return
+
+    speed_rpm_to_ms = get_station_speed_to_rpm(station_name)
+    for tier, (name, minutes) in enumerate(WIND_TIERS[1:], start=1):
+        tier_keys = sorted({bucketing.tier_key_ms(k, minutes) for k in keys_ms})
+        sources = _rollup_sources(station_name, tier, tier_keys)
+
+        bucketed = []
+        from_values = []
+        for key_ms in tier_keys:
+            group = sources[key_ms]
+            if not all(_has_state(b) for b in group):
+                wind, dir_mode = _rollup_from_values(group, speed_rpm_to_ms)
+                if wind is not None or dir_mode is not None:
+                    from_values.append(to_bucket_doc(station_name, key_ms, wind=wind, dir_mode=dir_mode, speed_rpm_to_ms=speed_rpm_to_ms))
+                continue
+
+            wind_states = [b["wind_state"] for b in group if b.get("wind_state") and b["wind_state"]["n"] > 0]
+            dir_states = [b["dir_state"] for b in group if b.get("dir_state") and b["dir_state"]["n"] > 0]
+            if not wind_states and not dir_states:
+                continue
+
+            # the tiers merged again keep all the top values, see bucketing.merge_wind_states
+            wind_state = bucketing.merge_wind_states(wind_states, keep_all_top=tier < len(WIND_TIERS) - 1) if wind_states else None
+            dir_state = bucketing.merge_dir_states(dir_states) if dir_states else None
+            doc = to_bucket_doc(
+                station_name, key_ms,
+                wind=bucketing.wind_state_values(wind_state) if wind_state else None,
+                dir_mode=bucketing.dir_state_mode(dir_state) if dir_state else None,
+                speed_rpm_to_ms=speed_rpm_to_ms,
+            )
+            if wind_state:
+                doc["wind_state"] = wind_state
+            if dir_state:
+                doc["dir_state"] = dir_state
+            bucketed.append(doc)
+
+        write_buckets(db[name], station_name, bucketed)
+        # their states would only cover a part of the samples
+        write_buckets(db[name], station_name, from_values, unset_fields=("wind_state", "dir_state"))
+
+
+def save_missing_states(station_name, keys_ms):
+    """
+    Saves the running states of the 15 minute buckets keys_ms saved without them, rebuilt from
+    the raw samples that are still there. Returns how many buckets got a state.
+    """
+    buckets = list(db.wind_bucketed.find(
+        {"station_name": station_name, "timestamp": {"$in": [_ms_to_datetime(k) for k in keys_ms]}},
+        {"_id": 0, "timestamp": 1, "wind_state": 1, "dir_state": 1}
+    ))
+    missing = [b for b in buckets if not _has_state(b)]
+    _fill_missing_states(station_name, missing)
+
+    ops = [
+        # an upload folded into the bucket meanwhile saved its own state
+        UpdateOne(
+            {"station_name": station_name, "timestamp": b["timestamp"], "wind_state": {"$exists": False}, "dir_state": {"$exists": False}},
+            {"$set": {k: b[k] for k in ("wind_state", "dir_state") if k in b}, "$inc": {"rev": 1}},
+        )
+        for b in missing if _has_state(b)
+    ]
+    if ops:
+        db.wind_bucketed.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def rebuild_rollups(station_name, test_run=True, chunk_buckets=7 * 96):
+    """
+    Builds the rollup tiers from all the 15 minute buckets of the station, a week of
+    buckets at a time. The old buckets saved without a state get it from their raw samples
+    first (save_missing_states), the uploads only fold into buckets with a state.
+    Returns how many 15 minute buckets were rolled up.
+    """
+    keys = [
+        _timestamp_ms(doc["timestamp"])
+        for doc in db.wind_bucketed.find({"station_name": station_name}, {"_id": 0, "timestamp": 1}).sort("timestamp", 1)
+    ]
+    logging.info(f"#{station_name}: rolling up {len(keys)} buckets")
+    if test_run:
+        return len(keys)
+
+    for i in range(0, len(keys), chunk_buckets):
+        filled = save_missing_states(station_name, keys[i:i + chunk_buckets])
+        if filled:
+            logging.info(f"#{station_name}: saved the state of {filled} buckets from the raw samples")
+        update_rollups(station_name, keys[i:i + chunk_buckets])
+
+    return len(keys)
+
+
+def merge_dir_bucketed(test_run=True):
+    """
+    One-off migration: copies the direction mode (and state) of every dir_bucketed
+    document into the wind_bucketed document with the same station and timestamp.
+    """
+    ops = []
+    for doc in db.dir_bucketed.find({}, {"_id": 0}):
+        fields = {"dir": doc.get("mode")}
+        if "dir_state" in doc:
+            fields["dir_state"] = doc["dir_state"]
+
+        ops.append(
+            UpdateOne(
+                {"station_name": doc["station_name"], "timestamp": doc["timestamp"]},
+                {"$set": fields},
+                upsert=True,
+            )
+        )
+
+    logging.info(f"Merging {len(ops)} dir_bucketed documents into wind_bucketed")
+    if test_run or not ops:
+        return len(ops)
+
+    for i in range(0, len(ops), 1000):
+        db.wind_bucketed.bulk_write(ops[i:i + 1000], ordered=False)
+
+    return len(ops)
+
+
+def dedup_bucketed(collection_name="wind_bucketed", test_run=True):
+    """
+    One-off migration for the unique (station_name, timestamp) index: keeps the newest
+    document of every duplicated bucket, removes the rest and replaces the old non unique index.
+    """
+    collection = db[collection_name]
+    duplicates = collection.aggregate([
+        {"$group": {
+            "_id": {"station_name": "$station_name", "timestamp": "$timestamp"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+
+    ids_to_delete = []
+    for group in duplicates:
+        ids_to_delete.extend(sorted(group["ids"])[:-1])
+
+    logging.info(f"{collection_name}: removing {len(ids_to_delete)} duplicated buckets")
+    if test_run:
+        return len(ids_to_delete)
+
+    for i in range(0, len(ids_to_delete), 1000):
+        collection.delete_many({"_id": {"$in": ids_to_delete[i:i + 1000]}})
+
+    index_keys = [("station_name", 1), ("timestamp", -1)]
+    for name, index in collection.index_information().items():
+        if index["key"] == index_keys and not index.get("unique"):
+            collection.drop_index(name)
+
+    collection.create_index(index_keys, unique=True)
+    return len(ids_to_delete)
+
+
+def convert_raw_to_columnar(test_run=True, chunk_size=120):
+    """
+    One-off migration for RAW_STORAGE="columnar": packs the per sample winds / dirs documents
+    into wind_uploads documents of up to chunk_size samples, with the sample times saved in t_ms.
+    Only samples newer than the last packed upload of the station are converted, so it can be rerun.
+    The original documents are kept, they are archived as usual.
+    """
+    total = 0
+    station_names = set(db.winds.distinct("station_name")) | set(db.dirs.distinct("station_name"))
+    for station_name in sorted(station_names):
+        last_upload = db.wind_uploads.find_one({"station_name": station_name}, {"_id": 0, "timestamp_last": 1}, sort=[("timestamp_last", -1)])
+        query = {"station_name": station_name}
+        if last_upload is not None:
+            query["timestamp"] = {"$gt": last_upload["timestamp_last"]}
+
+        samples = {}
+        for doc in db.winds.find(query, {"_id": 0, "timestamp": 1, "value": 1}):
+            samples.setdefault(doc["timestamp"], [None, None])[0] = doc["value"]
+
+        # the uploads keep the raw directions, the reads add the dir_adjustment of the station. The old
+        # documents without value_raw are already adjusted, the current adjustment is taken off them
+        dir_adjustment = get_station_dir_adjustment(station_name)
+        for doc in db.dirs.find(query, {"_id": 0, "timestamp": 1, "value": 1, "value_raw": 1}):
+            value_raw = doc["value_raw"] if "value_raw" in doc else (doc["value"] - dir_adjustment) % 360
+            samples.setdefault(doc["timestamp"], [None, None])[1] = value_raw
+
+        timestamps = sorted(samples.keys())
+        uploads = []
+        for i in range(0, len(timestamps), chunk_size):
+            chunk = timestamps[i:i + chunk_size]
+            first_ms = _timestamp_ms(chunk[0])
+            uploads.append({
+                "station_name": station_name,
+                "timestamp": chunk[0],
+                "timestamp_last": chunk[-1],
+                "len": len(chunk),
+                "t_ms": [_timestamp_ms(t) - first_ms for t in chunk],
+                "avg": [samples[t][0] for t in chunk],
+                "dir": [samples[t][1] for t in chunk],
+            })
+
+        logging.info(f"#{station_name}: packing {len(timestamps)} samples into {len(uploads)} uploads")
+        total += len(uploads)
+        if not test_run and uploads:
+            db.wind_uploads.insert_many(uploads)
+
+    return total
+
+
+# migrate_to_timeseries only renames a collection nothing was inserted into for this long
+MIGRATION_IDLE_SECONDS = 120
+
+def migrate_to_timeseries(name, batch_size=5000, test_run=True):
+    """
+    Converts a plain collection to a time-series collection. The plain collection is renamed
+    to <name>_plain, a time-series collection is created in its place and the documents are
+    copied over in batches ordered by _id. The last copied _id is saved in db.migrations,
+    so an interrupted migration continues where it stopped: the batch it was copying is
+    deleted from the time-series collection and copied again. <name>_plain is kept, drop it by hand.
+
+    The ingest has to be stopped (flask-app and flask-app-worker) until the migration is done,
+    an upload saved between the rename and the creation of the time-series collection would
+    create a plain collection again. The rename is refused when documents were inserted in
+    the last MIGRATION_IDLE_SECONDS.
+    """
+    plain_name = name + "_plain"
+    existing = set(db.list_collection_names())
+
+    if test_run:
+        source = plain_name if plain_name in existing else name
+        count = db[source].count_documents({}) if source in existing else 0
+        logging.info(f"{name}: {count} documents would be copied to the time-series collection")
+        return count
+
+    if name in existing and not is_timeseries_collection(name):
+        if plain_name in existing:
+            raise ValueError(f"Both {name} and {plain_name} are plain collections, cant migrate {name}")
+        newest = db[name].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        if newest is not None and isinstance(newest["_id"], ObjectId):
+            idle_seconds = (datetime.now(TZ) - newest["_id"].generation_time).total_seconds()
+            if idle_seconds < MIGRATION_IDLE_SECONDS:
+                raise ValueError(f"{name} was written {idle_seconds:.0f}s ago, stop the ingest (flask-app, flask-app-worker) before migrating it")
+        db[name].rename(plain_name)
+        existing = set(db.list_collection_names())
+
+    if name not in existing:
+        create_timeseries_collection(name)
+
+    if plain_name not in existing:
+        logging.info(f"{name}: nothing to migrate")
+        return 0
+
+    progress_id = "timeseries_" + name
+    progress = db.migrations.find_one({"_id": progress_id}) or {}
+    last_id = progress.get("last_id")
+    copied = progress.get("copied", 0)
+    first_batch = True
+
+    while True:
+        query = {"timestamp": {"$type": "date"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = list(db[plain_name].find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        if first_batch:
+            # a migration interrupted before it saved the progress may have copied a part of it
+            db[name].delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+            first_batch = False
+
+        db[name].insert_many(batch, ordered=False)
+        last_id = batch[-1]["_id"]
+        copied += len(batch)
+
+        db.migrations.update_one(
+            {"_id": progress_id},
+            {"$set": {"last_id": last_id, "copied": copied, "updated_on": datetime.now(TZ)}},
+            upsert=True
+        )
+        logging.info(f"{name}: copied {copied} documents to the time-series collection")
+
+    return copied
+
+
+def backfill_typed_statuses(batch_size=1000, test_run=True):
+    """
+    Converts the numeric fields of the statuses saved before the typed status schema
+    (status_schema.coerce), in batches ordered by _id. The last converted _id is saved in
+    db.migrations, so an interrupted backfill continues where it stopped.
+    Returns how many statuses were changed.
+    """
+    progress_id = "typed_statuses"
+    progress = db.migrations.find_one({"_id": progress_id}) or {}
+    last_id = progress.get("last_id")
+    changed = progress.get("changed", 0)
+
+    # only the statuses with a numeric field still saved as text
+    string_fields = [{field: {"$type": "string"}} for field in status_schema.DEFAULT_SCHEMA]
+    if test_run:
+        count = db.statuses.count_documents({"$or": string_fields})
+        logging.info(f"statuses: {count} documents would be converted")
+        return count
+
+    while True:
+        query = {"$or": string_fields}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = list(db.statuses.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            typed, _ = status_schema.coerce(doc)
+            update = {key: typed[key] for key in status_schema.schema_for(doc.get("ver")) if key in doc and typed[key] != doc[key]}
+            if update:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+
+        if ops:
+            db.statuses.bulk_write(ops, ordered=False)
+        last_id = batch[-1]["_id"]
+        changed += len(ops)
+
+        db.migrations.update_one(
+            {"_id": progress_id},
+            {"$set": {"last_id": last_id, "changed": changed, "updated_on": datetime.now(TZ)}},
+            upsert=True
+        )
+        logging.info(f"statuses: converted {changed} documents")
+
+    return changed
+
+
+def raw_storage_report(station_name, duration_hours=12):
+    """ Size of the raw sample collections and the time to read duration_hours of samples from each """
+    report = {}
+    for name in ["winds", "dirs", "wind_uploads"]:
+        stats = db.command("collStats", name)
+        report[name] = {key: stats.get(key, 0) for key in ["count", "size", "avgObjSize", "storageSize", "totalIndexSize"]}
+
+    start_time = datetime.now(TZ) - timedelta(hours=duration_hours)
+    for storage in ["documents", "columnar"]:
+        start = datetime.now()
+        n_samples = sum(len(list(find_raw_samples(name, station_name, start_time, storage=storage))) for name in ["winds", "dirs"])
+        report["read_" + storage] = {
+            "samples": n_samples,
+            "ms": round((datetime.now() - start).total_seconds() * 1000, 1),
+        }
+
+    return report
 
 
 
@@ -1175,116 +2472,6 @@ def get_hour_min_sec(ms):
     dt = datetime.fromtimestamp(ms / 1000, tz=TZ)
     return dt.strftime("%H:%M:%S")
 
-def bucket_aggregate(points: List[Dict[str, Any]], minutes: int = 15, modes: List[str] = []) -> List[Dict[str, float]]:
-    """
-    Bucket time-series points into fixed windows and aggregate their y-values.
-    """
-    if not points:
-        return None, None
-
-    W = minutes * 60_000  # window size in ms
-
-    def start_of_day_ms(t_ms: int) -> int:
-        # local time (to mirror JavaScript Date behavior)
-        dt = datetime.fromtimestamp(t_ms / 1000.0).replace(hour=0, minute=0, second=0, microsecond=0)
-        # shift to the middle of the bucket
-        shift = timedelta(minutes=minutes / 2.0)
-        return int((dt + shift).timestamp() * 1000)
-
-    day0 = start_of_day_ms(points[0]["x"])
-    buckets: Dict[int, Dict[str, Any]] = {}
-
-    bucket_index = 0
-    for p in points:
-        x = p["x"]; y = p["y"]
-        k = day0 + floor((x - day0) / W) * W + W // 2
-        if bucket_index != k:
-            bucket_index = k
-
-        b = buckets.get(k)
-        if b is None:
-            # store whole point for first/last/min/max semantics
-            b = {"ys": [], "xs": [], "min": p, "max": p}
-            buckets[k] = b
-        b["ys"].append(y)
-        b["xs"].append(x)
-        if y < b["min"]["y"]:   b["min"]   = p
-        if y > b["max"]["y"]:   b["max"]   = p
-
-    def median(arr: List[float]) -> float:
-        n = len(arr)
-        if n == 0: return nan
-        s = sorted(arr)
-        m = n // 2
-        return s[m] if n % 2 else (s[m - 1] + s[m]) / 2.0
-
-    def mode_value(arr: List[float]) -> float:
-        # match JS behavior: first value to reach the highest count wins
-        if not arr: return nan
-        counts: Dict[float, int] = {}
-        best_val = arr[0]
-        best_cnt = 0
-        for v in arr:
-            counts[v] = counts.get(v, 0) + 1
-            c = counts[v]
-            if c > best_cnt:
-                best_cnt = c
-                best_val = v
-        return best_val
-
-    def max_10_mean(arr: List[float]) -> float:
-        """
-        Average of the maximum 10% values in arr.
-        Uses at least 1 value to avoid empty slices.
-        """
-        n = len(arr)
-        if n == 0:
-            return nan
-        take = max(1, int(ceil(n * 0.10)))
-        top = sorted(arr, reverse=True)[:take]
-        return sum(top) / len(top)
-
-    out: List[Dict[str, float]] = []
-
-    last_bucket_filed_x = 0
-    for k in sorted(buckets.keys()):
-        b = buckets[k]
-        ys = b["ys"]
-        last_bucket_filed_x = min(b["xs"])
-
-        timestamp = datetime.fromtimestamp(float(k) / 1000, tz=TZ)
-        out_data = {"timestamp": timestamp}
-
-        for mode in modes:
-            out_value = -123
-            if mode == "min":
-                out_value = b["min"]["y"]
-
-            elif mode == "max":
-                out_value = max_10_mean(ys) #b["max"]["y"]
-
-            elif mode == "median":
-                out_value = median(ys)
-
-            elif mode == "mode":
-                out_value = mode_value(ys)
-
-            elif mode == "max_10":
-                out_value = max_10_mean(ys)
-
-            elif mode == "mean" or mode == "avg":
-                out_value = sum(ys) / len(ys)
-
-            else:
-                logging.critical(f"Non existing mode: {mode} for modes:{modes}")
-
-            out_data[mode] = round(out_value, 2)
-
-        out.append(out_data)
-
-    # last_bucket_filed_x is the most largest key that was in a bucket that wasnt fully filled
-    return out, last_bucket_filed_x
-
 """
     db.statuses.delete_many({})
     db.winds.delete_many({})
@@ -1378,37 +2565,73 @@ def add_station_name_to_collection(collection_name, station_name, test_run = Tru
 
 
 
-def append_vbat_chane_rate():
-    # WARNING check to make sure that it works before runnign!!
-    start_time = datetime.now(TZ) - timedelta(days=4)
-    statuses = list(db.statuses.find(
-        {"timestamp": {"$gte": start_time}}, 
-        {} # "_id":0, "temp":1, "hum":1, "timestamp":1
-        ).sort("timestamp", 1))
-
-    ops = []
-    rates = []
-    for doc in statuses:
-        #parse_error_values(doc)
-        calc_vbat_change_rate(doc)
-
-        rates.append((doc["vbat_rate1"], doc["vbat_rate2"]))
-        doc_id = doc["_id"]
-        doc.pop("_id", None)   # _id must NOT be inside $set
-        
-        ops.append(
-            UpdateOne(
-                {"_id": doc_id},
-                {
-                    "$set": doc,
-                }
-            )
-        )
-
-    if ops:
-        pprint.pprint(rates)
-        #pprint.pprint(ops)
-        #db.statuses.bulk_write(ops, ordered=False)
+def backfill_vbat_rates(batch_size=2000, test_run=True):
+    """
+    One-off migration: saves the vbat_rate of the statuses saved before it was calculated on
+    ingest, with vbat_rate.rolling_slopes on batches of batch_size statuses of a station. The
+    last written timestamp of every station is saved in db.migrations, an interrupted
+    backfill continues where it stopped.
+    """
+    if test_run:
+        count = db.statuses.count_documents({"vbatIde": {"$exists": True}})
+        logging.info(f"statuses with vbatIde to calculate the vbat_rate of: {count}")
+        return count
+
+    def write(ids, t_ms, values, n_context):
+        rates = vbat_rate.rolling_slopes(t_ms, values)
+        db.statuses.bulk_write([
+            UpdateOne({"_id": _id}, {"$set": {"vbat_rate": None if np.isnan(rate) else round(float(rate), 2)}})
+            for _id, rate in zip(ids[n_context:], rates[n_context:])
+        ], ordered=False)
+
+    total = 0
+    for station in get_stations():
+        name = station["name"]
+        progress_id = "vbat_rate_" + name
+        progress = db.migrations.find_one({"_id": progress_id}) or {}
+        query = {"station_name": {"$eq": name}, "vbatIde": {"$exists": True}}
+
+        # the statuses of the WINDOW before the first one of a batch are read again with it
+        ids, t_ms, values = [], [], []
+        last_timestamp = progress.get("last_timestamp")
+        if last_timestamp is not None:
+            context = db.statuses.find(
+                {**query, "timestamp": {"$gte": last_timestamp - WINDOW, "$lte": last_timestamp}},
+                {"timestamp": 1, "vbatIde": 1}
+            ).sort("timestamp", 1)
+            for status in context:
+                ids.append(status["_id"])
+                t_ms.append(_timestamp_ms(status["timestamp"]))
+                values.append(status_schema.number_or_none(status["vbatIde"]))
+            query["timestamp"] = {"$gt": last_timestamp}
+        n_context = len(ids)
+        saved = 0
+
+        cursor = db.statuses.find(query, {"timestamp": 1, "vbatIde": 1}).sort("timestamp", 1).batch_size(batch_size)
+        for status in cursor:
+            ids.append(status["_id"])
+            t_ms.append(_timestamp_ms(status["timestamp"]))
+            values.append(status_schema.number_or_none(status["vbatIde"]))
+            last_timestamp = status["timestamp"]
+
+            if len(ids) - n_context >= batch_size:
+                write(ids, t_ms, [nan if v is None else v for v in values], n_context)
+                saved += len(ids) - n_context
+                db.migrations.update_one({"_id": progress_id}, {"$set": {"last_timestamp": last_timestamp}}, upsert=True)
+
+                keep = next(i for i, t in enumerate(t_ms) if t >= t_ms[-1] - vbat_rate.WINDOW_MS)
+                ids, t_ms, values = ids[keep:], t_ms[keep:], values[keep:]
+                n_context = len(ids)
+
+        if len(ids) > n_context:
+            write(ids, t_ms, [nan if v is None else v for v in values], n_context)
+            saved += len(ids) - n_context
+            db.migrations.update_one({"_id": progress_id}, {"$set": {"last_timestamp": last_timestamp}}, upsert=True)
+        total += saved
+        logging.info(f"#{name}: vbat_rate saved: {saved}")
+
+    logging.info(f"vbat_rate saved: {total}")
+    return total
 
 
 def parse_errors_str(errors_str):
@@ -1511,8 +2734,7 @@ if __name__ == "__main__":
     #set_last_bucket_filled((datetime.now(TZ) - timedelta(days=7)).timestamp()*1000, "wind")
     #set_last_bucket_filled((datetime.now(TZ) - timedelta(days=7)).timestamp()*1000, "dir")
 
-    #create_average_wind_values()
-    #create_average_dir_values()
+    #create_average_values()
     
     #cursor = db.dir_bucketed.find({}, {}).sort("timestamp", 1)
 
@@ -1582,8 +2804,7 @@ if __name__ == "__main__":
     set_last_bucket_filled(station_name, (datetime.now(TZ) - timedelta(days=3)).timestamp()*1000, "wind")
     set_last_bucket_filled(station_name, (datetime.now(TZ) - timedelta(days=3)).timestamp()*1000, "dir")
     
-    create_average_wind_values(station_name)
-    create_average_dir_values(station_name)
+    create_average_values(station_name)
 
 
     result = db.statuses.update_many(
@@ -46,7 +46,7 @@ with open("logs/errors_peter_293400130736647.txt", "r") as f:
 
 station_name = "peter"
 app_db.set_last_bucket_filled(station_name, (datetime.now(TZ) - timedelta(hours=12)).timestamp()*1000, "wind")
-app_db.create_average_wind_values(station_name)
+app_db.create_average_values(station_name)
 
 print("Number of statuses:", db.statuses.count_documents({}))
 print("Number of winds:", db.winds.count_documents({}))
@@ -0,0 +1,121 @@
+"""
+Downsampling of the long time series for ?max_points=.
+
+All the functions return the sorted indices of the points to keep, so the rows (or the
+arrays) can be picked without being converted. None / NaN values are never preferred
+over real ones.
+
+- lttb_indices: Largest-Triangle-Three-Buckets, keeps the visual shape of smooth series
+  (temperature, status values).
+- min_max_indices: the lowest and the highest point of every bucket, for the wind speeds
+  where the gust peaks have to stay in the graph.
+- stride_indices: evenly spaced points, for values that can't be compared (directions).
+"""
+import numpy as np
+
+
+def _to_float(values):
+    """ float array with NaN for None and the values that are not numbers (e.g. "nan" strings) """
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        pass
+
+    result = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            result[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return result
+
+
+def stride_indices(length, max_points):
+    if max_points is None or length <= max_points:
+        return np.arange(length)
+    if max_points < 2:
+        return np.zeros(min(length, max_points), dtype=np.int64)
+
+    return np.unique(np.round(np.linspace(0, length - 1, max_points)).astype(np.int64))
+
+
+def _buckets(values, n_buckets, fill):
+    """ values split into n_buckets rows of equal size (the last one padded with fill) """
+    size = -(-len(values) // n_buckets)
+    padded = np.full(n_buckets * size, fill)
+    padded[:len(values)] = values
+    return padded.reshape(n_buckets, size), size
+
+
+def min_max_indices(values, max_points):
+    """ Index of the lowest and of the highest value in each of max_points // 2 buckets """
+    y = _to_float(values)
+    if max_points is None or len(y) <= max_points:
+        return np.arange(len(y))
+    if max_points < 2:
+        return stride_indices(len(y), max_points)
+
+    n_buckets = max_points // 2
+    highs, size = _buckets(np.where(np.isnan(y), -np.inf, y), n_buckets, -np.inf)
+    lows, _ = _buckets(np.where(np.isnan(y), np.inf, y), n_buckets, np.inf)
+
+    offsets = np.arange(n_buckets) * size
+    indices = np.concatenate([offsets + highs.argmax(axis=1), offsets + lows.argmin(axis=1)])
+    return np.unique(np.minimum(indices, len(y) - 1))
+
+
+def lttb_indices(x, values, max_points):
+    """
+    Largest-Triangle-Three-Buckets: the first and the last point are kept, from every bucket in
+    between the point making the largest triangle with the point kept before it and the
+    average of the next bucket.
+    """
+    y = _to_float(values)
+    x = np.asarray(x, dtype=float)
+    length = len(y)
+    if max_points is None or length <= max_points:
+        return np.arange(length)
+    if max_points < 3:
+        return stride_indices(length, max_points)
+
+    # bucket edges of the points between the first and the last one
+    edges = np.linspace(1, length - 1, max_points - 1).astype(np.int64)
+    valid = ~np.isnan(y)
+    y_filled = np.where(valid, y, 0.0)
+
+    # average of every bucket, computed at once with the cumulative sums
+    cum_x = np.concatenate([[0.0], np.cumsum(np.where(valid, x, 0.0))])
+    cum_y = np.concatenate([[0.0], np.cumsum(y_filled)])
+    cum_n = np.concatenate([[0], np.cumsum(valid)])
+    counts = cum_n[edges[1:]] - cum_n[edges[:-1]]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_x = (cum_x[edges[1:]] - cum_x[edges[:-1]]) / counts
+        avg_y = (cum_y[edges[1:]] - cum_y[edges[:-1]]) / counts
+    # the last bucket is followed by the last point, buckets with no values by their middle
+    avg_x = np.append(avg_x, x[-1])
+    avg_y = np.append(avg_y, y_filled[-1])
+    no_values = np.append(counts == 0, False)
+    avg_x[no_values] = x[(edges[:-1][no_values[:-1]] + edges[1:][no_values[:-1]]) // 2]
+    avg_y[no_values] = 0.0
+
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = length - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        bx = x[start:end]
+        by = y_filled[start:end]
+        areas = np.abs((x[a] - avg_x[i + 1]) * (by - y_filled[a]) - (x[a] - bx) * (avg_y[i + 1] - y_filled[a]))
+        areas[~valid[start:end]] = -1.0
+        a = start + int(areas.argmax())
+        indices[i + 1] = a
+
+    return np.unique(indices)
+
+
+def pick(items, indices):
+    """ The items at the indices, items unchanged when nothing is dropped """
+    if len(indices) == len(items):
+        return items
+    return [items[i] for i in indices]
@@ -0,0 +1,134 @@
+"""
+Durable ingest queue for INGEST_MODE=queue.
+
+/save only appends the raw payload with its receive time to the ingest_queue
+collection and answers the modem, ingest_worker.py does the parsing, inserts and
+bucketing. Jobs are split into partitions by station, every partition is handled by
+one worker thread, so the uploads of a station are never folded into the same
+buckets concurrently.
+
+A claimed job has a lease the worker renews while it saves the upload (heartbeat),
+only jobs whose worker stopped renewing it are claimed again. A job saved again
+after a failure or a lost lease passes its _id as the upload_id to
+save_received_data, which doesn't save what the earlier attempt already saved.
+"""
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+import db as app_db
+
+TZ = ZoneInfo("Europe/Berlin")
+UTC = ZoneInfo("UTC")
+
+INGEST_MODE = os.environ.get("INGEST_MODE", "sync")  # "sync" or "queue"
+INGEST_QUEUE_MAX = int(os.environ.get("INGEST_QUEUE_MAX", "5000"))
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", "5"))
+INGEST_PARTITIONS = 16
+INGEST_RETRY_SECONDS = 10  # doubled on every failed attempt
+INGEST_STALE_MINUTES = 5  # jobs whose lease wasn't renewed for this long are claimed again
+INGEST_HEARTBEAT_SECONDS = 30  # how often the worker renews the lease of the job it is saving
+
+db = app_db.db
+
+
+def station_partition(station_name):
+    return zlib.crc32(station_name.encode("utf-8")) % INGEST_PARTITIONS
+
+
+def enqueue(line, station, timestamp):
+    """
+    Saves the upload to the queue. Returns False when the queue is full, the caller
+    then has to save the data synchronously (backpressure on the modems).
+    """
+    pending = db.ingest_queue.count_documents({"status": "pending"})
+    if pending >= INGEST_QUEUE_MAX:
+        logging.warning(f"#{station['name']}: ingest queue is full ({pending} jobs), saving synchronously")
+        return False
+
+    db.ingest_queue.insert_one({
+        "station_name": station["name"],
+        "imsi": station.get("imsi"),
+        "partition": station_partition(station["name"]),
+        "line": line,
+        "received_at": timestamp,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": timestamp,
+    })
+    return True
+
+
+def claim(partitions):
+    """
+    Claims the oldest job of the partitions that is due, or a job abandoned by a dead worker.
+    The job gets a new lease, renew / complete / fail only work with it.
+    """
+    now = datetime.now(TZ)
+    stale = now - timedelta(minutes=INGEST_STALE_MINUTES)
+    return db.ingest_queue.find_one_and_update(
+        {
+            "partition": {"$in": partitions},
+            "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "processing", "heartbeat_at": {"$lt": stale}},
+                {"status": "processing", "heartbeat_at": {"$exists": False}, "claimed_at": {"$lt": stale}},
+            ],
+        },
+        {"$set": {"status": "processing", "claimed_at": now, "heartbeat_at": now, "lease": ObjectId()}, "$inc": {"attempts": 1}},
+        sort=[("received_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _leased(job):
+    return {"_id": job["_id"], "lease": job["lease"]}
+
+
+def renew(job):
+    """ Renews the lease of the job, False when another worker has claimed it since """
+    result = db.ingest_queue.update_one(_leased(job), {"$set": {"heartbeat_at": datetime.now(TZ)}})
+    return result.matched_count == 1
+
+
+def received_at(job):
+    # pymongo returns naive UTC datetimes, the parsing needs the local date
+    return job["received_at"].replace(tzinfo=UTC).astimezone(TZ)
+
+
+def complete(job):
+    lag = datetime.now(TZ) - received_at(job)
+    if db.ingest_queue.delete_one(_leased(job)).deleted_count == 0:
+        logging.warning(f"#{job['station_name']}: upload was claimed by another worker while it was saved")
+    logging.info(f"#{job['station_name']}: processed upload, lag: {lag.total_seconds():.1f}s attempts: {job['attempts']}")
+
+
+def fail(job, error):
+    if job["attempts"] >= INGEST_MAX_ATTEMPTS:
+        logging.error(f"#{job['station_name']}: giving up on upload after {job['attempts']} attempts: {error}")
+        db.ingest_queue.update_one(_leased(job), {"$set": {"status": "failed", "error": str(error)}})
+        return
+
+    retry_in = timedelta(seconds=INGEST_RETRY_SECONDS * 2 ** (job["attempts"] - 1))
+    logging.warning(f"#{job['station_name']}: upload failed, retrying in {retry_in}: {error}")
+    db.ingest_queue.update_one(
+        _leased(job),
+        {"$set": {"status": "pending", "next_attempt_at": datetime.now(TZ) + retry_in, "error": str(error)}}
+    )
+
+
+def get_stats():
+    """ Queue depth per status and the age of the oldest pending job (the processing lag) """
+    stats = {"pending": 0, "processing": 0, "failed": 0}
+    for group in db.ingest_queue.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        stats[group["_id"]] = group["count"]
+
+    oldest = db.ingest_queue.find_one({"status": "pending"}, {"received_at": 1}, sort=[("received_at", 1)])
+    stats["lag_seconds"] = (datetime.now(TZ) - received_at(oldest)).total_seconds() if oldest else 0.0
+
+    return stats
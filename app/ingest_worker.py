@@ -0,0 +1,74 @@
+"""
+Background workers for INGEST_MODE=queue, run as its own process:
+
+    python ingest_worker.py
+"""
+import logging
+import os
+import threading
+import time
+
+import db as app_db
+import ingest_queue
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "4"))
+POLL_INTERVAL_SECONDS = 1.0
+
+
+def process(job):
+    station = app_db.get_or_create_station(job["imsi"]) if job.get("imsi") else app_db.get_station_with_name(job["station_name"])
+    if station is None:
+        raise ValueError(f"Unknown station: {job['station_name']}")
+
+    app_db.save_received_data(job["line"], station, ingest_queue.received_at(job), upload_id=job["_id"])
+
+
+def heartbeat(job, done_event):
+    """ Renews the lease of the job until done_event is set, so a slow upload isn't claimed again """
+    while not done_event.wait(ingest_queue.INGEST_HEARTBEAT_SECONDS):
+        if not ingest_queue.renew(job):
+            logging.warning(f"#{job['station_name']}: lost the lease of the upload, another worker claimed it")
+            return
+
+
+def work(worker_index, n_workers, stop_event):
+    partitions = [p for p in range(ingest_queue.INGEST_PARTITIONS) if p % n_workers == worker_index]
+    logging.info(f"Ingest worker {worker_index} started, partitions: {partitions}")
+
+    while not stop_event.is_set():
+        job = ingest_queue.claim(partitions)
+        if job is None:
+            stop_event.wait(POLL_INTERVAL_SECONDS)
+            continue
+
+        done_event = threading.Event()
+        threading.Thread(target=heartbeat, args=(job, done_event), daemon=True).start()
+        try:
+            process(job)
+        except Exception as e:
+            logging.exception(f"#{job['station_name']}: Failed to save received data")
+            ingest_queue.fail(job, e)
+        else:
+            ingest_queue.complete(job)
+        finally:
+            done_event.set()
+
+
+if __name__ == "__main__":
+    stop_event = threading.Event()
+    n_workers = min(INGEST_WORKERS, ingest_queue.INGEST_PARTITIONS)
+    threads = [
+        threading.Thread(target=work, args=(i, n_workers, stop_event), daemon=True)
+        for i in range(n_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            time.sleep(60)
+            logging.info(f"Ingest queue: {ingest_queue.get_stats()}")
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,59 @@
+"""
+Flask JSON provider backed by orjson.
+
+orjson serializes NumPy scalars / arrays itself, so the read helpers can return the values
+as they come from the cursor. Datetimes are passed through to _default and written like
+before, as ISO strings in Europe/Berlin with the offset ("2025-03-10T21:00:00+01:00");
+naive ones are UTC, like pymongo returns them. The helpers don't convert any timestamps
+themselves, so all of a response is written the same way.
+"""
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import orjson
+from bson import ObjectId
+from flask.json.provider import JSONProvider
+import numpy as np
+
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+TZ = ZoneInfo("Europe/Berlin")
+UTC = ZoneInfo("UTC")
+
+
+def _default(obj):
+    """ The types orjson doesn't know, and the datetimes """
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=UTC)
+        return obj.astimezone(TZ).isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist() # dtypes OPT_SERIALIZE_NUMPY doesn't support, e.g. object
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj) -> bytes:
+    return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+
+class OrjsonProvider(JSONProvider):
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        # kwargs (sort_keys, indent, ...) of the stdlib provider are not supported
+        return dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,110 @@
+"""
+One-off data migrations.
+
+    python migrate.py <migration>           # dry run, only reports what would change
+    python migrate.py <migration> --apply
+    python migrate.py columnar-report --station peter
+
+The timeseries migration needs the ingest stopped: docker compose stop flask-app flask-app-worker
+"""
+import argparse
+import logging
+import pprint
+
+import db as app_db
+
+
+def merge_dir_buckets(args):
+    count = app_db.merge_dir_bucketed(test_run=not args.apply)
+    print(f"dir_bucketed documents merged into wind_bucketed: {count}")
+
+
+def dedup_buckets(args):
+    count = app_db.dedup_bucketed("wind_bucketed", test_run=not args.apply)
+    print(f"duplicated wind_bucketed documents removed: {count}")
+
+
+def convert_columnar(args):
+    count = app_db.convert_raw_to_columnar(test_run=not args.apply)
+    print(f"wind_uploads documents created: {count}")
+
+
+def columnar_report(args):
+    if not args.station:
+        raise SystemExit("columnar-report needs --station")
+
+    pprint.pprint(app_db.raw_storage_report(args.station))
+
+
+def timeseries(args):
+    names = [args.collection] if args.collection else list(app_db.TIMESERIES_COLLECTIONS.keys())
+    for name in names:
+        if name not in app_db.TIMESERIES_COLLECTIONS:
+            raise SystemExit(f"{name} can't be a time-series collection")
+
+        count = app_db.migrate_to_timeseries(name, test_run=not args.apply)
+        print(f"{name}: documents copied to the time-series collection: {count}")
+
+
+def station_latest(args):
+    names = [args.station] if args.station else [s["name"] for s in app_db.get_stations()]
+    if args.apply:
+        for name in names:
+            app_db.refresh_station_latest(name)
+    print(f"station_latest snapshots rebuilt: {len(names) if args.apply else 0} of {len(names)} stations")
+
+
+def rollups(args):
+    names = [args.station] if args.station else [s["name"] for s in app_db.get_stations()]
+    for name in names:
+        count = app_db.rebuild_rollups(name, test_run=not args.apply)
+        print(f"{name}: 15 minute buckets rolled up to the hourly and daily tiers: {count}")
+
+
+def status_fields(args):
+    count = app_db.build_status_fields(test_run=not args.apply)
+    print(f"stations with a status_fields catalog: {count}")
+    count = app_db.drop_status_key_indexes(test_run=not args.apply)
+    print(f"partial statuses indexes of single keys dropped: {count}")
+
+
+def typed_statuses(args):
+    count = app_db.backfill_typed_statuses(test_run=not args.apply)
+    print(f"statuses with numeric fields converted: {count}")
+
+
+def error_events(args):
+    count = app_db.backfill_error_events(test_run=not args.apply)
+    print(f"error_events saved from the statuses: {count}")
+
+
+def vbat_rates(args):
+    count = app_db.backfill_vbat_rates(test_run=not args.apply)
+    print(f"statuses with the vbat_rate calculated: {count}")
+
+
+MIGRATIONS = {
+    "merge-dir-buckets": merge_dir_buckets,
+    "dedup-buckets": dedup_buckets,
+    "convert-columnar": convert_columnar,
+    "columnar-report": columnar_report,
+    "timeseries": timeseries,
+    "station-latest": station_latest,
+    "rollups": rollups,
+    "status-fields": status_fields,
+    "typed-statuses": typed_statuses,
+    "error-events": error_events,
+    "vbat-rates": vbat_rates,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a one-off data migration")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS.keys()))
+    parser.add_argument("--apply", action="store_true", help="write the changes, without it only a dry run is made")
+    parser.add_argument("--station", help="station name, for the migrations that work on one station")
+    parser.add_argument("--collection", help="collection name, for the migrations that work on one collection")
+    args = parser.parse_args()
+
+    logging.info(f"Running migration '{args.migration}' apply: {args.apply}")
+    MIGRATIONS[args.migration](args)
@@ -0,0 +1,156 @@
+"""
+Parser for the `key=value;key=value;...` lines the stations upload.
+
+The line is split once, the known scalar fields are converted to their type from
+FIELD_TYPES and the sample arrays (avg, dir) are decoded straight into NumPy arrays
+with the negative values (the stations send -1 for a missing sample) masked.
+Malformed parts are counted in `malformed` instead of being logged one by one.
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+
+import status_schema
+
+# type of the known scalar fields, the others are kept as strings
+FIELD_TYPES = status_schema.DEFAULT_SCHEMA
+
+ARRAY_FIELDS = ("avg", "dir")
+
+DAY_SECONDS = 24 * 60 * 60
+# a station clock this much ahead of the server means the samples were logged before midnight
+MAX_CLOCK_AHEAD_SECONDS = 15 * 60
+
+INT64_MAX = np.iinfo(np.int64).max
+
+
+@dataclass
+class Payload:
+    raw: Dict[str, str] = field(default_factory=dict)  # values as sent, saved to the statuses
+    fields: Dict[str, object] = field(default_factory=dict)  # typed with FIELD_TYPES
+    arrays: Dict[str, np.ma.MaskedArray] = field(default_factory=dict)
+    malformed: Counter = field(default_factory=Counter)
+
+    def array_list(self, key):
+        """ The array as a list with None for the masked samples """
+        array = self.arrays.get(key)
+        if array is None:
+            return []
+        values = array.data.astype(object)
+        values[np.ma.getmaskarray(array)] = None
+        return values.tolist()
+
+
+def _to_type(value, value_type, malformed, key):
+    try:
+        return value_type(value)
+    except ValueError:
+        # e.g. "nan" in an int field, keep what was sent
+        malformed[f"bad_value:{key}"] += 1
+        return value
+
+
+def decode_array(value, malformed=None):
+    """
+    Decodes '12,-1,5' to a masked int array, the negative values and the items that
+    are not numbers are masked.
+    """
+    items = value.split(",")
+    try:
+        array = np.array(items, dtype=np.int64)
+        return np.ma.MaskedArray(array, mask=array < 0)
+    except (ValueError, OverflowError):
+        pass
+
+    # slow path, only for the broken lines: the conversion of the whole array raises on the first bad item
+    array = np.empty(len(items), dtype=np.int64)
+    mask = np.zeros(len(items), dtype=bool)
+    for i, item in enumerate(items):
+        item = item.strip()
+        digits = item.lstrip("-+")
+        if digits.isascii() and digits.isdigit() and abs(int(item)) <= INT64_MAX:
+            array[i] = int(item)
+            mask[i] = array[i] < 0
+        else:
+            array[i] = -1
+            mask[i] = True
+            if malformed is not None:
+                malformed["bad_array_item"] += 1
+
+    return np.ma.MaskedArray(array, mask=mask)
+
+
+def parse_payload(line: str) -> Payload:
+    payload = Payload()
+    malformed = payload.malformed
+
+    for part in line.split(";"):
+        if not part:
+            continue
+
+        key, sep, value = part.partition("=")
+        if not sep:
+            malformed["missing_equals"] += 1
+            continue
+
+        if "=" in value:
+            malformed["too_many_equals"] += 1
+            continue
+
+        if not value.strip():
+            malformed["empty_value"] += 1
+            continue
+
+        key = key.strip()
+        if key in ARRAY_FIELDS:
+            payload.arrays[key] = decode_array(value, malformed)
+            continue
+
+        payload.raw[key] = value
+        value_type = FIELD_TYPES.get(key)
+        payload.fields[key] = _to_type(value, value_type, malformed, key) if value_type else value
+
+    return payload
+
+
+def malformed_summary(payload: Payload) -> Optional[str]:
+    if not payload.malformed:
+        return None
+    return ", ".join(f"{key}: {count}" for key, count in sorted(payload.malformed.items()))
+
+
+def sample_offsets_ms(log_first: int, log_last: int, length: int) -> np.ndarray:
+    """
+    Milliseconds of every sample after the first one. The samples are logged evenly between
+    log_first and log_last (seconds since midnight, rounded to whole seconds), an upload with
+    log_last < log_first was logged over midnight.
+    """
+    if length < 1:
+        return np.empty(0, dtype=np.int64)
+    if length == 1:
+        return np.zeros(1, dtype=np.int64)
+
+    if log_last < log_first:
+        log_last += DAY_SECONDS
+
+    step = (log_last - log_first) / (length - 1)
+    secs = np.round(log_first + np.arange(length) * step)
+    return ((secs - log_first) * 1000).astype(np.int64)
+
+
+def sample_times_ms(received_at: datetime, log_first: int, log_last: int, length: int) -> np.ndarray:
+    """
+    Epoch milliseconds of the samples of an upload received at `received_at` (timezone aware).
+    The first sample is on the day before when the upload was logged over midnight or
+    received after it.
+    """
+    day = received_at.date()
+    received_s = received_at.hour * 3600 + received_at.minute * 60 + received_at.second
+    if log_last < log_first or log_first > received_s + MAX_CLOCK_AHEAD_SECONDS:
+        day -= timedelta(days=1)
+
+    first = datetime.combine(day, time(0, 0, 0, tzinfo=received_at.tzinfo)) + timedelta(seconds=log_first)
+    return int(first.timestamp() * 1000) + sample_offsets_ms(log_first, log_last, length)
@@ -0,0 +1,153 @@
+"""
+File backed cache of the /<station>/data/*.json responses, shared by all the gunicorn
+workers (and the ingest worker, they all mount the app directory).
+
+Every station has a generation counter that is incremented whenever new data of the station
+is saved. A cached response is only served while the generation and the time window it was
+created for are still the same, so between two uploads every poll of the same URL gets the
+same bytes without touching Mongo, and a new upload is visible immediately.
+
+The number of cached responses of a station is limited to MAX_ENTRIES_PER_STATION. When
+a station has more, the responses of older generations are deleted first, then the least
+recently written ones.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+
+CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR", "cache/responses/")
+MAX_ENTRIES_PER_STATION = 256
+ENTRY_NAME = re.compile(r"^[0-9a-f]{40}$")
+
+
+def _station_dir(station_name):
+    safe_name = re.sub(r"[^A-Za-z0-9_-]", "_", station_name)
+    return os.path.join(CACHE_DIR, safe_name)
+
+
+def _entry_path(station_name, key):
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+    return os.path.join(_station_dir(station_name), digest)
+
+
+def get_generation(station_name):
+    return get_version(station_name)[0]
+
+
+def get_version(station_name):
+    """ (generation, time of the last change as epoch seconds or None) of the station data """
+    try:
+        with open(os.path.join(_station_dir(station_name), "generation"), "r") as f:
+            return int(f.read() or -1), os.fstat(f.fileno()).st_mtime
+    except FileNotFoundError:
+        return 0, None
+    except ValueError:
+        return -1, None
+
+
+def bump_generation(station_name):
+    """ Invalidates all the cached responses of the station """
+    if not CACHE_DIR:
+        return
+
+    try:
+        os.makedirs(_station_dir(station_name), exist_ok=True)
+        fd = os.open(os.path.join(_station_dir(station_name), "generation"), os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            generation = int(f.read() or 0) + 1
+            f.seek(0)
+            f.truncate()
+            f.write(str(generation))
+    except OSError:
+        logging.exception(f"#{station_name}: Unable to invalidate the response cache")
+
+
+def time_window(duration_hours=None, step_seconds=None):
+    """
+    Index of the time window a response is valid for. Responses of the last `duration_hours`
+    change when the start of the range moves into the next step, others only on new data.
+    """
+    if step_seconds is None:
+        return 0
+
+    start = time.time() - (duration_hours or 0) * 3600
+    return int(start // step_seconds)
+
+
+def window_changed_at(window, duration_hours=None, step_seconds=None):
+    """ Epoch seconds when the responses of the time window started to differ from the previous one """
+    if step_seconds is None:
+        return 0
+    return window * step_seconds + (duration_hours or 0) * 3600
+
+
+def get(station_name, key, generation, window):
+    """ (body, mimetype) of the cached response, None when there is none for this generation and window """
+    if not CACHE_DIR:
+        return None
+
+    try:
+        with open(_entry_path(station_name, key), "rb") as f:
+            header = f.readline().split()
+            if len(header) != 3 or header[:2] != [str(generation).encode(), str(window).encode()]:
+                return None
+            return f.read(), header[2].decode()
+    except FileNotFoundError:
+        return None
+
+
+def evict(station_name, generation, keep=None):
+    """ Deletes the entries of other generations and then the oldest ones, until `keep` (3/4 of the limit) are left """
+    if keep is None:
+        keep = MAX_ENTRIES_PER_STATION * 3 // 4
+    station_dir = _station_dir(station_name)
+    entries = []
+    for name in os.listdir(station_dir):
+        if not ENTRY_NAME.match(name):
+            continue
+        path = os.path.join(station_dir, name)
+        try:
+            with open(path, "rb") as f:
+                header = f.readline().split()
+                current = len(header) == 3 and header[0] == str(generation).encode()
+                entries.append((current, os.fstat(f.fileno()).st_mtime, path))
+        except FileNotFoundError:
+            continue # deleted by another worker
+
+    # every entry of the other generations, the oldest of this one
+    entries.sort()
+    stale = sum(1 for current, _, _ in entries if not current)
+    removed = 0
+    for current, _, path in entries[:max(stale, len(entries) - keep)]:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    logging.info(f"#{station_name}: evicted {removed} cached responses")
+
+
+def set(station_name, key, generation, window, body, mimetype="application/json"):
+    if not CACHE_DIR:
+        return
+
+    station_dir = _station_dir(station_name)
+    try:
+        os.makedirs(station_dir, exist_ok=True)
+        path = _entry_path(station_name, key)
+        # the number of keys depends on the query parameters, don't let it grow without bounds
+        if not os.path.exists(path) and len(os.listdir(station_dir)) > MAX_ENTRIES_PER_STATION:
+            evict(station_name, generation)
+
+        fd, tmp_path = tempfile.mkstemp(dir=station_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(f"{generation} {window} {mimetype}\n".encode())
+            f.write(body)
+        os.replace(tmp_path, path)
+    except OSError:
+        logging.exception(f"#{station_name}: Unable to save the response to the cache")
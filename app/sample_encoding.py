@@ -0,0 +1,48 @@
+"""
+Binary encoding of the raw wind samples (wind_all.json with ?fmt=bin or
+Accept: application/x-wind-samples), read in the browser with typed arrays.
+
+Layout, little endian, every array starts aligned to its item size:
+
+    header        4s "WND1", uint32 winds count, uint32 dirs count, uint32 0
+    winds_ts      int64[winds count]    epoch ms
+    dirs_ts       int64[dirs count]     epoch ms
+    winds_speed   float32[winds count]  m/s
+    dirs_deg      uint16[dirs count]    degrees
+"""
+import struct
+
+import numpy as np
+
+MIMETYPE = "application/x-wind-samples"
+MAGIC = b"WND1"
+HEADER = struct.Struct("<4sIII")
+
+
+def encode_wind_samples(wind_ts_ms, wind_speed, dir_ts_ms, dir_deg):
+    """ Returns the encoded chunks, the header first, b"".join(...) gives the whole body """
+    return [
+        HEADER.pack(MAGIC, len(wind_ts_ms), len(dir_ts_ms), 0),
+        np.asarray(wind_ts_ms, dtype="<i8").tobytes(),
+        np.asarray(dir_ts_ms, dtype="<i8").tobytes(),
+        np.asarray(wind_speed, dtype="<f4").tobytes(),
+        np.asarray(dir_deg, dtype="<u2").tobytes(),
+    ]
+
+
+def decode_wind_samples(body):
+    """ The inverse of encode_wind_samples, for the benchmark and tools """
+    magic, n_winds, n_dirs, _ = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise ValueError(f"Not wind samples data: {magic}")
+
+    offset = HEADER.size
+    wind_ts = np.frombuffer(body, dtype="<i8", count=n_winds, offset=offset)
+    offset += 8 * n_winds
+    dir_ts = np.frombuffer(body, dtype="<i8", count=n_dirs, offset=offset)
+    offset += 8 * n_dirs
+    wind_speed = np.frombuffer(body, dtype="<f4", count=n_winds, offset=offset)
+    offset += 4 * n_winds
+    dir_deg = np.frombuffer(body, dtype="<u2", count=n_dirs, offset=offset)
+
+    return wind_ts, wind_speed, dir_ts, dir_deg
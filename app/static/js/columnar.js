@@ -0,0 +1,57 @@
+console.log("columnar.js loaded");
+
+/*
+ * Decodes the ?format=columnar responses back to the rows the graphs use:
+ * {t0, step_ms | ts_ms[], col1[], col2[], ...} -> [{timestamp, col1, col2, ...}, ...]
+ * The timestamps are epoch ms, new Date(timestamp) works the same as with the ISO strings.
+ */
+function decodeColumnar(data) {
+  if (!data || data.t0 === null || data.t0 === undefined) return [];
+
+  const columns = Object.keys(data).filter(key => Array.isArray(data[key]) && key !== "ts_ms");
+  const length = data.ts_ms ? data.ts_ms.length : (columns.length ? data[columns[0]].length : 0);
+
+  const rows = new Array(length);
+  for (let i = 0; i < length; i++) {
+    const row = { timestamp: data.t0 + (data.ts_ms ? data.ts_ms[i] : i * data.step_ms) };
+    for (const key of columns) {
+      row[key] = data[key][i];
+    }
+    rows[i] = row;
+  }
+
+  return rows;
+}
+
+/*
+ * Decodes the binary wind_all.json?fmt=bin response (application/x-wind-samples, see
+ * sample_encoding.py) to the same {winds: [{timestamp, value}], dirs: [...]} rows.
+ */
+function decodeWindSamples(buffer) {
+  const header = new DataView(buffer, 0, 16);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== "WND1") throw new Error("Not wind samples data: " + magic);
+
+  const nWinds = header.getUint32(4, true);
+  const nDirs = header.getUint32(8, true);
+
+  let offset = 16;
+  const windTs = new BigInt64Array(buffer, offset, nWinds);
+  offset += 8 * nWinds;
+  const dirTs = new BigInt64Array(buffer, offset, nDirs);
+  offset += 8 * nDirs;
+  const windSpeed = new Float32Array(buffer, offset, nWinds);
+  offset += 4 * nWinds;
+  const dirDeg = new Uint16Array(buffer, offset, nDirs);
+
+  const winds = new Array(nWinds);
+  for (let i = 0; i < nWinds; i++) {
+    winds[i] = { timestamp: Number(windTs[i]), value: Math.round(windSpeed[i] * 100) / 100 };
+  }
+  const dirs = new Array(nDirs);
+  for (let i = 0; i < nDirs; i++) {
+    dirs[i] = { timestamp: Number(dirTs[i]), value: dirDeg[i] };
+  }
+
+  return { winds, dirs };
+}
@@ -593,7 +593,7 @@ function setStatuionParametersPannel(data) {
   const signal = csqToSignalAuto(data["signal"])
   const signalQualityStr = `${signal.quality}, ${signal.dbm} dB`;
 
-  displayedKeys = [];
+  displayedKeys = ["cursor"];
   displayStatusInfo("timestamp", "Čas meritve", `${formattedDate(data["timestamp"])}<br>(pred ${timeSince(data["timestamp"])})`);
   displayStatusInfo("phoneNum", "Telefonska", data["phoneNum"] ?? "--");
   displayStatusInfo("vbatIde", "Baterija", (data["vbatIde"] ?? "--") + " V");
@@ -42,6 +42,7 @@ let displayDuration;
 let currentGraph;
 let currentGraphY2;
 let statusShift = 0;
+let statusCursors = []; // cursors of the statuses shown at each shift, for status.json?before=
 let displayLogs = "raw";
 $(function() {
   showLoading(false);
@@ -98,6 +99,7 @@ $(function() {
 
   $('#status-shift-value').on('click', function () {
     statusShift = 0;
+    statusCursors = [];
     $('#status-shift-value').text(statusShift); 
     loadStatus();
   });
@@ -154,7 +156,7 @@ function displayStatuses(data) {
   const columns = [
     "timestamp",
     "dur_minutes",
-    ...[...fieldSet].filter(k => k !== "timestamp")
+    ...[...fieldSet].filter(k => k !== "timestamp" && k !== "cursor")
   ];
 
   // compute the duration between each status
@@ -298,8 +300,13 @@ function displayRawLogs(rawLogsText) {
 function loadStatus() {
   $('#loading-status-msg').show();
 
-  $.getJSON(`/${basePath}/data/status.json?shift=${statusShift}`, function(data) {
+  // the status before the one shown at the previous shift, reads the same few entries at any depth
+  const before = statusShift > 0 ? statusCursors[statusShift - 1] : undefined;
+  const query = before ? `before=${encodeURIComponent(before)}` : `shift=${statusShift}`;
+  const shift = statusShift;
+  $.getJSON(`/${basePath}/data/status.json?${query}`, function(data) {
     console.log(data)
+    statusCursors[shift] = data["cursor"];
     displayStatusData(data);
   });
 }
@@ -664,7 +671,7 @@ function setStatuionParametersPannel(data) {
   const signal = csqToSignalAuto(data["signal"])
   const signalQualityStr = `${signal.quality}, ${signal.dbm} dB`;
 
-  displayedKeys = [];
+  displayedKeys = ["cursor"];
   displayStatusInfo("timestamp", "Čas meritve", `${formattedDate(data["timestamp"])}<br>(pred ${timeSince(data["timestamp"])})`);
   displayStatusInfo("phoneNum", "Telefonska", data["phoneNum"] ?? "--");
   displayStatusInfo("vbatIde", "Baterija", (data["vbatIde"] ?? "--") + " V");
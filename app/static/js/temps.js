@@ -25,7 +25,8 @@ function showLoadingTemp(isLoading) {
 function loadTempData() {
   showLoadingTemp(true);
   const base = window.location.pathname;
-  $.getJSON(`${base}/data/temp.json?duration=${displayDuration}`, function(data) {
+  $.getJSON(`${base}/data/temp.json?duration=${displayDuration}&format=columnar`, function(columnar) {
+      const data = decodeColumnar(columnar);
       showLoadingTemp(false);
 
       console.log('Temperature data loaded:', data);
@@ -137,7 +137,8 @@ function showLoading(isLoading) {
 function loadWindData() {
     showLoading(true);
     const base = window.location.pathname;
-    $.getJSON(`${base}/data/wind.json?duration=${displayDuration}`, function(data) {
+    $.getJSON(`${base}/data/wind.json?duration=${displayDuration}&format=columnar`, function(columnar) {
+        const data = decodeColumnar(columnar);
         showLoading(false);
         logDisplayedTimeWindow(data);
         updateWindGraph(data);
@@ -26,12 +26,25 @@ let all_wind_data;
 function loadWindRoseData() {
   showWindRoseDataLoading(true);
   const base = window.location.pathname;
-  $.getJSON(`${base}/data/wind_all.json?duration=12`, function(data) {
-      console.log('All wind data loaded:', data);
+  $('#wind-rose-error').addClass("hidden").removeClass("flex");
+  fetch(`${base}/data/wind_all.json?duration=12&fmt=bin`)
+    .then(response => {
+      if (!response.ok) {
+        throw new Error(`wind_all.json: ${response.status} ${response.statusText}`);
+      }
+      return response.arrayBuffer();
+    })
+    .then(buffer => {
+      const data = decodeWindSamples(buffer);
       all_wind_data = data;
       renderWindRose(data);
       showWindRoseDataLoading(false);
-  });
+    })
+    .catch(error => {
+      console.error('Unable to load the wind rose data:', error);
+      showWindRoseDataLoading(false);
+      $('#wind-rose-error').removeClass("hidden").addClass("flex");
+    });
 
 }
 
@@ -0,0 +1,66 @@
+"""
+In-process cache of the stations collection, indexed by IMSI and by name.
+
+The stations almost never change, but they are looked up several times per
+request. Every gunicorn worker keeps its own copy: changes made through
+db.add_station invalidate the copy of that worker, everything else (other
+workers, edits made directly in Mongo) is picked up after ttl_seconds.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class StationRegistry:
+    def __init__(self, loader: Callable[[], Iterable[dict]], ttl_seconds: float = 60):
+        self._loader = loader
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._by_imsi: Dict[str, dict] = {}
+        self._by_name: Dict[str, dict] = {}
+        self._stations: List[dict] = []
+        self._loaded_at: Optional[float] = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self._ttl_seconds:
+            return
+
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self._ttl_seconds:
+                return
+
+            stations = list(self._loader())
+            self._stations = stations
+            self._by_imsi = {s["imsi"]: s for s in stations if s.get("imsi")}
+            self._by_name = {s["name"]: s for s in stations if s.get("name")}
+            self._loaded_at = time.monotonic()
+            logging.info(f"Loaded {len(stations)} stations into the station registry")
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def put(self, station: dict):
+        """ Adds a station that was just read from / written to the DB """
+        self._ensure_loaded()
+        with self._lock:
+            self._stations = [s for s in self._stations if s.get("imsi") != station.get("imsi")] + [station]
+            if station.get("imsi"):
+                self._by_imsi[station["imsi"]] = station
+            if station.get("name"):
+                self._by_name[station["name"]] = station
+
+    def get_by_imsi(self, imsi: str) -> Optional[dict]:
+        self._ensure_loaded()
+        station = self._by_imsi.get(imsi)
+        return dict(station) if station is not None else None
+
+    def get_by_name(self, name: str) -> Optional[dict]:
+        self._ensure_loaded()
+        station = self._by_name.get(name)
+        return dict(station) if station is not None else None
+
+    def all(self) -> List[dict]:
+        self._ensure_loaded()
+        return [dict(s) for s in self._stations]
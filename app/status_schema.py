@@ -0,0 +1,94 @@
+"""
+Types of the numeric status fields, by firmware version.
+
+The stations send every value as text. coerce() converts the fields the schema of the
+firmware (the `ver` field) knows to numbers before the status is saved, "nan" and the
+other values that aren't finite numbers become None (null), so Mongo can filter, sort
+and aggregate on them. Fields the schema doesn't know are kept as they were sent.
+
+This is the only registry of the field types, payload_parser types the fields of the
+uploaded lines with DEFAULT_SCHEMA too.
+"""
+import math
+from typing import Dict, Optional, Tuple
+
+COMMON_FIELDS = {
+    "pref": int,
+    "len": int,
+    "logFirst": int,
+    "logLast": int,
+    "temp": float,
+    "hum": int,
+    "vbatIde": float,
+    "vbatGprs": float,
+    "vsol": float,
+    "dur": float,
+    "signal": int,
+    "vbat_rate": float,
+}
+
+# firmware version -> field types, "v2.0" uses the "v2" schema
+SCHEMAS = {
+    "v2": {
+        **COMMON_FIELDS,
+        "temp_out": float,
+        "hum_out": int,
+        "temp_in": float,
+        "hum_in": int,
+    },
+    "v4": {
+        **COMMON_FIELDS,
+        "simDur": float,
+        "regDur": float,
+        "gprsRegDur": float,
+    },
+}
+
+# statuses without a version or from an unknown firmware
+DEFAULT_SCHEMA = {field: value_type for schema in SCHEMAS.values() for field, value_type in schema.items()}
+
+
+def schema_for(ver: Optional[str]) -> Dict[str, type]:
+    if not ver:
+        return DEFAULT_SCHEMA
+    return SCHEMAS.get(ver) or SCHEMAS.get(ver.split(".")[0]) or DEFAULT_SCHEMA
+
+
+def to_number(value, value_type=float):
+    """
+    value (as sent or already converted) as a number of value_type, None for nan / inf.
+    Raises ValueError when it isn't a number at all.
+    """
+    if value is None:
+        return None
+
+    number = float(value)
+    if not math.isfinite(number):
+        return None
+    if value_type is int and number.is_integer():
+        return int(number)
+    return number
+
+
+def coerce(status: dict) -> Tuple[dict, list]:
+    """ The status with the known fields converted, and the keys whose values aren't numbers (kept unchanged) """
+    schema = schema_for(status.get("ver"))
+    typed = dict(status)
+    bad_keys = []
+    for key, value_type in schema.items():
+        if key not in typed:
+            continue
+        try:
+            typed[key] = to_number(typed[key], value_type)
+        except (TypeError, ValueError):
+            bad_keys.append(key)
+
+    return typed, bad_keys
+
+
+def number_or_none(value, value_type=float):
+    """ Reads a status value saved before the backfill (a string) or after it (a number or None) """
+    try:
+        return to_number(value, value_type)
+    except (TypeError, ValueError):
+        return None
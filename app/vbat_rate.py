@@ -0,0 +1,116 @@
+"""
+Battery voltage trend (vbat_rate) of the stations.
+
+The rate of a status is the slope of the least-squares line through the vbatIde values of
+the last WINDOW_MINUTES (the status included), in mV per hour. A station whose battery
+keeps dropping while the sun is up has a failing solar panel or charger.
+
+- RunningSlope: the rate of every new upload in O(1), it keeps the sums of the regression
+  (n, Σt, Σv, Σtv, Σt²) of the points in the window and removes the points that leave it.
+- rolling_slopes: the rates of a whole series at once with cumulative sums, for the backfill.
+"""
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+WINDOW_MINUTES = 90
+WINDOW_MS = WINDOW_MINUTES * 60 * 1000
+HOUR_MS = 3600 * 1000
+
+# the sums are recomputed around a new origin when the points get this far from it,
+# so they stay small and the rounding of the additions and removals doesn't build up
+REBASE_MS = 10 * WINDOW_MS
+
+
+def _rate(n, sum_t, sum_v, sum_tv, sum_tt):
+    """ Slope of the least-squares line in mV/h (t in hours), None for less than 2 points or one time """
+    denominator = n * sum_tt - sum_t * sum_t
+    if n < 2 or denominator <= 1e-12 * max(n * sum_tt, 1.0):
+        return None
+    return (n * sum_tv - sum_t * sum_v) / denominator * 1000
+
+
+class RunningSlope:
+    def __init__(self, window_ms: int = WINDOW_MS):
+        self.window_ms = window_ms
+        self.points = deque()  # (t_ms, value), oldest first
+        self.last_ms = None  # newest status added, with or without a value
+        self._origin_ms = None
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self.n = 0
+        self.sum_t = self.sum_v = self.sum_tv = self.sum_tt = 0.0
+
+    def _add_sums(self, t_ms, value, sign):
+        t = (t_ms - self._origin_ms) / HOUR_MS
+        self.n += sign
+        self.sum_t += sign * t
+        self.sum_v += sign * value
+        self.sum_tv += sign * t * value
+        self.sum_tt += sign * t * t
+
+    def _rebase(self, origin_ms):
+        self._origin_ms = origin_ms
+        self._reset_sums()
+        for t_ms, value in self.points:
+            self._add_sums(t_ms, value, 1)
+
+    def add(self, t_ms: int, value: Optional[float]) -> Optional[float]:
+        """
+        Adds the status at t_ms (not older than the last one) and returns its rate.
+        value None (no vbatIde) only moves the window.
+        """
+        self.last_ms = t_ms
+        while self.points and self.points[0][0] < t_ms - self.window_ms:
+            old_ms, old_value = self.points.popleft()
+            self._add_sums(old_ms, old_value, -1)
+
+        if value is None:
+            return None
+
+        if self._origin_ms is None or not self.points or t_ms - self._origin_ms > REBASE_MS:
+            self.points.append((t_ms, value))
+            self._rebase(self.points[0][0])
+        else:
+            self.points.append((t_ms, value))
+            self._add_sums(t_ms, value, 1)
+
+        return _rate(self.n, self.sum_t, self.sum_v, self.sum_tv, self.sum_tt)
+
+
+def rolling_slopes(t_ms, values, window_ms: int = WINDOW_MS):
+    """
+    rate of every point of a series sorted by time (RunningSlope.add of each one), NaN where
+    it has none. values NaN don't count. Call it on chunks of at most a few thousand points,
+    the cumulative sums lose precision on long series.
+    """
+    t_ms = np.asarray(t_ms, dtype=np.int64)
+    v = np.asarray(values, dtype=float)
+    valid = ~np.isnan(v)
+    if len(t_ms) == 0:
+        return np.empty(0)
+
+    t = (t_ms - t_ms[0]) / HOUR_MS
+    t_valid = np.where(valid, t, 0.0)
+    v_valid = np.where(valid, v, 0.0)
+
+    def window_sums(x):
+        cum = np.concatenate([[0.0], np.cumsum(x)])
+        return cum[end] - cum[start]
+
+    start = np.searchsorted(t_ms, t_ms - window_ms, side="left")
+    end = np.arange(1, len(t_ms) + 1)
+
+    n = window_sums(valid.astype(float))
+    sum_t = window_sums(t_valid)
+    sum_v = window_sums(v_valid)
+    sum_tv = window_sums(t_valid * v_valid)
+    sum_tt = window_sums(t_valid * t_valid)
+
+    denominator = n * sum_tt - sum_t * sum_t
+    ok = valid & (n >= 2) & (denominator > 1e-12 * np.maximum(n * sum_tt, 1.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = (n * sum_tv - sum_t * sum_v) / denominator * 1000
+    return np.where(ok, rates, np.nan)
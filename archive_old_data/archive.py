@@ -54,6 +54,7 @@ if __name__ == "__main__":
     start = datetime.now()
     move_collection_to_archive("dirs", timedelta(hours=12))
     move_collection_to_archive("winds", timedelta(hours=12))
+    move_collection_to_archive("wind_uploads", timedelta(hours=12))
 
     move_collection_to_archive("statuses", timedelta(days=15))
     move_collection_to_archive("dir_bucketed", timedelta(days=15))
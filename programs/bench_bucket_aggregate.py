@@ -0,0 +1,70 @@
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+import bucketing
+
+
+# synthetic raw data: one sample every 5 s, like the stations send it
+STATIONS = 10
+DAYS = 4
+SAMPLE_INTERVAL_MS = 5_000
+
+
+def generate_station(seed, start_ms):
+    rng = random.Random(seed)
+    n = DAYS * 24 * 3600 * 1000 // SAMPLE_INTERVAL_MS
+    xs = start_ms + np.arange(n, dtype=np.int64) * SAMPLE_INTERVAL_MS + np.array([rng.randint(-500, 500) for _ in range(n)])
+    winds = np.array([rng.randint(0, 180) for _ in range(n)])
+    dirs = np.array([rng.randint(0, 7) for _ in range(n)])
+
+    # newest first, as the cursor in create_average_*_values returns them
+    return xs[::-1].copy(), winds[::-1].copy(), dirs[::-1].copy()
+
+
+def time_it(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    start_ms = int(time.time() * 1000) - DAYS * 24 * 3600 * 1000
+    total_dict = 0.0
+    total_np = 0.0
+
+    for station in range(STATIONS):
+        xs, winds, dirs = generate_station(station, start_ms)
+
+        def run_dict():
+            wind_points = [{"x": x, "y": y} for x, y in zip(xs.tolist(), winds.tolist())]
+            dir_points = [{"x": x, "y": y} for x, y in zip(xs.tolist(), dirs.tolist())]
+            return (
+                bucketing.bucket_aggregate(wind_points, modes=["avg", "max", "median", "min"]),
+                bucketing.bucket_aggregate(dir_points, modes=["mode"]),
+            )
+
+        def run_np():
+            return (
+                bucketing.bucket_aggregate_np(xs, winds, modes=["avg", "max", "median", "min"]),
+                bucketing.bucket_aggregate_np(xs, dirs, modes=["mode"]),
+            )
+
+        expected, t_dict = time_it(run_dict)
+        result, t_np = time_it(run_np)
+
+        if result != expected:
+            raise AssertionError(f"station {station}: bucket_aggregate_np output differs from bucket_aggregate")
+
+        total_dict += t_dict
+        total_np += t_np
+        print(f"station {station}: {len(xs)} samples, {len(result[0][0])} buckets. dict: {t_dict*1000:.1f} ms numpy: {t_np*1000:.1f} ms")
+
+    print(f"\n{STATIONS} stations x {DAYS} days")
+    print(f"bucket_aggregate:    {total_dict:.3f} s ({total_dict / STATIONS * 1000:.1f} ms per station)")
+    print(f"bucket_aggregate_np: {total_np:.3f} s ({total_np / STATIONS * 1000:.1f} ms per station)")
+    print(f"speedup: {total_dict / total_np:.1f}x")
@@ -0,0 +1,67 @@
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import orjson
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+import json_provider
+
+TZ = ZoneInfo("Europe/Berlin")
+HOURS = 24
+SAMPLE_SECONDS = 5  # the stations log a sample every ~5 s
+
+
+def cursor_docs():
+    """ A 24 h wind_all.json as the cursors return it: naive UTC timestamps, newest first """
+    end = datetime.utcnow().replace(microsecond=0)
+    n = HOURS * 3600 // SAMPLE_SECONDS
+    winds = [{"timestamp": end - timedelta(seconds=i * SAMPLE_SECONDS), "value": round((i % 97) * 0.0917, 2)} for i in range(n)]
+    dirs = [{"timestamp": end - timedelta(seconds=i * SAMPLE_SECONDS), "value": (i % 8) * 45} for i in range(n)]
+    return winds, dirs
+
+
+def legacy(winds, dirs, provider):
+    # what get_wind_all / get_directions_all did before: an ISO string per sample, then the stdlib provider
+    data = {
+        "winds": [{"timestamp": d["timestamp"].astimezone(TZ).isoformat(), "value": d["value"]} for d in winds],
+        "dirs": [{"timestamp": d["timestamp"].astimezone(TZ).isoformat(), "value": d["value"]} for d in dirs],
+    }
+    return provider.dumps(data).encode()
+
+
+def fast(winds, dirs, provider):
+    return provider.dumps({"winds": winds, "dirs": dirs}).encode()
+
+
+def measure(fn, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+if __name__ == "__main__":
+    app = Flask(__name__)
+    winds, dirs = cursor_docs()
+
+    legacy_seconds, legacy_body = measure(legacy, winds, dirs, DefaultJSONProvider(app))
+    fast_seconds, fast_body = measure(fast, winds, dirs, json_provider.OrjsonProvider(app))
+
+    # same instants and values, the provider writes the timestamps in Europe/Berlin like isoformat() did
+    a, b = orjson.loads(legacy_body), orjson.loads(fast_body)
+    for key in ("winds", "dirs"):
+        for x, y in zip(a[key], b[key]):
+            if datetime.fromisoformat(x["timestamp"]) != datetime.fromisoformat(y["timestamp"]) or x["value"] != y["value"]:
+                raise AssertionError(f"{key} differs: {x} {y}")
+
+    print(f"wind_all.json of {HOURS} h: {len(winds)} wind + {len(dirs)} dir samples")
+    for name, seconds, body in [("isoformat + stdlib json", legacy_seconds, legacy_body), ("orjson provider", fast_seconds, fast_body)]:
+        print(f"{name:24s} {seconds * 1000:8.1f} ms  {len(body) / 1024:8.1f} KiB")
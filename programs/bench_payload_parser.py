@@ -0,0 +1,73 @@
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+import payload_parser
+
+
+# the sample v4 line from the __main__ block of db.py
+LINE = "pref=4;prefDate=1970-01-01_00:00:00;ver=v4;imsi=293400130750143;phoneNum=69867551;temp=-3.2;hum=83;vbatIde=4.034;vbatGprs=4.002;vsol=0.086;dur=13.5;signal=27;simDur=2.7;regDur=2.3;gprsRegDur=1.7;errors=20:199;len=120;avg=96,107,91,83,79,80,74,87,72,76,98,105,109,111,94,74,76,83,78,80,100,114,104,90,89,100,106,103,106,94,96,95,91,89,94,102,84,67,82,80,74,78,69,89,101,68,80,100,102,91,87,100,95,93,93,89,119,113,116,99,103,88,104,94,100,96,87,81,103,88,98,105,94,95,98,88,75,78,92,103,116,101,103,104,110,111,112,104,93,90,79,95,96,102,87,91,93,111,118,99,81,91,98,106,108,105,126,108,106,108,116,97,102,95,104,101,102,93,110,97;dir=0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0;logFirst=61205;logLast=61800;"
+
+
+# the parsing done by db.parse_status_update before payload_parser, without the logging
+def legacy_get_array_from_status_data(data, key):
+    value = data.pop(key, None)
+    if value is None:
+        return []
+
+    if isinstance(value, float):
+        return [int(value)]
+
+    array = [
+        int(x.strip())
+        for x in value.split(",")
+        if x.strip().lstrip("-+").isdigit()
+    ]
+
+    return [x if x >= 0 else None for x in array]
+
+
+def legacy_parse(line):
+    data = {}
+    for part in line.split(";"):
+        if len(part) == 0:
+            continue
+        if "=" not in part:
+            continue
+        parts = part.split("=")
+        if len(parts) != 2:
+            continue
+        key, val = parts
+        if len(val.strip()) == 0:
+            continue
+        data[key.strip()] = val
+
+    winds = legacy_get_array_from_status_data(data, "avg")
+    dirs = legacy_get_array_from_status_data(data, "dir")
+    log_first = int(data.pop("logFirst"))
+    log_last = int(data.pop("logLast"))
+    length = int(data.pop("len"))
+    return data, winds, dirs, log_first, log_last, length
+
+
+def new_parse(line):
+    payload = payload_parser.parse_payload(line)
+    return payload, payload.array_list("avg"), payload.array_list("dir")
+
+
+def new_parse_arrays_only(line):
+    # what the vectorized ingest path uses, without converting back to lists
+    return payload_parser.parse_payload(line)
+
+
+if __name__ == "__main__":
+    _, winds, dirs, *_ = legacy_parse(LINE)
+    _, new_winds, new_dirs = new_parse(LINE)
+    if winds != new_winds or dirs != new_dirs:
+        raise AssertionError("payload_parser output differs from the legacy parsing")
+
+    number = 20_000
+    for name, fn in [("legacy", legacy_parse), ("payload_parser + lists", new_parse), ("payload_parser", new_parse_arrays_only)]:
+        seconds = min(timeit.repeat(lambda: fn(LINE), number=number, repeat=5))
+        print(f"{name:24s} {seconds / number * 1e6:7.1f} us per line")
@@ -0,0 +1,68 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+import vbat_rate
+
+DAYS = 7
+UPLOAD_MINUTES = 5
+
+
+def synthetic_statuses():
+    n = DAYS * 24 * 60 // UPLOAD_MINUTES
+    rng = np.random.default_rng(1)
+    t_ms = 1_700_000_000_000 + np.arange(n, dtype=np.int64) * UPLOAD_MINUTES * 60 * 1000
+    hours = np.arange(n) * UPLOAD_MINUTES / 60
+    values = 3.9 + 0.1 * np.sin(hours / 24 * 2 * np.pi) + rng.normal(0, 0.005, n)
+    return t_ms, values
+
+
+def polyfit_per_point(t_ms, values):
+    # what caluculate_change_rate did: the window rebuilt and np.polyfit for every status
+    rates = []
+    for i in range(len(t_ms)):
+        j = i
+        while j >= 0 and t_ms[i] - t_ms[j] <= vbat_rate.WINDOW_MS:
+            j -= 1
+        if i - j < 2:
+            rates.append(np.nan)
+            continue
+        t = (t_ms[j + 1:i + 1] - t_ms[j + 1]) / vbat_rate.HOUR_MS
+        rates.append(np.polyfit(t, values[j + 1:i + 1], 1)[0] * 1000)
+    return np.array(rates)
+
+
+def running(t_ms, values):
+    window = vbat_rate.RunningSlope()
+    return np.array([np.nan if (r := window.add(int(t), float(v))) is None else r for t, v in zip(t_ms, values)])
+
+
+def measure(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    t_ms, values = synthetic_statuses()
+    results = [
+        ("polyfit per status", *measure(polyfit_per_point, t_ms, values)),
+        ("RunningSlope", *measure(running, t_ms, values)),
+        ("rolling_slopes", *measure(vbat_rate.rolling_slopes, t_ms, values)),
+    ]
+
+    expected = results[0][2]
+    for name, _, rates in results[1:]:
+        if not np.allclose(rates, expected, atol=0.01, equal_nan=True):
+            raise AssertionError(f"{name} differs from np.polyfit")
+
+    print(f"{len(t_ms)} statuses ({DAYS} days, one every {UPLOAD_MINUTES} min), window {vbat_rate.WINDOW_MINUTES} min")
+    for name, seconds, _ in results:
+        print(f"{name:20s} {seconds * 1000:8.1f} ms  {seconds / len(t_ms) * 1e6:8.2f} us/status")
@@ -0,0 +1,71 @@
+import gzip
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+import sample_encoding
+
+TZ = ZoneInfo("Europe/Berlin")
+HOURS = 12
+SAMPLE_SECONDS = 5  # the stations log a sample every ~5 s
+
+
+def synthetic_samples():
+    n = HOURS * 3600 // SAMPLE_SECONDS
+    rng = np.random.default_rng(1)
+    end_ms = int(datetime.now(TZ).timestamp() * 1000)
+    ts_ms = end_ms - np.arange(n, dtype=np.int64) * SAMPLE_SECONDS * 1000  # newest first
+    winds = rng.integers(0, 200, n)
+    dirs = rng.integers(0, 8, n) * 45
+    return ts_ms, winds, dirs
+
+
+def json_rows(ts_ms, winds, dirs, speed_to_ms):
+    # what get_wind_all / get_directions_all build, a dict with an ISO string per sample
+    start = datetime(1970, 1, 1, tzinfo=ZoneInfo("UTC"))
+    wind_rows = [
+        {"timestamp": (start + timedelta(milliseconds=int(t))).astimezone(TZ).isoformat(), "value": round(int(v) * speed_to_ms, 2)}
+        for t, v in zip(ts_ms, winds)
+    ]
+    dir_rows = [
+        {"timestamp": (start + timedelta(milliseconds=int(t))).astimezone(TZ).isoformat(), "value": int(v)}
+        for t, v in zip(ts_ms, dirs)
+    ]
+    return json.dumps({"winds": wind_rows, "dirs": dir_rows}).encode()
+
+
+def binary(ts_ms, winds, dirs, speed_to_ms):
+    return b"".join(sample_encoding.encode_wind_samples(ts_ms, winds * speed_to_ms, ts_ms, dirs))
+
+
+def measure(fn, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+if __name__ == "__main__":
+    speed_to_ms = 0.33 / 3.6
+    ts_ms, winds, dirs = synthetic_samples()
+
+    bin_seconds, bin_body = measure(binary, ts_ms, winds, dirs, speed_to_ms)
+    wind_ts, wind_speed, dir_ts, dir_deg = sample_encoding.decode_wind_samples(bin_body)
+    if not (np.array_equal(wind_ts, ts_ms) and np.array_equal(dir_ts, ts_ms) and np.array_equal(dir_deg, dirs)
+            and np.allclose(wind_speed, winds * speed_to_ms, atol=1e-3)):
+        raise AssertionError("decoded samples differ from the encoded ones")
+
+    json_seconds, json_body = measure(json_rows, ts_ms, winds, dirs, speed_to_ms, repeat=3)
+
+    print(f"{len(ts_ms)} wind + {len(ts_ms)} dir samples ({HOURS} h)")
+    for name, seconds, body in [("json rows", json_seconds, json_body), ("binary", bin_seconds, bin_body)]:
+        print(f"{name:10s} {seconds * 1000:8.1f} ms  {len(body) / 1024:8.1f} KiB  gzip {len(gzip.compress(body)) / 1024:8.1f} KiB")
@@ -0,0 +1,74 @@
+"""
+The tests run db.py against mongomock, an in-memory MongoDB (pip install mongomock).
+"""
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+os.environ.setdefault("RESPONSE_CACHE_DIR", tempfile.mkdtemp(prefix="wind-meter-responses-") + "/")
+
+mongomock = pytest.importorskip("mongomock")
+import pymongo
+from mongomock.collection import Collection
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+def _bulk_write(self, requests, ordered=True, **kwargs):
+    # mongomock's bulk_write doesn't accept the operations of the newer pymongo versions
+    result = types.SimpleNamespace(upserted_count=0, matched_count=0, modified_count=0, inserted_count=0)
+    errors = []
+    for index, op in enumerate(requests):
+        try:
+            if isinstance(op, pymongo.UpdateOne):
+                res = self.update_one(op._filter, op._doc, upsert=op._upsert)
+                result.matched_count += res.matched_count
+                result.modified_count += res.modified_count
+                result.upserted_count += res.upserted_id is not None
+            elif isinstance(op, pymongo.ReplaceOne):
+                self.replace_one(op._filter, op._doc, upsert=op._upsert)
+            elif isinstance(op, pymongo.InsertOne):
+                self.insert_one(op._doc)
+                result.inserted_count += 1
+            else:
+                raise NotImplementedError(type(op).__name__)
+        except DuplicateKeyError as e:
+            errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+            if ordered:
+                break
+
+    if errors:
+        raise BulkWriteError({
+            "writeErrors": errors, "nInserted": result.inserted_count, "nUpserted": result.upserted_count,
+            "nMatched": result.matched_count, "nModified": result.modified_count,
+        })
+    return result
+
+
+Collection.bulk_write = _bulk_write
+pymongo.MongoClient = lambda *args, **kwargs: mongomock.MongoClient(tz_aware=False)
+
+import db as app_db
+
+
+@pytest.fixture
+def db():
+    """ app/db.py with empty collections """
+    for name in app_db.db.list_collection_names():
+        app_db.db[name].delete_many({})
+    app_db.stations_registry.invalidate()
+    return app_db
+
+
+@pytest.fixture
+def client(db):
+    """ Flask test client of app/app.py, with an empty response cache """
+    import app as flask_app
+    import response_cache
+
+    shutil.rmtree(response_cache.CACHE_DIR, ignore_errors=True)
+    return flask_app.app.test_client()
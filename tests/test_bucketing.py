@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import bucketing
+
+MODES = ["min", "max", "max_10", "median", "mode", "avg"]
+
+
+def _points(n, seed, step_ms=5000):
+    rng = np.random.default_rng(seed)
+    xs = 1_700_000_000_000 + np.cumsum(rng.integers(1, 2 * step_ms, n))
+    # few distinct values, so the buckets have ties for the mode and the median
+    ys = rng.integers(0, 8, n).astype(float)
+    return xs, ys
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("minutes", [15, 60])
+def test_numpy_buckets_match_the_reference(seed, minutes):
+    xs, ys = _points(2000, seed)
+    # newest first, the order create_average_values reads the samples in
+    xs, ys = xs[::-1], ys[::-1]
+
+    expected, expected_last = bucketing.bucket_aggregate(
+        [{"x": int(x), "y": float(y)} for x, y in zip(xs, ys)], minutes=minutes, modes=MODES
+    )
+    buckets, last = bucketing.bucket_aggregate_np(xs, ys, minutes=minutes, modes=MODES)
+
+    assert buckets == expected
+    assert last == expected_last
+
+
+def test_mode_tie_goes_to_the_value_first_reaching_the_count():
+    xs = np.arange(6) * 1000 + 1_700_000_100_000
+    # 3 reaches two samples before 5 does
+    ys = np.array([5.0, 3.0, 3.0, 5.0, 1.0, 1.0])
+    buckets, _ = bucketing.bucket_aggregate_np(xs, ys, modes=["mode"])
+    assert [b["mode"] for b in buckets] == [3.0]
+
+
+def test_no_points():
+    assert bucketing.bucket_aggregate_np([], [], modes=MODES) == (None, None)
+
+
+def test_unknown_mode_is_reported_like_the_reference():
+    xs, ys = _points(50, 0)
+    buckets, _ = bucketing.bucket_aggregate_np(xs, ys, modes=["nope"])
+    assert {b["nope"] for b in buckets} == {-123}
+
+
+def test_registered_reducer(monkeypatch):
+    monkeypatch.setitem(bucketing.REDUCERS, "count", lambda g: g["counts"])
+    xs, ys = _points(500, 1)
+    buckets, _ = bucketing.bucket_aggregate_np(xs, ys, modes=["count"])
+    assert sum(b["count"] for b in buckets) == 500
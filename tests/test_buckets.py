@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import bucketing
+
+
+def _upload(start_ms, n, offset=0, step_ms=5000):
+    """ (t_ms, winds, dirs) of an upload of n samples, as save_wind_data passes them on """
+    i = np.arange(n)
+    t_ms = start_ms + i.astype(np.int64) * step_ms
+    winds = np.ma.masked_array(((i * 7 + offset) % 40).astype(float))
+    dirs = np.ma.masked_array(((i * 37 + offset * 11) % 360).astype(float))
+    return t_ms, winds, dirs
+
+
+def _buckets(db, station_name):
+    return {db._timestamp_ms(b["timestamp"]): b for b in db.db.wind_bucketed.find({"station_name": station_name})}
+
+
+def test_incremental_buckets_match_a_rebuild(db):
+    station = db.get_or_create_station("3001")
+    start_ms = bucketing.bucket_key_ms(db._timestamp_ms(datetime.now(db.TZ) - timedelta(hours=3)))
+    # 10 minute uploads, every one of them ends in the middle of a bucket
+    uploads = [_upload(start_ms + i * 600_000, 120, offset=i) for i in range(4)]
+    for upload in uploads:
+        db.update_average_values(station["name"], *upload)
+
+    # create_average_values reads the raw samples newest first
+    t_ms = np.concatenate([u[0] for u in uploads])[::-1]
+    winds = np.concatenate([u[1].data for u in uploads])[::-1]
+    sectors = ((np.concatenate([u[2].data for u in uploads])[::-1] + 22.5) // 45 % 8).astype(np.int64)
+    rebuilt_winds, _ = bucketing.bucket_aggregate_np(t_ms, winds, modes=["avg", "max"])
+    rebuilt_dirs, _ = bucketing.bucket_aggregate_np(t_ms, sectors, modes=["mode"])
+
+    buckets = _buckets(db, station["name"])
+    assert rebuilt_winds
+    for wind, direction in zip(rebuilt_winds, rebuilt_dirs):
+        bucket = buckets[db._timestamp_ms(wind["timestamp"])]
+        assert bucket["avg_rpm"] == pytest.approx(wind["avg"], abs=0.005)
+        assert bucket["max_rpm"] == pytest.approx(wind["max"], abs=0.005)
+        assert bucket["dir"] == direction["mode"]
+
+
+def test_interleaved_uploads_keep_each_others_samples(db, monkeypatch):
+    station = db.get_or_create_station("3002")
+    key_ms = bucketing.bucket_key_ms(db._timestamp_ms(datetime.now(db.TZ) - timedelta(hours=1)))
+    first = _upload(key_ms - 420_000, 60)
+    second = _upload(key_ms, 60, offset=3)
+
+    # the second upload is saved while the first one has read the bucket but not written it yet
+    get_bucket_docs = db.get_bucket_docs
+
+    def read_then_save_second(*args):
+        docs = get_bucket_docs(*args)
+        monkeypatch.setattr(db, "get_bucket_docs", get_bucket_docs)
+        db.update_average_values(station["name"], *second)
+        return docs
+
+    monkeypatch.setattr(db, "get_bucket_docs", read_then_save_second)
+    db.update_average_values(station["name"], *first)
+
+    bucket = _buckets(db, station["name"])[key_ms]
+    winds = np.concatenate([first[1].data, second[1].data])
+    assert bucket["wind_state"]["n"] == bucket["dir_state"]["n"] == len(winds)
+    assert bucket["avg_rpm"] == pytest.approx(winds.mean())
+    assert bucket["rev"] == 2
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_converted_directions_read_the_same(db):
+    station = db.get_or_create_station("4001")
+    db.db.stations.update_one({"name": station["name"]}, {"$set": {"dir_adjustment": 90}})
+    db.stations_registry.invalidate()
+
+    start = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0) - timedelta(hours=1)
+    winds, dirs = [], []
+    for i in range(30):
+        timestamp = start + timedelta(seconds=5 * i)
+        winds.append({"station_name": station["name"], "timestamp": timestamp, "value": i})
+        raw = (i * 45) % 360
+        if i % 2:
+            dirs.append({"station_name": station["name"], "timestamp": timestamp, "value": (raw + 90) % 360, "value_raw": raw})
+        else:
+            # saved before value_raw, already adjusted
+            dirs.append({"station_name": station["name"], "timestamp": timestamp, "value": (raw + 90) % 360})
+    db.db.winds.insert_many(winds)
+    db.db.dirs.insert_many(dirs)
+
+    def read(storage):
+        samples = db.find_raw_samples("dirs", station["name"], start.replace(tzinfo=timezone.utc) - timedelta(minutes=1), storage=storage)
+        return sorted((db._timestamp_ms(s["timestamp"]), s["value"]) for s in samples)
+
+    documents = read("documents")
+    db.convert_raw_to_columnar(test_run=False)
+    assert read("columnar") == documents
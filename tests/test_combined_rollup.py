@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import bucketing
+
+
+def _upload(start_ms, n, step_ms=5000):
+    i = np.arange(n)
+    t_ms = start_ms + i.astype(np.int64) * step_ms
+    winds = np.ma.masked_array((i % 30).astype(float))
+    dirs = np.ma.masked_array(np.full(n, 90.0), mask=i % 10 == 0)
+    return t_ms, winds, dirs
+
+
+def test_upload_saves_wind_and_dir_in_one_bucket_document(db):
+    station = db.get_or_create_station("3201")
+    start_ms = bucketing.bucket_key_ms(db._timestamp_ms(datetime.now(db.TZ) - timedelta(hours=2)))
+    db.update_average_values(station["name"], *_upload(start_ms, 360))
+
+    buckets = list(db.db.wind_bucketed.find({"station_name": station["name"]}))
+    keys = [db._timestamp_ms(b["timestamp"]) for b in buckets]
+    assert len(keys) == len(set(keys)) == 3
+    assert all({"avg", "max", "avg_rpm", "max_rpm"} <= b.keys() and b["dir"] == 2 for b in buckets)
+    assert db.db.dir_bucketed.count_documents({}) == 0
+
+    # the wind page reads the direction from the same documents
+    rows = db.get_wind_data(station["name"], duration_hours=3)
+    assert len(rows) == 3 and all(row["dir"] == 2 and row["avg"] is not None for row in rows)
+
+
+def test_merge_dir_bucketed(db):
+    timestamp = datetime(2025, 5, 1, 10, 0)
+    db.db.wind_bucketed.insert_one({"station_name": "ST1", "timestamp": timestamp, "avg": 1.5})
+    db.db.dir_bucketed.insert_many([
+        {"station_name": "ST1", "timestamp": timestamp, "mode": 3},
+        {"station_name": "ST1", "timestamp": timestamp + timedelta(minutes=15), "mode": 5},
+    ])
+
+    assert db.merge_dir_bucketed(test_run=True) == 2
+    assert db.db.wind_bucketed.count_documents({"dir": {"$exists": True}}) == 0
+
+    assert db.merge_dir_bucketed(test_run=False) == 2
+    merged = {b["timestamp"]: b for b in db.db.wind_bucketed.find({}, {"_id": 0})}
+    assert merged[timestamp] == {"station_name": "ST1", "timestamp": timestamp, "avg": 1.5, "dir": 3}
+    assert merged[timestamp + timedelta(minutes=15)]["dir"] == 5
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+import response_cache
+
+
+def _station_with_status(db, imsi):
+    station = db.get_or_create_station(imsi)
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    db.db.statuses.insert_one({"station_name": station["name"], "timestamp": now - timedelta(minutes=1), "temp": 1.0})
+    response_cache.bump_generation(station["name"])
+    return station
+
+
+def test_etag_revalidation(client, db, monkeypatch):
+    station = _station_with_status(db, "7001")
+    url = f"/{station['name']}/data/status.json"
+
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    # the 304 doesn't read the data again
+    with monkeypatch.context() as m:
+        m.setattr(db, "get_last_statuses", None)
+        not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.data == b""
+    assert not_modified.headers["ETag"] == etag
+
+    # Flask-Compress adds the encoding to the ETag of the compressed responses
+    compressed_etag = etag[:-1] + ':gzip"'
+    assert client.get(url, headers={"If-None-Match": compressed_etag}).status_code == 304
+
+    response_cache.bump_generation(station["name"])
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert changed.get_json()["temp"] == 1.0
+
+
+def test_if_modified_since(client, db):
+    station = _station_with_status(db, "7002")
+    url = f"/{station['name']}/data/status.json"
+
+    last_modified = client.get(url).headers["Last-Modified"]
+    assert client.get(url, headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}).status_code == 200
+
+
+def test_variants_get_their_own_etag(client, db):
+    station = _station_with_status(db, "7003")
+    url = f"/{station['name']}/data/wind_all.json"
+
+    as_json = client.get(url)
+    as_bin = client.get(url + "?fmt=bin")
+    assert as_json.headers["ETag"] != as_bin.headers["ETag"]
+    assert "Accept" in as_json.headers["Vary"]
+    assert client.get(url + "?fmt=bin", headers={"If-None-Match": as_json.headers["ETag"]}).status_code == 200
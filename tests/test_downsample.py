@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+import pytest
+
+import downsample
+
+
+def _reference_lttb(x, y, threshold):
+    """ The textbook Largest-Triangle-Three-Buckets, one point at a time """
+    n = len(y)
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start, avg_end = int(math.floor((i + 1) * every)) + 1, min(int(math.floor((i + 2) * every)) + 1, n)
+        if i == threshold - 3:
+            avg_start, avg_end = n - 1, n
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+
+        start, end = int(math.floor(i * every)) + 1, int(math.floor((i + 1) * every)) + 1
+        areas = [abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])) for j in range(start, end)]
+        a = start + areas.index(max(areas))
+        kept.append(a)
+    return kept + [n - 1]
+
+
+@pytest.mark.parametrize("n, max_points", [(1000, 100), (1001, 37), (250, 249), (50, 3)])
+def test_lttb_matches_the_reference(n, max_points):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.integers(1000, 60_000, n)).astype(float)
+    y = np.cumsum(rng.normal(size=n))
+
+    indices = downsample.lttb_indices(x, y.tolist(), max_points)
+    assert indices.tolist() == _reference_lttb(x.tolist(), y.tolist(), max_points)
+
+
+def test_lttb_keeps_the_peak_and_skips_missing_values():
+    x = np.arange(1000) * 60_000
+    y = [20.0] * 1000
+    y[500] = 35.0
+    missing = set(range(200, 300, 2)) | {400}
+    for i in missing:
+        y[i] = None if i != 400 else "nan"
+
+    indices = downsample.lttb_indices(x, y, 50).tolist()
+    assert len(indices) <= 50 and indices[0] == 0 and indices[-1] == 999
+    assert 500 in indices
+    assert not missing & set(indices)
+
+
+def test_short_series_are_left_alone():
+    assert downsample.lttb_indices([1, 2, 3], [1, 2, 3], 10).tolist() == [0, 1, 2]
+    assert downsample.lttb_indices([1, 2, 3], [1, 2, 3], None).tolist() == [0, 1, 2]
+    assert downsample.pick(["a", "b"], np.arange(2)) == ["a", "b"]
+
+
+def test_min_max_keeps_the_gusts():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 10, 5000)
+    values[1234], values[4321] = 25.0, -1.0
+    indices = downsample.min_max_indices(values, 200)
+    assert len(indices) <= 200
+    assert {1234, 4321} <= set(indices.tolist())
+    assert downsample.stride_indices(5000, 200).tolist()[::199] == [0, 4999]
+
+
+def test_max_points_of_a_route(client, db):
+    from datetime import datetime, timedelta, timezone
+
+    station = db.get_or_create_station("9001")
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    db.db.statuses.insert_many([
+        {"station_name": station["name"], "timestamp": now - timedelta(minutes=i), "temp": float(i % 17), "hum": 50}
+        for i in range(300)
+    ])
+    url = f"/{station['name']}/data/temp.json"
+
+    assert len(client.get(url).get_json()) == 300
+    assert len(client.get(url + "?max_points=40").get_json()) <= 40
+    assert client.get(url + "?max_points=2").status_code == 400
+    assert client.get(url + "?max_points=many").status_code == 400
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+
+def _line(errors="", ver="v4"):
+    return f"ver={ver};temp=1.5;hum=60;errors={errors};len=1;avg=1;dir=0;logFirst=100;logLast=100;"
+
+
+def test_error_events_sum_a_repeated_code(db):
+    station = db.get_or_create_station("4001")
+    db.save_received_data(_line("20:3,5:1,20:2"), station, datetime.now(db.TZ))
+
+    events = {e["code"]: e["count"] for e in db.db.error_events.find({"station_name": station["name"]})}
+    assert events == {20: 5, 5: 1}
+
+
+def test_errors_list_like_before_the_error_events(db):
+    station = db.get_or_create_station("4002")
+    start = datetime.now(db.TZ).replace(microsecond=0) - timedelta(hours=3)
+    lines = [_line("7:1"), _line(), _line("20:3,5:1,20:2"), _line("9:4", ver="v2")]
+    for i, line in enumerate(lines):
+        db.save_received_data(line, station, start + timedelta(minutes=10 * i))
+
+    # the first upload of the window isn't listed and the codes have the v4 names
+    errors = db.get_errors(station["name"], duration_hours=4)
+    assert [(db._timestamp_ms(e["timestamp"]), e["dur_minutes"]) for e in errors] == [
+        (db._timestamp_ms(start + timedelta(minutes=20)), 10.0),
+        (db._timestamp_ms(start + timedelta(minutes=30)), 10.0),
+    ]
+    assert [e["parsed_errors"] for e in errors] == [
+        [{"code": 20, "count": 5, "name": db.ERROR_CODE_MAP_V4.get(20, "UNKNOWN")},
+         {"code": 5, "count": 1, "name": db.ERROR_CODE_MAP_V4.get(5, "UNKNOWN")}],
+        [{"code": 9, "count": 4, "name": db.ERROR_CODE_MAP_V4.get(9, "UNKNOWN")}],
+    ]
+    assert db.db.error_events.find_one({"code": 9})["name"] == db.ERROR_CODE_MAP_V2.get(9, "UNKNOWN")
+
+
+def test_backfill_saves_the_same_events(db):
+    station = db.get_or_create_station("4003")
+    start = datetime.now(db.TZ).replace(microsecond=0) - timedelta(hours=3)
+    for i, errors in enumerate(["7:1", "", "20:3,20:2"]):
+        db.save_received_data(_line(errors), station, start + timedelta(minutes=10 * i))
+    ingested = list(db.db.error_events.find({}, {"_id": 0}).sort([("timestamp", 1), ("code", 1)]))
+
+    db.db.error_events.delete_many({})
+    assert db.backfill_error_events(test_run=False) == len(ingested) == 2
+    assert list(db.db.error_events.find({}, {"_id": 0}).sort([("timestamp", 1), ("code", 1)])) == ingested
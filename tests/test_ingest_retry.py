@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import ingest_queue
+
+
+def _line(log_last):
+    n = 120
+    avg = ",".join(str(i % 40) for i in range(n))
+    dirs = ",".join(str((i * 7) % 360) for i in range(n))
+    return f"ver=v4;temp=1.5;hum=60;vbatIde=3.9;len={n};avg={avg};dir={dirs};logFirst={log_last - 600};logLast={log_last};"
+
+
+def _saved(db, station_name):
+    buckets = db.db.wind_bucketed.find({"station_name": station_name}, {"_id": 0, "station_name": 0, "upload_ids": 0}).sort("timestamp", 1)
+    return {
+        "statuses": db.db.statuses.count_documents({"station_name": station_name}),
+        "winds": db.db.winds.count_documents({"station_name": station_name}),
+        "dirs": db.db.dirs.count_documents({"station_name": station_name}),
+        "buckets": list(buckets),
+    }
+
+
+def test_retried_upload_is_saved_once(db, monkeypatch):
+    now = datetime.now(db.TZ).replace(microsecond=0)
+    seconds = now.hour * 3600 + now.minute * 60 + now.second
+    line = _line(seconds - 60)
+
+    clean = db.get_or_create_station("2001")
+    db.save_received_data(line, clean, now, upload_id=ObjectId())
+
+    # the first attempt fails after the status, the samples and the buckets were written
+    station = db.get_or_create_station("2002")
+    upload_id = ObjectId()
+    update_rollups = db.update_rollups
+
+    def failing_update_rollups(*args, **kwargs):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(db, "update_rollups", failing_update_rollups)
+    with pytest.raises(RuntimeError):
+        db.save_received_data(line, station, now, upload_id=upload_id)
+    monkeypatch.setattr(db, "update_rollups", update_rollups)
+
+    db.save_received_data(line, station, now, upload_id=upload_id)
+    assert _saved(db, station["name"]) == _saved(db, clean["name"])
+
+
+def test_job_with_a_renewed_lease_is_not_claimed_again(db):
+    station = db.get_or_create_station("2003")
+    received_at = datetime.now(db.TZ) - timedelta(minutes=30)
+    ingest_queue.enqueue("ver=v4;", station, received_at)
+    partitions = [ingest_queue.station_partition(station["name"])]
+
+    job = ingest_queue.claim(partitions)
+    assert job is not None
+    stale = datetime.now(db.TZ) - timedelta(minutes=ingest_queue.INGEST_STALE_MINUTES + 1)
+    db.db.ingest_queue.update_one({"_id": job["_id"]}, {"$set": {"claimed_at": stale}})
+
+    assert ingest_queue.renew(job)
+    assert ingest_queue.claim(partitions) is None
+
+    db.db.ingest_queue.update_one({"_id": job["_id"]}, {"$set": {"heartbeat_at": stale}})
+    reclaimed = ingest_queue.claim(partitions)
+    assert reclaimed is not None and reclaimed["lease"] != job["lease"]
+    assert not ingest_queue.renew(job)
+
+    ingest_queue.complete(job)
+    assert db.db.ingest_queue.count_documents({}) == 1
+    ingest_queue.complete(reclaimed)
+    assert db.db.ingest_queue.count_documents({}) == 0
@@ -0,0 +1,60 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import orjson
+
+import json_provider
+
+# the timestamps as the routes wrote them before the orjson provider: isoformat() in Europe/Berlin
+BASELINE_FORMAT = re.compile(r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{6})?\+0[12]:00$")
+
+
+def _baseline(timestamp):
+    return timestamp.replace(tzinfo=timezone.utc).astimezone(json_provider.TZ).isoformat()
+
+
+def test_status_route_writes_the_baseline_timestamps(client, db):
+    winter = datetime(2025, 1, 10, 12, 30)
+    summer = datetime(2025, 7, 10, 12, 30, 0, 250000)
+    db.db.statuses.insert_many([
+        {"station_name": "ST1", "timestamp": winter, "temp": 1.5},
+        {"station_name": "ST1", "timestamp": summer, "temp": 20.5},
+    ])
+
+    statuses = client.get("/ST1/data/status_multi.json?n=2").get_json()
+
+    timestamps = [status["timestamp"] for status in statuses]
+    assert timestamps == [_baseline(summer), _baseline(winter)]
+    assert timestamps == ["2025-07-10T14:30:00.250000+02:00", "2025-01-10T13:30:00+01:00"]
+    assert all(BASELINE_FORMAT.match(timestamp) for timestamp in timestamps)
+
+
+def test_one_format_per_response(client, db):
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    station = db.get_or_create_station("3101")
+    db.db.statuses.insert_many([
+        {"station_name": station["name"], "timestamp": now - timedelta(minutes=m), "temp": 2.0, "hum": 60}
+        for m in (1, 30)
+    ])
+
+    temps = client.get(f"/{station['name']}/data/temp.json").get_json()
+    assert len(temps) == 2
+    assert all(BASELINE_FORMAT.match(t["timestamp"]) for t in temps)
+
+    # the helpers return the datetimes, the provider writes them like the rows above
+    last = orjson.loads(json_provider.dumps_bytes(db.get_last_temp(station["name"])))
+    assert last["timestamp"] == _baseline(now - timedelta(minutes=1))
+
+
+def test_aware_and_naive_datetimes_and_numpy():
+    naive = datetime(2025, 3, 10, 20, 0)
+    aware = naive.replace(tzinfo=timezone.utc)
+    data = orjson.loads(json_provider.dumps_bytes({
+        "naive": naive, "aware": aware, "day": naive.date(),
+        "array": np.array([1.5, 2.5]), "scalar": np.int64(3),
+    }))
+    assert data == {
+        "naive": "2025-03-10T21:00:00+01:00", "aware": "2025-03-10T21:00:00+01:00", "day": "2025-03-10",
+        "array": [1.5, 2.5], "scalar": 3,
+    }
@@ -0,0 +1,87 @@
+import warnings
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+import payload_parser
+
+
+def _decoded(value):
+    malformed = payload_parser.Counter()
+    array = payload_parser.decode_array(value, malformed)
+    return np.ma.filled(array, -1).tolist(), np.ma.getmaskarray(array).tolist(), dict(malformed)
+
+
+def test_decode_array():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert _decoded("12,-1, 5") == ([12, -1, 5], [False, True, False], {})
+        assert _decoded("1,x,3") == ([1, -1, 3], [False, True, False], {"bad_array_item": 1})
+        assert _decoded("1,,3,") == ([1, -1, 3, -1], [False, True, False, True], {"bad_array_item": 2})
+        assert _decoded("1.5,99999999999999999999,²") == ([-1, -1, -1], [True, True, True], {"bad_array_item": 3})
+
+
+def test_malformed_parts_are_counted():
+    payload = payload_parser.parse_payload("ver=v4;temp=1.5;hum=nan;broken;a=b=c;len=;avg=3,-1,x;dir=0,45,90;")
+    assert payload.fields["temp"] == 1.5 and payload.raw["hum"] == "nan"
+    assert payload.array_list("avg") == [3, None, None]
+    assert payload.array_list("dir") == [0, 45, 90]
+    assert dict(payload.malformed) == {
+        "missing_equals": 1, "too_many_equals": 1, "empty_value": 1, "bad_array_item": 1, "bad_value:hum": 1,
+    }
+    assert payload_parser.malformed_summary(payload) == "bad_array_item: 1, bad_value:hum: 1, empty_value: 1, missing_equals: 1, too_many_equals: 1"
+
+
+def test_warnings_filters_are_left_alone():
+    assert not any("could not be read to its end" in str(f[1]) for f in warnings.filters if f[1] is not None)
+
+
+TZ = ZoneInfo("Europe/Berlin")
+
+
+def _generated_times_ms(received_at, log_first, log_last, length):
+    """ The sample times as the removed db.generate_times made them, for an upload of one day """
+    day_start = datetime.combine(received_at.date(), time(0, 0, 0, tzinfo=received_at.tzinfo))
+    step = (log_last - log_first) / (length - 1) if length > 1 else 0
+    return [int((day_start + timedelta(seconds=round(log_first + i * step))).timestamp() * 1000) for i in range(length)]
+
+
+def test_sample_times_match_the_generated_times():
+    received_at = datetime(2025, 3, 10, 12, 0, 5, tzinfo=TZ)
+    for log_first, log_last, length in [(36000, 36597, 120), (36000, 36001, 7), (43000, 43000, 1), (0, 100, 3)]:
+        times = payload_parser.sample_times_ms(received_at, log_first, log_last, length)
+        assert times.dtype == np.int64
+        assert times.tolist() == _generated_times_ms(received_at, log_first, log_last, length)
+
+    assert payload_parser.sample_times_ms(received_at, 36000, 36100, 0).tolist() == []
+
+
+def test_sample_times_over_midnight():
+    received_at = datetime(2025, 3, 10, 0, 5, tzinfo=TZ)
+    midnight_ms = int(datetime(2025, 3, 10, tzinfo=TZ).timestamp() * 1000)
+
+    # logged over midnight, the first sample is on the day before
+    times = payload_parser.sample_times_ms(received_at, 86400 - 10, 10, 3)
+    assert (times - midnight_ms).tolist() == [-10_000, 0, 10_000]
+
+    # logged before midnight and received after it
+    times = payload_parser.sample_times_ms(received_at, 86400 - 60, 86400 - 20, 2)
+    assert (times - midnight_ms).tolist() == [-60_000, -20_000]
+
+    # a clock a few minutes ahead is still the same day
+    times = payload_parser.sample_times_ms(received_at, 5 * 60 + 30, 5 * 60 + 30, 1)
+    assert (times - midnight_ms).tolist() == [330_000]
+
+
+def test_ingest_saves_the_sample_times(db):
+    station = db.get_or_create_station("3401")
+    received_at = datetime(2025, 3, 10, 12, 0, 5, tzinfo=TZ)
+    log_first, log_last = 43000, 43050
+    db.save_received_data(f"ver=v4;len=6;avg=1,2,3,4,5,6;dir=0,45,90,135,180,225;logFirst={log_first};logLast={log_last};",
+                          station, received_at)
+
+    expected = payload_parser.sample_times_ms(received_at, log_first, log_last, 6)
+    t_ms, values = db.find_raw_arrays("winds", station["name"], received_at - timedelta(hours=1), received_at)
+    assert t_ms[::-1].tolist() == expected.tolist()
+    assert values[::-1].tolist() == [1, 2, 3, 4, 5, 6]
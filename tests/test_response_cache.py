@@ -0,0 +1,51 @@
+import os
+
+import response_cache
+
+
+def test_full_station_cache_keeps_caching(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "CACHE_DIR", str(tmp_path) + "/")
+    monkeypatch.setattr(response_cache, "MAX_ENTRIES_PER_STATION", 8)
+    response_cache.bump_generation("station")
+    old_generation = response_cache.get_generation("station")
+    for i in range(5):
+        response_cache.set("station", ("old", i), old_generation, 0, b"old")
+
+    response_cache.bump_generation("station")
+    generation = response_cache.get_generation("station")
+    for i in range(20):
+        response_cache.set("station", ("new", i), generation, 0, b"new")
+        assert response_cache.get("station", ("new", i), generation, 0) == (b"new", "application/json")
+
+    entries = [name for name in os.listdir(tmp_path / "station") if response_cache.ENTRY_NAME.match(name)]
+    assert len(entries) <= 9
+    assert all(response_cache.get("station", ("old", i), old_generation, 0) is None for i in range(5))
+
+
+def test_cached_until_new_data_of_the_station(client, db):
+    from datetime import datetime, timedelta, timezone
+
+    station = db.get_or_create_station("6001")
+    other = db.get_or_create_station("6002")
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    db.db.statuses.insert_one({"station_name": station["name"], "timestamp": now - timedelta(minutes=5), "temp": 1.0})
+
+    url = f"/{station['name']}/data/status.json"
+    assert client.get(url).get_json()["temp"] == 1.0
+
+    # written behind the cache's back: the cached response is served
+    db.db.statuses.insert_one({"station_name": station["name"], "timestamp": now, "temp": 2.0})
+    assert client.get(url).get_json()["temp"] == 1.0
+
+    # new data of another station doesn't invalidate it
+    response_cache.bump_generation(other["name"])
+    assert client.get(url).get_json()["temp"] == 1.0
+
+    # an upload of the station does
+    db.save_received_data("ver=v4;temp=3.0;hum=50;", station, datetime.now(db.TZ))
+    assert client.get(url).get_json()["temp"] == 3.0
+
+
+def test_unknown_station_is_not_cached(client, db):
+    assert client.get("/nobody/data/status.json").get_json() == {}
+    assert not os.path.exists(os.path.join(response_cache.CACHE_DIR, "nobody"))
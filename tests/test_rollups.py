@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import bucketing
+
+
+def _legacy_buckets(db, station_name, end, count):
+    """ 15 minute buckets as saved before the running states, newest at end, no raw samples left """
+    buckets = []
+    for i in range(count):
+        key_ms = bucketing.bucket_key_ms(db._timestamp_ms(end - timedelta(minutes=15 * i)))
+        buckets.append({
+            "station_name": station_name,
+            "timestamp": db._ms_to_datetime(key_ms),
+            "avg_rpm": 10 + i % 4,
+            "max_rpm": 20 + i % 7,
+            "avg": round((10 + i % 4) * 0.1, 2),
+            "max": round((20 + i % 7) * 0.1, 2),
+            "dir": i % 3,
+        })
+    db.db.wind_bucketed.insert_many(buckets)
+    return buckets
+
+
+def test_rollups_of_stateless_buckets(db):
+    station = db.get_or_create_station("1001")
+    end = datetime.now(db.TZ) - timedelta(hours=1)
+    buckets = _legacy_buckets(db, station["name"], end, 283)
+
+    db.rebuild_rollups(station["name"], test_run=False)
+
+    hours = list(db.db.wind_bucketed_1h.find({"station_name": station["name"]}))
+    hour_keys = {bucketing.tier_key_ms(db._timestamp_ms(b["timestamp"]), 60) for b in buckets}
+    assert len(hours) == len(hour_keys)
+    assert db.db.wind_bucketed_1d.count_documents({"station_name": station["name"]}) > 0
+
+    hour = max(hours, key=lambda h: h["timestamp"])
+    children = [b for b in buckets if bucketing.tier_key_ms(db._timestamp_ms(b["timestamp"]), 60) == db._timestamp_ms(hour["timestamp"])]
+    assert hour["avg_rpm"] == round(sum(b["avg_rpm"] for b in children) / len(children), 2)
+    assert hour["max_rpm"] == max(b["max_rpm"] for b in children)
+    assert "wind_state" not in hour
+
+
+def test_tier_is_filled_from_the_15_minute_buckets(db):
+    station = db.get_or_create_station("1002")
+    end = datetime.now(db.TZ) - timedelta(hours=1)
+    _legacy_buckets(db, station["name"], end, 284)
+
+    # only the newest hour is rolled up, e.g. after the first upload with the rollups
+    db.update_rollups(station["name"], [db._timestamp_ms(end)])
+    assert db.db.wind_bucketed_1h.count_documents({"station_name": station["name"]}) == 1
+
+    winds = db.get_wind_data(station["name"], duration_hours=72)
+    assert len(winds) > 200
+    timestamps = [w["timestamp"] for w in winds]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+
+def _expected_rollup(db, children):
+    wind = bucketing.wind_state_values(bucketing.merge_wind_states([c["wind_state"] for c in children]))
+    direction = bucketing.dir_state_mode(bucketing.merge_dir_states([c["dir_state"] for c in children]))
+    return wind["avg"], wind["max"], direction
+
+
+def test_days_merged_from_hours_match_their_15_minute_buckets(db, monkeypatch):
+    station = db.get_or_create_station("1003")
+    # uploads of 10 minutes around midnight, the hour at 00:00 has buckets of both days
+    start_ms = db._timestamp_ms(datetime(2025, 3, 10, 21, 3, tzinfo=db.TZ))
+    step = np.arange(120)
+    for upload in range(30):
+        t_ms = start_ms + upload * 600_000 + step.astype(np.int64) * 5000
+        winds = np.ma.masked_array(((step * 7 + upload * 5) % 40).astype(float))
+        dirs = np.ma.masked_array(((step * 37 + upload * 90) % 360).astype(float))
+        db.update_average_values(station["name"], t_ms, winds, dirs)
+
+    children = list(db.db.wind_bucketed.find({"station_name": station["name"]}))
+    for name, minutes in db.WIND_TIERS[1:]:
+        rollups = list(db.db[name].find({"station_name": station["name"]}))
+        assert len(rollups) == len({bucketing.tier_key_ms(db._timestamp_ms(c["timestamp"]), minutes) for c in children})
+        for rollup in rollups:
+            key_ms = db._timestamp_ms(rollup["timestamp"])
+            group = [c for c in children if bucketing.tier_key_ms(db._timestamp_ms(c["timestamp"]), minutes) == key_ms]
+            assert (rollup["avg_rpm"], rollup["max_rpm"], rollup["dir"]) == _expected_rollup(db, group)
+
+
+def test_uploads_dont_read_raw_samples_of_old_buckets(db, monkeypatch):
+    station = db.get_or_create_station("1004")
+    end = datetime.now(db.TZ) - timedelta(hours=1)
+    buckets = _legacy_buckets(db, station["name"], end, 8)
+    db.db.winds.insert_many([
+        {"station_name": station["name"], "timestamp": b["timestamp"] + timedelta(seconds=s), "value": float(10 + s % 4)}
+        for b in buckets for s in range(0, 60, 5)
+    ])
+
+    def no_raw_samples(*args, **kwargs):
+        raise AssertionError("raw samples read on upload")
+
+    find_raw_samples = db.find_raw_samples
+    monkeypatch.setattr(db, "find_raw_samples", no_raw_samples)
+    db.update_rollups(station["name"], [db._timestamp_ms(end)])
+    hour = db.db.wind_bucketed_1h.find_one({"station_name": station["name"]}, sort=[("timestamp", -1)])
+    assert "wind_state" not in hour
+
+    monkeypatch.setattr(db, "find_raw_samples", find_raw_samples)
+    db.rebuild_rollups(station["name"], test_run=False)
+    assert db.db.wind_bucketed.count_documents({"station_name": station["name"], "wind_state": {"$exists": True}}) == len(buckets)
+    hour = db.db.wind_bucketed_1h.find_one({"station_name": station["name"]}, sort=[("timestamp", -1)])
+    assert hour["wind_state"]["n"] > 0
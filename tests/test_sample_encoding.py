@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+import sample_encoding
+
+
+@pytest.mark.parametrize("n_winds, n_dirs", [(0, 0), (1, 3), (5, 2), (7, 7)])
+def test_round_trip_keeps_the_arrays_aligned(n_winds, n_dirs):
+    wind_ts = 1_700_000_000_000 + np.arange(n_winds, dtype=np.int64) * 5000
+    dir_ts = 1_700_000_000_000 + np.arange(n_dirs, dtype=np.int64) * 5000
+    speeds = np.linspace(0, 12.5, n_winds)
+    dirs = np.arange(n_dirs) * 45 % 360
+
+    chunks = sample_encoding.encode_wind_samples(wind_ts, speeds, dir_ts, dirs)
+    # the browser reads every array as a typed array view, it has to start at a multiple of its item size
+    offset = 0
+    for chunk, item_size in zip(chunks, (1, 8, 8, 4, 2)):
+        assert offset % item_size == 0
+        offset += len(chunk)
+
+    decoded = sample_encoding.decode_wind_samples(b"".join(chunks))
+    assert decoded[0].tolist() == wind_ts.tolist()
+    assert decoded[1].tolist() == pytest.approx(speeds.tolist(), abs=1e-5)
+    assert decoded[2].tolist() == dir_ts.tolist()
+    assert decoded[3].tolist() == dirs.tolist()
+
+
+def test_not_wind_samples():
+    with pytest.raises(ValueError):
+        sample_encoding.decode_wind_samples(b"{}" + bytes(14))
+
+
+def test_binary_route_has_the_json_samples(client, db):
+    station = db.get_or_create_station("8001")
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    db.db.winds.insert_many([
+        {"station_name": station["name"], "timestamp": now - timedelta(seconds=5 * i), "value": float(i % 40)} for i in range(50)
+    ])
+    db.db.dirs.insert_many([
+        {"station_name": station["name"], "timestamp": now - timedelta(seconds=5 * i), "value": i * 45 % 360} for i in range(50)
+    ])
+    url = f"/{station['name']}/data/wind_all.json"
+
+    as_json = client.get(url).get_json()
+    response = client.get(url, headers={"Accept": sample_encoding.MIMETYPE})
+    assert response.mimetype == sample_encoding.MIMETYPE
+    wind_ts, speeds, dir_ts, dirs = sample_encoding.decode_wind_samples(response.data)
+    assert len(wind_ts) == len(dir_ts) == 50
+
+    def ms(timestamp):
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+    assert wind_ts.tolist() == [ms(w["timestamp"]) for w in as_json["winds"]]
+    assert speeds.tolist() == pytest.approx([w["value"] for w in as_json["winds"]], abs=0.006)
+    assert dir_ts.tolist() == [ms(d["timestamp"]) for d in as_json["dirs"]]
+    assert dirs.tolist() == [d["value"] for d in as_json["dirs"]]
+    assert client.get(url + "?fmt=bin").data == response.data
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_newest_document_of_every_station(db):
+    names = [db.get_or_create_station(imsi)["name"] for imsi in ("5001", "5002", "5003")]
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    db.db.wind_bucketed.insert_many([
+        {"station_name": name, "timestamp": now - timedelta(minutes=15 * i), "avg": float(i), "max": float(i + 1), "dir": i % 8}
+        for name in names[:2] for i in range(5)
+    ])
+    db.db.statuses.insert_one({"station_name": names[0], "timestamp": now, "temp": 3.5})
+
+    winds = db.get_last_winds_for(names)
+    assert winds[names[2]] is None
+    assert [winds[name]["avg"] for name in names[:2]] == [0.0, 0.0]
+
+    snapshots = db.refresh_station_latest_for(names)
+    assert snapshots[names[0]]["status"]["temp"] == 3.5
+    assert snapshots[names[1]]["wind"]["timestamp"] == now
+    assert "status" not in snapshots[names[1]] and snapshots[names[2]] == {}
+
+
+def test_landing_mock_generates_all_values_or_none(client, db):
+    import app as flask_app
+
+    live = flask_app._station_mock_view({"name": "s1"}, 0, {"avg": 4.26, "max": 7.0, "dir": 2})
+    assert live["live"] and (live["avg"], live["max"], live["direction_deg"]) == (4.3, 7.0, 90)
+
+    generated = flask_app._station_mock_view({"name": "s1"}, 0, None)
+    partial = flask_app._station_mock_view({"name": "s1"}, 0, {"avg": 4.26, "max": None, "dir": 2})
+    assert not partial["live"] and partial == generated
+
+    assert client.get("/landing_mock").status_code == 200
+
+
+def test_late_values_dont_replace_newer_ones(db):
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    db.set_station_latest("ST1", "status", {"timestamp": now, "temp": 2.0})
+    db.set_station_latest("ST1", "status", {"timestamp": now - timedelta(minutes=5), "temp": 1.0})
+    assert db.get_station_latest("ST1")["status"]["temp"] == 2.0
+
+    db.set_station_latest("ST1", "wind", {"timestamp": now - timedelta(minutes=5), "avg": 1.0})
+    db.set_station_latest("ST1", "status", {"timestamp": now + timedelta(minutes=5), "temp": 3.0})
+    snapshot = db.get_station_latest("ST1")
+    assert (snapshot["status"]["temp"], snapshot["wind"]["avg"]) == (3.0, 1.0)
+
+
+def test_ingest_keeps_the_snapshot_current(db):
+    station = db.get_or_create_station("5101")
+    received_at = datetime.now(db.TZ).replace(microsecond=0)
+    seconds = received_at.hour * 3600 + received_at.minute * 60 + received_at.second
+    db.save_received_data(f"ver=v4;temp=4.5;hum=70;len=2;avg=10,12;dir=90,90;logFirst={max(seconds - 10, 0)};logLast={seconds};",
+                          station, received_at)
+
+    snapshot = db.get_station_latest(station["name"])
+    assert snapshot["status"]["temp"] == 4.5
+    assert snapshot["wind"]["dir"] == 2
+    assert db.get_last_temp(station["name"])["temp"] == 4.5
+
+
+def test_station_list_rebuilds_missing_snapshots(db):
+    names = [db.get_or_create_station(imsi)["name"] for imsi in ("5201", "5202")]
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    db.db.statuses.insert_one({"station_name": names[0], "timestamp": now, "temp": 1.5, "hum": 80})
+    db.db.wind_bucketed.insert_one({"station_name": names[0], "timestamp": now, "avg": 2.0, "max": 3.0, "avg_rpm": 20, "max_rpm": 30, "dir": 4})
+
+    rows = db.get_station_list_data(db.get_stations())
+    assert db.db.station_latest.count_documents({}) == 2
+
+    by_name = {row["station"]["name"]: row for row in rows}
+    assert by_name[names[0]]["statusData"] == db.get_last_status(names[0])
+    assert by_name[names[0]]["windData"] == db.get_last_wind(names[0])
+    assert by_name[names[0]]["tempData"] == db.get_last_temp(names[0])
+    assert (by_name[names[1]]["statusData"], by_name[names[1]]["windData"], by_name[names[1]]["prefsData"]) == (None, None, {})
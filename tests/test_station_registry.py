@@ -0,0 +1,62 @@
+import station_registry
+from station_registry import StationRegistry
+
+
+class _Loader:
+    def __init__(self, stations):
+        self.stations = stations
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [dict(s) for s in self.stations]
+
+
+def test_lookups_are_served_from_one_load_until_the_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(station_registry.time, "monotonic", lambda: now[0])
+    loader = _Loader([{"imsi": "1", "name": "a"}, {"imsi": "2", "name": "b"}])
+    registry = StationRegistry(loader, ttl_seconds=60)
+
+    assert registry.get_by_imsi("1")["name"] == "a"
+    assert registry.get_by_name("b")["imsi"] == "2"
+    assert [s["name"] for s in registry.all()] == ["a", "b"]
+    assert loader.calls == 1
+
+    loader.stations[0]["name"] = "renamed"
+    now[0] += 59
+    assert registry.get_by_imsi("1")["name"] == "a"
+    now[0] += 1
+    assert registry.get_by_imsi("1")["name"] == "renamed"
+    assert registry.get_by_name("a") is None
+    assert loader.calls == 2
+
+
+def test_invalidate_and_put():
+    loader = _Loader([{"imsi": "1", "name": "a"}])
+    registry = StationRegistry(loader, ttl_seconds=60)
+
+    registry.put({"imsi": "2", "name": "b"})
+    registry.put({"imsi": "1", "name": "a", "active": False})
+    assert registry.get_by_name("b")["imsi"] == "2"
+    assert [s for s in registry.all() if s["imsi"] == "1"] == [{"imsi": "1", "name": "a", "active": False}]
+    assert loader.calls == 1
+
+    registry.invalidate()
+    assert registry.get_by_name("b") is None
+    assert loader.calls == 2
+
+
+def test_callers_get_copies():
+    registry = StationRegistry(_Loader([{"imsi": "1", "name": "a"}]))
+    registry.get_by_imsi("1")["name"] = "changed"
+    registry.all()[0]["name"] = "changed"
+    assert registry.get_by_imsi("1")["name"] == "a"
+
+
+def test_add_station_is_seen_by_the_next_lookup(db):
+    station = db.get_or_create_station("3301")
+    assert db.get_station_with_imsi("3301")["name"] == station["name"] == "unnamed_3301"
+
+    db.add_station({"imsi": "3301", "name": station["name"], "rpm_to_ms": 0.5})
+    assert db.get_station_speed_to_rpm(station["name"]) == 0.5
@@ -0,0 +1,44 @@
+import json
+from datetime import datetime, timedelta
+
+
+def _station_with_statuses(db, imsi, count):
+    station = db.get_or_create_station(imsi)
+    start = datetime(2025, 3, 10, 0, 0)  # naive UTC, 01:00 in Berlin
+    db.db.statuses.insert_many([
+        {"station_name": station["name"], "timestamp": start + timedelta(minutes=i), "seq": i, "temp": 1.5, "hum": 60}
+        for i in reversed(range(count))
+    ])
+    return station
+
+
+def test_export_streams_every_status_in_batches(client, db):
+    station = _station_with_statuses(db, "9201", 1203)
+
+    response = client.get(f"/{station['name']}/data/status_export.ndjson")
+    assert response.mimetype == "application/x-ndjson"
+    assert "attachment" in response.headers["Content-Disposition"]
+
+    chunks = list(response.response)
+    assert [chunk.count(b"\n") for chunk in chunks] == [500, 500, 203]
+    lines = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert [line["seq"] for line in lines] == list(range(1203))
+    assert lines[0] == {"timestamp": "2025-03-10T01:00:00+01:00", "seq": 0, "temp": 1.5, "hum": 60}
+
+
+def test_export_range_and_fields(client, db):
+    station = _station_with_statuses(db, "9202", 120)
+    url = f"/{station['name']}/data/status_export.ndjson"
+
+    # from / to without a timezone are in Europe/Berlin, to is excluded
+    lines = client.get(f"{url}?from=2025-03-10T01:10&to=2025-03-10T01:20&fields=seq").data.decode().splitlines()
+    assert [json.loads(line) for line in lines][:2] == [
+        {"timestamp": "2025-03-10T01:10:00+01:00", "seq": 10},
+        {"timestamp": "2025-03-10T01:11:00+01:00", "seq": 11},
+    ]
+    assert len(lines) == 10
+
+    assert client.get(f"{url}?from=2025-03-10T03:00:00%2B02:00&fields=seq").data.decode().count("\n") == 120 - 60
+    assert client.get(f"{url}?from=yesterday").status_code == 400
+    assert client.get(f"{url}?fields=temp,$where").status_code == 400
+    assert client.get("/nobody/data/status_export.ndjson").status_code == 404
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_drop_status_key_indexes(db):
+    db.ensure_indexes()
+    db.db.statuses.create_index(
+        [("station_name", 1),("timestamp", -1),("vbatIde", 1)],
+        partialFilterExpression={"vbatIde": {"$exists": True}},
+        name="status_vbatIde",
+    )
+    before = {index["name"] for index in db.db.statuses.list_indexes()}
+
+    assert db.drop_status_key_indexes(test_run=True) == 1
+    assert {index["name"] for index in db.db.statuses.list_indexes()} == before
+
+    assert db.drop_status_key_indexes(test_run=False) == 1
+    assert {index["name"] for index in db.db.statuses.list_indexes()} == before - {"status_vbatIde"}
+    # the station and time range of get_status_values stay indexed
+    assert any(list(index["key"].keys())[:2] == ["station_name", "timestamp"] for index in db.db.statuses.list_indexes())
+
+
+def _statuses(station_name, now):
+    return [
+        {"station_name": station_name, "timestamp": now - timedelta(hours=30), "vsol": 4.1, "old_key": 1},
+        {"station_name": station_name, "timestamp": now - timedelta(hours=2), "vsol": 4.5, "signal": 20},
+        {"station_name": station_name, "timestamp": now - timedelta(hours=1), "vsol": 4.7, "signal": 21, "a.b": 1},
+    ]
+
+
+def test_catalog_of_the_saved_statuses(db):
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    statuses = _statuses("ST1", now)
+    # saved out of order, first and last are still the oldest and the newest
+    for status in (statuses[1], statuses[0], statuses[2]):
+        db.update_status_fields("ST1", status.keys(), status["timestamp"])
+
+    fields = db.get_status_fields("ST1")
+    assert sorted(fields) == ["old_key", "signal", "vsol"]
+    assert fields["vsol"] == {"first": statuses[0]["timestamp"], "last": statuses[2]["timestamp"]}
+    assert fields["signal"] == {"first": statuses[1]["timestamp"], "last": statuses[2]["timestamp"]}
+    assert db.get_status_fields("ST2") is None
+
+
+def test_status_values_use_the_catalog(client, db, monkeypatch):
+    station = db.get_or_create_station("9101")
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    statuses = _statuses(station["name"], now)
+    db.db.statuses.insert_many([dict(s) for s in statuses])
+    for status in statuses:
+        db.update_status_fields(station["name"], status.keys(), status["timestamp"])
+
+    url = f"/{station['name']}/data/status"
+    assert [v["value"] for v in client.get(f"{url}/vsol.json").get_json()] == [4.7, 4.5]
+    assert client.get(f"{url}/nope.json").status_code == 404
+
+    # a key last sent before the range is answered from the catalog
+    monkeypatch.setattr(db.db, "statuses", None)
+    assert client.get(f"{url}/old_key.json?duration=6").get_json() == []
+
+
+def test_station_without_a_catalog(db):
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    db.db.statuses.insert_many(_statuses("ST1", now))
+    assert [v["value"] for v in db.get_status_values("ST1", "signal")] == [21, 20]
+    assert db.get_status_values("ST1", "nope") is None
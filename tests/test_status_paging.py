@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+def test_pages_keep_statuses_of_the_same_timestamp(db):
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=123000)
+    times = [now, now, now, now - timedelta(minutes=10), now - timedelta(minutes=10)]
+    db.db.statuses.insert_many([
+        {"station_name": "ST1", "timestamp": timestamp, "seq": i} for i, timestamp in enumerate(times)
+    ])
+
+    seen, before = [], None
+    while True:
+        page = db.get_last_statuses("ST1", n=2, before=before)
+        if not page:
+            break
+        assert all("_id" not in status for status in page)
+        seen += [status["seq"] for status in page]
+        before = page[-1]["cursor"]
+
+    assert sorted(seen) == list(range(len(times)))
+    assert seen == [status["seq"] for status in db.get_last_statuses("ST1", n=len(times))]
+
+
+def test_invalid_cursor(db):
+    for token in ("2024-05-01T10:00:00", "", "bm90OmFuOmlk"):
+        with pytest.raises(ValueError):
+            db.decode_status_cursor(token)
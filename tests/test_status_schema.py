@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+
+import payload_parser
+import status_schema
+
+
+def test_parser_uses_the_status_schema():
+    assert payload_parser.FIELD_TYPES is status_schema.DEFAULT_SCHEMA
+    payload = payload_parser.parse_payload("ver=v2.0;hum_out=83;temp_out=2.5;len=1;logFirst=1;logLast=2;")
+    assert payload.fields["hum_out"] == 83 and isinstance(payload.fields["hum_out"], int)
+    assert payload.fields["temp_out"] == 2.5
+
+
+def test_ingest_and_backfill_save_the_same_types(db):
+    station = db.get_or_create_station("3001")
+    line = "ver=v2.0;temp_out=2.5;hum_out=83;temp_in=20.5;hum_in=40;vbatIde=3.9;signal=20;len=1;avg=1;dir=0;logFirst=100;logLast=100;"
+    db.save_received_data(line, station, datetime.now(db.TZ))
+    ingested = db.db.statuses.find_one({"station_name": station["name"]}, {"_id": 0, "timestamp": 0})
+
+    # the same status as saved before the fields were typed
+    legacy = {k: v for k, v in payload_parser.parse_payload(line).raw.items()}
+    legacy.update({"temp": legacy["temp_out"], "hum": legacy["hum_out"], "station_name": "legacy",
+                   "timestamp": datetime.now(timezone.utc) - timedelta(minutes=1)})
+    db.db.statuses.insert_one(legacy)
+    db.backfill_typed_statuses(test_run=False)
+    backfilled = db.db.statuses.find_one({"station_name": "legacy"}, {"_id": 0, "timestamp": 0})
+
+    for key, value in ingested.items():
+        if key in status_schema.DEFAULT_SCHEMA and key in legacy:
+            assert (backfilled[key], type(backfilled[key])) == (value, type(value)), key
+
+
+def test_humidity_stays_an_integer(client, db):
+    station = db.get_or_create_station("3002")
+    db.save_received_data("ver=v4;temp=1.5;hum=60;len=1;avg=1;dir=0;logFirst=100;logLast=100;", station, datetime.now(db.TZ))
+    db.db.statuses.insert_one({"station_name": station["name"], "temp": "2.0", "hum": "61",
+                               "timestamp": datetime.now(timezone.utc) - timedelta(minutes=5)})
+
+    temps = client.get(f"/{station['name']}/data/temp.json").get_json()
+    assert sorted((t["hum"], type(t["hum"])) for t in temps) == [(60, int), (61, int)]
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+
+@pytest.fixture
+def plain_winds(db, monkeypatch):
+    # mongomock has no time-series collections, a plain one stands in for it
+    monkeypatch.setattr(db, "create_timeseries_collection", lambda name: db.db.create_collection(name))
+    monkeypatch.setattr(db, "is_timeseries_collection", lambda name: name == "winds" and "winds_plain" in db.db.list_collection_names())
+    db.db.winds.drop()
+    db.db.winds_plain.drop()
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    docs = [
+        {"_id": ObjectId.from_datetime(start + timedelta(seconds=i)), "station_name": "s", "timestamp": start + timedelta(seconds=i), "value": i}
+        for i in range(25)
+    ]
+    db.db.winds.insert_many(docs)
+    return docs
+
+
+def test_interrupted_migration_copies_every_document_once(db, plain_winds, monkeypatch):
+    insert_many = type(db.db.winds).insert_many
+    calls = []
+
+    def failing_insert_many(self, docs, *args, **kwargs):
+        calls.append(len(docs))
+        insert_many(self, docs, *args, **kwargs)
+        if len(calls) == 2:
+            raise RuntimeError("killed before the progress was saved")
+
+    monkeypatch.setattr(type(db.db.winds), "insert_many", failing_insert_many)
+    with pytest.raises(RuntimeError):
+        db.migrate_to_timeseries("winds", batch_size=10, test_run=False)
+    monkeypatch.setattr(type(db.db.winds), "insert_many", insert_many)
+
+    db.migrate_to_timeseries("winds", batch_size=10, test_run=False)
+    ids = [doc["_id"] for doc in db.db.winds.find({}, {"_id": 1})]
+    assert sorted(ids) == [doc["_id"] for doc in plain_winds]
+
+
+def test_migration_refuses_a_collection_being_written(db, plain_winds):
+    db.db.winds.insert_one({"station_name": "s", "timestamp": datetime.now(timezone.utc), "value": 1})
+    with pytest.raises(ValueError):
+        db.migrate_to_timeseries("winds", test_run=False)
+    assert "winds_plain" not in db.db.list_collection_names()
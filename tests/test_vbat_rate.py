@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+import vbat_rate
+
+MINUTE_MS = 60_000
+
+
+def _series(seed, n=400):
+    """ statuses every 5-15 minutes with two gaps longer than the window and a few without vbatIde """
+    rng = np.random.default_rng(seed)
+    steps = rng.integers(5, 16, n) * MINUTE_MS
+    steps[n // 4] = 3 * 3600 * 1000
+    steps[n * 5 // 8] = vbat_rate.WINDOW_MS + MINUTE_MS
+    t_ms = 1_740_000_000_000 + np.cumsum(steps)
+    values = 3.9 + np.cumsum(rng.normal(0, 0.003, n))
+    values[rng.choice(n, 20, replace=False)] = np.nan
+    return t_ms, values
+
+
+def _reference(t_ms, values, i):
+    """ polyfit of the values in the window of status i, in mV/h """
+    window = (t_ms >= t_ms[i] - vbat_rate.WINDOW_MS) & (t_ms <= t_ms[i]) & ~np.isnan(values)
+    if np.isnan(values[i]) or window.sum() < 2:
+        return None
+    return np.polyfit(t_ms[window] / 3600_000, values[window], 1)[0] * 1000
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_running_slope_across_gaps(seed):
+    t_ms, values = _series(seed)
+    values[[100, 250]] = 3.9
+    window = vbat_rate.RunningSlope()
+    rates = []
+    for i, (t, v) in enumerate(zip(t_ms.tolist(), values.tolist())):
+        rates.append(window.add(t, None if np.isnan(v) else v))
+        expected = _reference(t_ms, values, i)
+        if expected is None:
+            assert rates[-1] is None, i
+        else:
+            assert rates[-1] == pytest.approx(expected, abs=1e-6), i
+
+    # the first statuses after a gap longer than the window have no older points to compare to
+    assert rates[100] is None and rates[250] is None
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rolling_slopes_match_the_running_slope(seed):
+    t_ms, values = _series(seed)
+    window = vbat_rate.RunningSlope()
+    running = [window.add(t, None if np.isnan(v) else v) for t, v in zip(t_ms.tolist(), values.tolist())]
+    rolling = vbat_rate.rolling_slopes(t_ms, values)
+
+    assert [r is None for r in running] == np.isnan(rolling).tolist()
+    assert [r for r in running if r is not None] == pytest.approx(rolling[~np.isnan(rolling)].tolist(), abs=1e-6)
+
+
+def test_long_running_window_stays_exact():
+    # a month of statuses every 5 minutes, the sums are rebased on the way
+    t_ms = 1_740_000_000_000 + np.arange(9000, dtype=np.int64) * 5 * MINUTE_MS
+    values = 3.7 + 0.002 * np.sin(np.arange(9000) / 50)
+    window = vbat_rate.RunningSlope()
+    for t, v in zip(t_ms.tolist(), values.tolist()):
+        rate = window.add(t, v)
+    assert rate == pytest.approx(_reference(t_ms, values, len(t_ms) - 1), abs=1e-6)
+
+
+def test_ingest_and_backfill_save_the_same_rates(db):
+    station = db.get_or_create_station("9301")
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=1)
+    t_ms, values = _series(7, n=60)
+    for t, v in zip(t_ms.tolist(), values.tolist()):
+        timestamp = start + timedelta(milliseconds=t - int(t_ms[0]))
+        status = {"station_name": station["name"], "timestamp": timestamp}
+        if not np.isnan(v):
+            status["vbatIde"] = round(v, 3)
+        db.calc_vbat_change_rate(status, station["name"])
+        db.db.statuses.insert_one(status)
+        db.set_station_latest(station["name"], "status", status)
+
+    ingested = {s["_id"]: s.get("vbat_rate") for s in db.db.statuses.find({"vbatIde": {"$exists": True}})}
+    assert any(rate is not None for rate in ingested.values())
+
+    db.db.statuses.update_many({}, {"$unset": {"vbat_rate": ""}})
+    assert db.backfill_vbat_rates(batch_size=7, test_run=False) == len(ingested)
+    backfilled = {s["_id"]: s.get("vbat_rate") for s in db.db.statuses.find({"vbatIde": {"$exists": True}})}
+    assert backfilled.keys() == ingested.keys()
+    for _id, rate in ingested.items():
+        assert backfilled[_id] == (pytest.approx(rate, abs=0.011) if rate is not None else None)
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+
+
+def _bucketed(values):
+    start = datetime(2025, 5, 1, 10, 0)
+    return [{"timestamp": start + timedelta(minutes=15 * i), "avg": value} for i, value in enumerate(values)]
+
+
+def test_rewriting_the_same_buckets_is_idempotent(db):
+    first = db.write_buckets(db.db.wind_bucketed, "ST1", _bucketed([1.0, 2.0, 3.0]))
+    again = db.write_buckets(db.db.wind_bucketed, "ST1", _bucketed([1.0, 2.0, 3.0]))
+    changed = db.write_buckets(db.db.wind_bucketed, "ST1", _bucketed([1.0, 2.5]))
+
+    assert first == {"inserted": 3, "modified": 0, "unchanged": 0, "conflicts": []}
+    assert again == {"inserted": 0, "modified": 0, "unchanged": 3, "conflicts": []}
+    assert changed == {"inserted": 0, "modified": 1, "unchanged": 1, "conflicts": []}
+    assert [b["avg"] for b in db.db.wind_bucketed.find({"station_name": "ST1"}).sort("timestamp", 1)] == [1.0, 2.5, 3.0]
+
+    props = db.db.bucket_props.find_one({"_id": "ST1"})
+    assert props["bucket_writes"] == {"inserted": 3, "modified": 1, "unchanged": 4}
+
+
+def test_unset_fields(db):
+    db.db.wind_bucketed.insert_one({"station_name": "ST1", "timestamp": datetime(2025, 5, 1, 10, 0), "avg": 1.0, "wind_state": {"n": 1}})
+    db.write_buckets(db.db.wind_bucketed, "ST1", _bucketed([1.0]), unset_fields=("wind_state",))
+    assert "wind_state" not in db.db.wind_bucketed.find_one({"station_name": "ST1"})
+
+
+def test_no_buckets_no_write(db):
+    assert db.write_buckets(db.db.wind_bucketed, "ST1", []) == {"inserted": 0, "modified": 0, "unchanged": 0, "conflicts": []}
+    assert db.db.bucket_props.count_documents({}) == 0